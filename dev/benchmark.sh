@@ -0,0 +1,4 @@
+#!/bin/bash
+
+source py/env/bin/activate
+PYTHONPATH=py python -m benchmarks.ingest "$@"
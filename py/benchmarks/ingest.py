@@ -0,0 +1,290 @@
+import datetime as dt
+from argparse import ArgumentParser
+from glob import glob
+from json import load, dump, dumps
+from logging import getLogger
+from multiprocessing import cpu_count
+from os.path import join, basename, exists, dirname, splitext
+from platform import platform, python_version, processor
+from resource import getrusage, RUSAGE_SELF
+from sys import exit
+from tempfile import TemporaryDirectory
+from time import time
+
+from ch2 import PROGNAME
+from ch2.commands.args import make_parser, NamespaceWithVariables, DB_VERSION, bootstrap_db, BASE, DEV, V, \
+    parse_pairs
+from ch2.common.args import mm, m
+from ch2.common.db import get_cnxn, remove, remove_user, execute, quote
+from ch2.common.io import data_hash
+from ch2.common.log import configure_log
+from ch2.common.names import USER
+from ch2.common.user import make_user_database
+from ch2.fit.fix import fix
+from ch2.fit.format.read import filtered_records, filtered_columns, parse_data
+from ch2.fit.profile.profile import read_fit, read_profile
+
+log = getLogger(__name__)
+
+# the committed reference (see environment) and local results (not committed)
+BASELINES = join(dirname(__file__), 'baselines.json')
+LOCAL_BASELINES = join(dirname(__file__), 'baselines.local.json')
+CORPUS = 'data/test/source/personal/*.fit'
+FIT_EPOCH = dt.datetime(1989, 12, 31, tzinfo=dt.timezone.utc)
+
+WALL, CPU, RSS, N, N_SQL, SQL, N_ROWS = 'wall', 'cpu', 'rss', 'n', 'n_sql', 'sql', 'n_rows'
+RATE = 'rate'
+
+
+def peak_rss(reset=False):
+    '''
+    Peak RSS (MB).  On linux the peak can be reset (so that each stage is measured separately);
+    elsewhere this is the peak for the process so far.
+    '''
+    try:
+        if reset:
+            with open('/proc/self/clear_refs', 'w') as output:
+                output.write('5')
+        with open('/proc/self/status') as input:
+            for line in input:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return getrusage(RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Stage:
+    '''
+    Time (wall and CPU) and peak memory for a stage run in this process.
+    '''
+
+    def __init__(self, results, name, n):
+        self.__results = results
+        self.__name = name
+        self.__n = n
+
+    def __enter__(self):
+        peak_rss(reset=True)
+        self.__wall, self.__cpu = time(), self.__cpu_now()
+        return self
+
+    @staticmethod
+    def __cpu_now():
+        usage = getrusage(RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not exc_type:
+            wall = time() - self.__wall
+            self.__results[self.__name] = {N: self.__n, WALL: wall, CPU: self.__cpu_now() - self.__cpu,
+                                           RSS: peak_rss(), RATE: self.__n / wall if wall else 0}
+
+
+def environment():
+    '''
+    Where the results were measured (they are only comparable on the same machine).
+    '''
+    model = processor()
+    try:
+        with open('/proc/cpuinfo') as input:
+            for line in input:
+                if line.startswith('model name'):
+                    model = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {'platform': platform(), 'processor': model, 'cpus': cpu_count(), 'python': python_version()}
+
+
+def first_timestamp(data, types, messages):
+    state, tokens = parse_data(data, types, messages)
+    for _ in tokens:
+        if state.timestamp is not None:
+            return state.timestamp
+
+
+def scale_corpus(paths, dir, repeat, shift):
+    '''
+    Write repeat copies of each file to dir.  Each copy is shifted back in time (by shift days per copy)
+    so that the activities are distinct (and do not overlap with later copies).
+    '''
+    types, messages = read_profile()
+    scaled = []
+    for path in paths:
+        data = read_fit(path)
+        start = first_timestamp(data, types, messages)
+        for i in range(repeat):
+            if i:
+                if start is None:
+                    break
+                shifted = start - dt.timedelta(days=i * shift)
+                if shifted < FIT_EPOCH:
+                    raise Exception(f'Too many repeats (or too large a shift) for {path}')
+                data = fix(read_fit(path), start=shifted, fix_checksum=True, validate=False)
+            name, extn = splitext(basename(path))
+            scaled_path = join(dir, f'{name}-{i}{extn}')
+            with open(scaled_path, 'wb') as output:
+                output.write(data)
+            scaled.append(scaled_path)
+    log.info(f'Scaled {len(paths)} files to {len(scaled)}')
+    return scaled
+
+
+def benchmark_parse(results, paths):
+    datas = [read_fit(path) for path in paths]
+    n_bytes = sum(len(data) for data in datas)
+    with Stage(results, 'parse-records', n_bytes):
+        for data in datas:
+            for _ in filtered_records(data)[2]:
+                pass
+    with Stage(results, 'parse-columns', n_bytes):
+        for data in datas:
+            filtered_columns(data)
+
+
+def scratch_user(admin):
+    '''
+    A new user (role and schema) with the ch2 tables.  Remove with drop_scratch_user.
+    '''
+    parser = make_parser()
+    ns = NamespaceWithVariables._from_ns(parser.parse_args(args=[mm(USER), admin]), PROGNAME, DB_VERSION)
+    from ch2.sql.config import Config
+    from ch2.sql.support import Base
+    user = 'bench' + data_hash(str(dt.datetime.now()))[:6]
+    log.info(f'User/database {user}')
+    user_config = make_user_database(Config(ns), user, '')
+    Base.metadata.create_all(user_config.db.engine)
+    user_config.db.engine.dispose()
+    return user_config
+
+
+def drop_scratch_user(user_config):
+    user = user_config.args[USER]
+    cnxn = get_cnxn(user_config)
+    remove(cnxn, 'schema', user, ' cascade')
+    execute(cnxn, f'drop owned by {quote(cnxn, user)}')  # remaining privileges
+    cnxn.close()
+    remove_user(user_config)
+
+
+def benchmark_db(results, paths, admin, kargs):
+    from ch2.commands.upload import upload_files, open_files
+    from ch2.config.profiles.default import default
+    from ch2.lib.log import Record
+    from ch2.pipeline.metrics import Metrics
+    from ch2.pipeline.process import run_pipeline
+    from ch2.sql import PipelineType, PipelineMetric
+    from ch2.sql.types import short_cls
+
+    user_config = scratch_user(admin)
+    user, config = user_config.args[USER], None
+    try:
+        with TemporaryDirectory() as f:
+            bootstrap_db(user, mm(BASE), f, m(V), '0', mm(DEV), configurator=default)
+            config = bootstrap_db(user, mm(BASE), f, m(V), '0', mm(DEV))
+            with Stage(results, 'upload', len(paths)), Metrics(config.db.engine) as metrics:
+                upload_files(Record(log), config, files=open_files(paths))
+            results['upload'].update({N_SQL: metrics.n_sql, SQL: metrics.sql, N_ROWS: metrics.n_rows})
+            with Stage(results, 'process', len(paths)):
+                run_pipeline(config, PipelineType.PROCESS, **kargs)
+            with config.db.session_context() as s:
+                # one stage per pipeline class, from the metrics recorded by each run (which may be in workers)
+                stages = {}
+                for metric in s.query(PipelineMetric).order_by(PipelineMetric.start).all():
+                    stage = stages.setdefault(short_cls(metric.owner), {N: 0, CPU: 0, RSS: 0, N_SQL: 0, SQL: 0,
+                                                                        N_ROWS: 0, 'first': metric.start,
+                                                                        'last': metric.start})
+                    for name, value in ((N, metric.n_missing), (CPU, metric.cpu), (N_SQL, metric.n_sql),
+                                        (SQL, metric.sql), (N_ROWS, metric.n_rows)):
+                        stage[name] += value
+                    stage[RSS] = max(stage[RSS], metric.rss)
+                    stage['last'] = max(stage['last'], metric.start + dt.timedelta(seconds=metric.wall))
+                for name, stage in stages.items():
+                    # elapsed time, since batches may run in parallel
+                    stage[WALL] = (stage.pop('last') - stage.pop('first')).total_seconds()
+                    stage[RATE] = stage[N] / stage[WALL] if stage[WALL] else 0
+                    results[name] = stage
+    finally:
+        if config: config.db.engine.dispose()  # connections as the user block the drop
+        drop_scratch_user(user_config)
+
+
+def compare(results, baselines, tolerance):
+    '''
+    Print results next to baselines and return the names of stages that are slower (lower rate),
+    use more memory, or make more SQL statements than the baseline allows.
+    '''
+    regressions = []
+    print(f'{"stage":30s} {"n":>9s} {"wall/s":>8s} {"cpu/s":>8s} {"rate/s":>11s} {"base":>11s} '
+          f'{"rss/MB":>7s} {"base":>7s} {"sql":>7s} {"base":>7s}')
+    for name, result in results.items():
+        base = baselines.get(name, {})
+        print(f'{name:30s} {result[N]:9.0f} {result[WALL]:8.2f} {result[CPU]:8.2f} {result[RATE]:11.1f} '
+              f'{base.get(RATE, 0):11.1f} {result[RSS]:7.0f} {base.get(RSS, 0):7.0f} '
+              f'{result.get(N_SQL, 0):7.0f} {base.get(N_SQL, 0):7.0f}')
+        if base and (result[RATE] < base[RATE] * (1 - tolerance) or
+                     result[RSS] > base[RSS] * (1 + tolerance) or
+                     result.get(N_SQL, 0) > base.get(N_SQL, 0) * (1 + tolerance)):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description='benchmark reading FIT files and processing them into the database '
+                                        '(run from the top-level directory with PYTHONPATH=py)')
+    parser.add_argument('--pattern', default=CORPUS, help='glob for FIT files')
+    parser.add_argument('--repeat', type=int, default=3, help='copies of each file (shifted in time)')
+    parser.add_argument('--shift', type=int, default=1461, metavar='DAYS', help='shift between copies')
+    parser.add_argument('--no-db', action='store_true', help='parse stages only (no database)')
+    parser.add_argument('--admin', default='postgres', metavar='USER', help='database admin user')
+    parser.add_argument('-K', dest='karg', action='append', default=[], metavar='NAME=VALUE',
+                        help='keyword argument for the process pipelines (as for ch2 process)')
+    parser.add_argument('--baselines', metavar='PATH',
+                        help='baselines to compare against (default local results if saved, otherwise the reference)')
+    parser.add_argument('--save', action='store_true', help='save results as the new local baselines')
+    parser.add_argument('--save-reference', action='store_true', help='save results as the committed reference')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='fractional change allowed')
+    parser.add_argument('--json', action='store_true', help='also print results as JSON')
+    args = parser.parse_args()
+    configure_log(PROGNAME, '/tmp/ch2-benchmark.log', verbosity=3)
+
+    results, paths = {}, sorted(glob(args.pattern))
+    if not paths:
+        raise Exception(f'No files match {args.pattern}')
+    with TemporaryDirectory() as dir:
+        paths = scale_corpus(paths, dir, args.repeat, args.shift)
+        benchmark_parse(results, paths)
+        if not args.no_db:
+            benchmark_db(results, paths, args.admin, parse_pairs(args.karg))
+
+    parameters = {'pattern': args.pattern, 'repeat': args.repeat, 'shift': args.shift}
+    path = args.baselines or (LOCAL_BASELINES if exists(LOCAL_BASELINES) else BASELINES)
+    stored = load(open(path)) if exists(path) else {}
+    if stored:
+        log.info(f'Comparing with {path}')
+        if stored.get('parameters') != parameters:
+            log.warning(f'Baselines were measured with {stored.get("parameters")}')
+        if stored.get('environment') != environment():
+            log.warning(f'Baselines were measured on {stored.get("environment")} '
+                        f'(save local baselines with --save for a useful comparison)')
+    regressions = compare(results, stored.get('stages', {}), args.tolerance)
+    if args.json:
+        print(dumps(results, indent=1))
+    for save, path in ((args.save, LOCAL_BASELINES), (args.save_reference, BASELINES)):
+        if save:
+            previous = load(open(path)) if exists(path) else {}
+            same = previous.get('parameters') == parameters and previous.get('environment') == environment()
+            stages = dict(previous.get('stages', {}) if same else {})
+            stages.update(results)
+            with open(path, 'w') as output:
+                dump({'parameters': parameters, 'environment': environment(), 'stages': stages},
+                     output, indent=1, sort_keys=True)
+            log.info(f'Saved baselines to {path}')
+    if regressions:
+        print(f'Regressions: {", ".join(regressions)}')
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
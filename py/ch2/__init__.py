@@ -14,7 +14,7 @@ getLogger('tornado').addHandler(NullHandler())
 from .commands.args import COMMAND, make_parser, PROGNAME, HELP, DEV, DIARY, FIT, \
     PACKAGE_FIT_PROFILE, ACTIVITIES, NO_OP, DATABASE, CONSTANTS, SHOW_SCHEDULE, MONITOR, GARMIN, \
     UNLOCK, DUMP, FIX_FIT, CH2_VERSION, JUPYTER, KIT, WEB, IMPORT, THUMBNAIL, CHECK, SEARCH, VALIDATE, \
-    DB_VERSION, UPLOAD, PROCESS, DELETE, SPARKLINE
+    DB_VERSION, UPLOAD, PROCESS, DELETE, SPARKLINE, METRICS, SRTM_CACHE
 from .commands.process import process
 from .commands.upload import upload
 from .commands.constants import constants
@@ -26,9 +26,11 @@ from .commands.fix_fit import fix_fit
 from .commands.help import help
 from .commands.import_ import import_
 from .commands.kit import kit
+from .commands.metrics import metrics
 from .commands.package_fit_profile import package_fit_profile
 from .commands.search import search
 from .commands.show_schedule import show_schedule
+from .commands.srtm_cache import srtm_cache
 from .commands.thumbnail import thumbnail
 from .commands.web import web
 from .lib.log import make_log_from_args
@@ -57,12 +59,14 @@ COMMANDS = {CONSTANTS: constants,
             HELP: help,
             IMPORT: import_,
             KIT: kit,
+            METRICS: metrics,
             NO_OP: no_op,
             PACKAGE_FIT_PROFILE: package_fit_profile,
             PROCESS: process,
             SEARCH: search,
             SHOW_SCHEDULE: show_schedule,
             SPARKLINE: sparkline,
+            SRTM_CACHE: srtm_cache,
             THUMBNAIL: thumbnail,
             UPLOAD: upload,
             VALIDATE: validate,
@@ -13,7 +13,7 @@ from ..lib.utils import parse_bool
 log = getLogger(__name__)
 
 # this can be modified during development.  it will be reset from setup.py on release.
-CH2_VERSION = '0.38.2'
+CH2_VERSION = '0.39.0'
 # new database on minor releases.  not sure this will always be a good idea.  we will see.
 DB_VERSION = '-'.join(CH2_VERSION.split('.')[:2])
 
@@ -37,11 +37,13 @@ IMPORT = 'import'
 JUPYTER = 'jupyter'
 KIT = 'kit'
 LOAD = 'load'
+METRICS = 'metrics'
 NO_OP = 'no-op'
 PACKAGE_FIT_PROFILE = 'package-fit-profile'
 SEARCH = 'search'
 SHOW_SCHEDULE = 'show-schedule'
 SPARKLINE = 'sparkline'
+SRTM_CACHE = 'srtm-cache'
 TEXT = 'text'
 THUMBNAIL = 'thumbnail'
 UNLOCK = 'unlock'
@@ -60,6 +62,7 @@ ADVANCED = 'advanced'
 AFTER = 'after'
 AFTER_BYTES = 'after-bytes'
 AFTER_RECORDS = 'after-records'
+AFTER_TIME = 'after-time'
 ALL = 'all'
 ALL_MESSAGES = 'all-messages'
 ALL_FIELDS = 'all-fields'
@@ -81,6 +84,7 @@ DARK = 'dark'
 DATA = 'data'
 DATABASES = 'databases'
 DATE = 'date'
+DAYS = 'days'
 DB = 'db'
 DEFAULT = 'default'
 DELETE = 'delete'
@@ -112,15 +116,19 @@ GROUP = 'group'
 HEADER_SIZE = 'header-size'
 HEIGHT = 'height'
 IMAGE_DIR = 'image-dir'
+INDEX = 'index'
+INDEX_DIR = 'index-dir'
 INTERNAL = 'internal'
 INVERT = 'invert'
 ITEM = 'item'
+JSON = 'json'
 K = 'k'
 KARG = 'karg'
 LABEL = 'label'
 LATITUDE = 'latitude'
 LIGHT = 'light'
 LIKE = 'like'
+LIMIT = 'limit'
 LIMIT_BYTES = 'limit-bytes'
 LIMIT_RECORDS = 'limit-records'
 LOG = 'log'
@@ -187,6 +195,7 @@ SECTORS = 'sectors'
 SHOW = 'show'
 SINGLE = 'single'
 SLICES = 'slices'
+SMOOTH = 'smooth'
 SOURCE = 'source'
 SOURCES = 'sources'
 SOURCE_ID = 'source-id'
@@ -204,6 +213,7 @@ TABLE = 'table'
 TABLES = 'tables'
 TOKENS = 'tokens'
 TOPIC = 'topic'
+TRACE = 'trace'
 UNDO = 'undo'
 UNSAFE = 'unsafe'
 UNSET = 'unset'
@@ -214,6 +224,7 @@ W, WARN = 'w', 'warn'
 WAYPOINTS = 'waypoints'
 WIDTH = 'width'
 WORKER = 'worker'
+WORKERS = 'workers'
 YEAR = 'year'
 Y = 'y'
 
@@ -326,6 +337,13 @@ def make_parser(with_noop=False):
     process.add_argument(ARG, nargs='*', metavar='WORKER_ARG',
                          help=f'internal use only (tasks for {mm(WORKER)})')
 
+    metrics = commands.add_parser(METRICS, help='summarize time and resources used by pipelines',
+                                  description='summarize (or export) metrics recorded by pipelines')
+    metrics.add_argument(mm(DAYS), type=int, metavar='N', default=7, help='include runs from the last N days')
+    metrics.add_argument(mm(LIMIT), type=int, metavar='N', default=10, help='number of pipelines to show')
+    metrics.add_argument(mm(FORMAT), choices=(TEXT, JSON, TRACE), default=TEXT,
+                         help='summary (text) or all runs (json or chrome trace format)')
+
     def add_search_query(cmd, query_help='search terms (similar to SQL)'):
         cmd.add_argument(QUERY, metavar='QUERY', default=[], nargs='+', help=query_help)
         cmd.add_argument(mm(SHOW), metavar='NAME', default=[], nargs='+',
@@ -490,11 +508,19 @@ def make_parser(with_noop=False):
                          help='skip initial bytes')
         cmd.add_argument(mm(LIMIT_BYTES), type=int, metavar='N', default=-1,
                          help='limit number of bytes displayed')
+        cmd.add_argument(mm(AFTER_TIME), type=to_time, metavar='TIME', default=None,
+                         help='skip data before the given time')
+        cmd.add_argument(mm(INDEX), action='store_true',
+                         help='use (and save) an index to seek by time or message')
+        cmd.add_argument(mm(INDEX_DIR), metavar='DIR', default='{base}/{version}/fit-index',
+                         help='index cache')
         cmd.add_argument(m(W), mm(WARN), action='store_true', help='log additional warnings')
         cmd.add_argument(mm(no(VALIDATE)), action='store_true', help='do not validate checksum, length')
         cmd.add_argument(mm(MAX_DELTA_T), type=float, metavar='S',
                          help='validate seconds between timestamps (and non-decreasing)')
         cmd.add_argument(mm(NAME), action='store_true', help='print file name')
+        cmd.add_argument(mm(WORKERS), type=int, metavar='N', default=1,
+                         help='number of processes reading files in parallel')
         cmd.add_argument(PATH, metavar='PATH', nargs='+', help='path to fit file')
 
     def add_fit_grep(cmd):
@@ -573,6 +599,15 @@ def make_parser(with_noop=False):
     fix_fit_params.add_argument(mm(MAX_DELTA_T), type=float, metavar='S',
                                 help='max number of seconds between timestamps')
 
+    srtm_cache = commands.add_parser(SRTM_CACHE, help='convert SRTM1 tiles for fast reading',
+                                     description='convert downloaded SRTM1 tiles (hgt or zip) to a cache '
+                                                 'that can be memory-mapped')
+    srtm_cache.add_argument(mm(SMOOTH), type=float, action='append', default=[], metavar='S',
+                            help='also save splines with the given smoothing (can be repeated)')
+    srtm_cache.add_argument(mm(DIR), metavar='DIR',
+                            help='the directory containing the tiles (default is the constant)')
+    srtm_cache.add_argument(mm(FORCE), action='store_true', help='replace existing cached data')
+
     thumbnail = commands.add_parser(THUMBNAIL, help='generate a thumbnail map of an activity')
     thumbnail.add_argument(ACTIVITY, type=int, metavar='ID', help='an activity ID')
     add_image_dir(thumbnail)
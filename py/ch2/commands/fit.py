@@ -1,9 +1,13 @@
-
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from itertools import repeat
 from logging import getLogger
+from sys import stdout
+from time import time
 
 from .args import PATH, SUB_COMMAND, AFTER_BYTES, LIMIT_BYTES, AFTER_RECORDS, LIMIT_RECORDS, NAME, WIDTH, GREP, \
     RECORDS, ALL_FIELDS, INTERNAL, ALL_MESSAGES, MESSAGE, FIELD, VALIDATE, MAX_DELTA_T, WARN, TABLES, PATTERN, \
-    COMPACT, CONTEXT, NOT, MATCH, CSV, TOKENS, FIELDS
+    COMPACT, CONTEXT, NOT, MATCH, CSV, TOKENS, FIELDS, AFTER_TIME, INDEX, INDEX_DIR, WORKERS
 from ..common.args import no
 from ..fit.profile.profile import read_fit
 from ..fit.summary import summarize_records, summarize_tables, summarize_grep, summarize_csv, summarize_tokens, \
@@ -41,6 +45,15 @@ or redirect stderr elsewhere).
 
 Will list file names that contain cycling data.
 
+    > ch2 fit records --index --after-time '2018-07-26 13:50' -m record -- ride.fit
+
+Will display records after the given time.  With `--index` an index of offsets is saved (in
+`--index-dir`) the first time the file is read and later reads seek directly to the time or messages.
+
+    > ch2 -v 5 fit grep --workers 8 -p '.*:sport=cycling' --match 0 --name -- directory/**/*.fit
+
+Will read the files in 8 processes (output is still in the order given, timing per file is logged).
+
     > ch2 fit grep -p PATTERN -- FILE
 
 You may need a `--` between patterns and file paths so that the argument parser can decide where patterns
@@ -49,6 +62,40 @@ finish and paths start.
 
     args = config.args
     format = args[SUB_COMMAND]
+
+    # todo - can this be handled by argparse?
+    if (args[AFTER_RECORDS] or args[LIMIT_RECORDS] != -1) and (args[AFTER_BYTES] or args[LIMIT_BYTES] != -1):
+        raise Exception('Constrain either records or bytes, not both')
+
+    options = dict(args)  # picklable, for workers
+    options[INDEX_DIR] = args._format_path(INDEX_DIR) if args[INDEX] else None
+    if format in (RECORDS, TABLES, GREP):
+        options[WIDTH] = args[WIDTH] or terminal_width()
+
+    if args[WORKERS] > 1:
+        with ProcessPoolExecutor(max_workers=args[WORKERS]) as executor:
+            # map returns results in input order
+            results = executor.map(fit_path_to_text, repeat(options), args[PATH])
+            for file_path, (text, seconds) in zip(args[PATH], results):
+                log.debug(f'Summarized {file_path} in {seconds:.2f}s')
+                print(text, end='')
+    else:
+        for file_path in args[PATH]:
+            start = time()
+            fit_path(options, file_path)
+            log.debug(f'Summarized {file_path} in {time() - start:.2f}s')
+
+
+def fit_path_to_text(args, file_path):
+    start = time()
+    output = StringIO()
+    fit_path(args, file_path, output=output)
+    return output.getvalue(), time() - start
+
+
+def fit_path(args, file_path, output=stdout):
+
+    format = args[SUB_COMMAND]
     after_bytes = args[AFTER_BYTES]
     limit_bytes = args[LIMIT_BYTES]
     after_records = args[AFTER_RECORDS]
@@ -56,59 +103,61 @@ finish and paths start.
     warn = args[WARN]
     no_validate = args[no(VALIDATE)]
     max_delta_t = args[MAX_DELTA_T]
+    after_time = args[AFTER_TIME]
+    index_dir = args[INDEX_DIR]
 
-    # todo - can this be handled by argparse?
-    if (after_records or limit_records != -1) and (after_bytes or limit_bytes != -1):
-        raise Exception('Constrain either records or bytes, not both')
+    name_file = file_path if args[NAME] else None
+    if name_file and format != GREP:
+        print(file=output)
+        print(name_file, file=output)
+
+    data = read_fit(file_path)
 
-    for file_path in args[PATH]:
-
-        name_file = file_path if args[NAME] else None
-        if name_file and format != GREP:
-            print()
-            print(name_file)
-
-        data = read_fit(file_path)
-
-        if format == RECORDS:
-            summarize_records(data,
-                              all_fields=args[ALL_FIELDS], all_messages=args[ALL_MESSAGES],
-                              internal=args[INTERNAL], after_bytes=after_bytes, limit_bytes=limit_bytes,
-                              after_records=after_records, limit_records=limit_records,
-                              record_names=args[MESSAGE], field_names=args[FIELD],
-                              warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
-                              width=args[WIDTH] or terminal_width())
-        elif format == TABLES:
-            summarize_tables(data,
-                             all_fields=args[ALL_FIELDS], all_messages=args[ALL_MESSAGES],
-                             internal=args[INTERNAL], after_bytes=after_bytes, limit_bytes=limit_bytes,
-                             after_records=after_records, limit_records=limit_records,
-                             record_names=args[MESSAGE], field_names=args[FIELD],
-                             warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
-                             width=args[WIDTH] or terminal_width())
-        elif format == CSV:
-            summarize_csv(data,
+    if format == RECORDS:
+        summarize_records(data,
+                          all_fields=args[ALL_FIELDS], all_messages=args[ALL_MESSAGES],
                           internal=args[INTERNAL], after_bytes=after_bytes, limit_bytes=limit_bytes,
                           after_records=after_records, limit_records=limit_records,
                           record_names=args[MESSAGE], field_names=args[FIELD],
-                          warn=warn, max_delta_t=max_delta_t)
-        elif format == GREP:
-            summarize_grep(data, args[PATTERN],
-                           after_bytes=after_bytes, limit_bytes=limit_bytes,
-                           after_records=after_records, limit_records=limit_records,
-                           warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
-                           width=args[WIDTH] or terminal_width(),
-                           name_file=name_file, match=args[MATCH], compact=args[COMPACT],
-                           context=args[CONTEXT], invert=args[NOT])
-        elif format == TOKENS:
-            summarize_tokens(data,
-                             after_bytes=after_bytes, limit_bytes=limit_bytes,
-                             after_records=after_records, limit_records=limit_records,
-                             warn=warn, no_validate=no_validate, max_delta_t=max_delta_t)
-        elif format == FIELDS:
-            summarize_fields(data,
-                             after_bytes=after_bytes, limit_bytes=limit_bytes,
-                             after_records=after_records, limit_records=limit_records,
-                             warn=warn, no_validate=no_validate, max_delta_t=max_delta_t)
-        else:
-            raise Exception('Bad format: %s' % format)
+                          warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
+                          after_time=after_time, index_dir=index_dir,
+                          width=args[WIDTH], output=output)
+    elif format == TABLES:
+        summarize_tables(data,
+                         all_fields=args[ALL_FIELDS], all_messages=args[ALL_MESSAGES],
+                         internal=args[INTERNAL], after_bytes=after_bytes, limit_bytes=limit_bytes,
+                         after_records=after_records, limit_records=limit_records,
+                         record_names=args[MESSAGE], field_names=args[FIELD],
+                         warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
+                         after_time=after_time, index_dir=index_dir,
+                         width=args[WIDTH], output=output)
+    elif format == CSV:
+        summarize_csv(data,
+                      internal=args[INTERNAL], after_bytes=after_bytes, limit_bytes=limit_bytes,
+                      after_records=after_records, limit_records=limit_records,
+                      record_names=args[MESSAGE], field_names=args[FIELD],
+                      warn=warn, max_delta_t=max_delta_t,
+                      after_time=after_time, index_dir=index_dir, output=output)
+    elif format == GREP:
+        summarize_grep(data, args[PATTERN],
+                       after_bytes=after_bytes, limit_bytes=limit_bytes,
+                       after_records=after_records, limit_records=limit_records,
+                       warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
+                       after_time=after_time, index_dir=index_dir,
+                       width=args[WIDTH],
+                       name_file=name_file, match=args[MATCH], compact=args[COMPACT],
+                       context=args[CONTEXT], invert=args[NOT], output=output)
+    elif format == TOKENS:
+        summarize_tokens(data,
+                         after_bytes=after_bytes, limit_bytes=limit_bytes,
+                         after_records=after_records, limit_records=limit_records,
+                         warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
+                         after_time=after_time, index_dir=index_dir, output=output)
+    elif format == FIELDS:
+        summarize_fields(data,
+                         after_bytes=after_bytes, limit_bytes=limit_bytes,
+                         after_records=after_records, limit_records=limit_records,
+                         warn=warn, no_validate=no_validate, max_delta_t=max_delta_t,
+                         after_time=after_time, index_dir=index_dir, output=output)
+    else:
+        raise Exception('Bad format: %s' % format)
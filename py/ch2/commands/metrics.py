@@ -0,0 +1,47 @@
+import datetime as dt
+from json import dumps
+from logging import getLogger
+
+from .args import DAYS, LIMIT, FORMAT, JSON, TRACE
+from ..common.date import now
+from ..pipeline.metrics import recent_metrics, metrics_as_json, metrics_as_trace, summarize_metrics
+
+log = getLogger(__name__)
+
+
+def metrics(config):
+    '''
+## metrics
+
+    > ch2 metrics [--days N] [--limit N]
+
+Summarize the time and resources used by pipelines over recent runs, slowest first.
+
+For each pipeline this shows the number of batches and missing values processed, wall and CPU time,
+peak memory (RSS) for the process, rows inserted, and the number of SQL statements and the time
+spent executing them.
+
+    > ch2 metrics --format json
+    > ch2 metrics --format trace > trace.json
+
+Print the individual runs as JSON or in Chrome's trace event format (load the file in
+chrome://tracing or https://ui.perfetto.dev to see how workers were scheduled).
+    '''
+    args = config.args
+    with config.db.session_context() as s:
+        metrics = recent_metrics(s, now() - dt.timedelta(days=args[DAYS]))
+        if args[FORMAT] == JSON:
+            print(dumps(metrics_as_json(metrics), indent=1))
+        elif args[FORMAT] == TRACE:
+            print(dumps(metrics_as_trace(metrics)))
+        else:
+            print_summary(summarize_metrics(metrics)[:args[LIMIT]])
+
+
+def print_summary(summary):
+    print(f'{"pipeline":30s} {"batch":>5s} {"missing":>7s} {"wall/s":>8s} {"cpu/s":>8s} {"rss/MB":>7s} '
+          f'{"rows":>9s} {"sql":>7s} {"sql/s":>8s}')
+    for name, total in summary:
+        print(f'{name:30s} {total["batches"]:5.0f} {total["n_missing"]:7.0f} {total["wall"]:8.1f} '
+              f'{total["cpu"]:8.1f} {total["rss"]:7.0f} {total["n_rows"]:9.0f} {total["n_sql"]:7.0f} '
+              f'{total["sql"]:8.1f}')
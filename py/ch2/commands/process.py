@@ -24,6 +24,15 @@ Delete statistics and then calculate new values.
     > ch2 --dev calculate --like '%Activity%' --force 2020-01-01 -Kn_cpu=1
 
 Calculate activity statistics from 2020 onwards in a single process for debugging.
+
+    > ch2 process -Kpool=1
+
+Run batches in a pool of long-lived worker processes instead of starting a new command for each batch.
+
+    > ch2 process -Kmax_db=2 -Kmax_memory=4000
+
+Run at most 2 database-heavy workers (eg sector matching) at once and limit the estimated total memory
+used by workers to 4GB.
     '''
     args = config.args
     if bool(args[WORKER]) != bool(args[ARG]):
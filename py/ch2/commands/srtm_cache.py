@@ -0,0 +1,41 @@
+from logging import getLogger
+
+from .args import SMOOTH, DIR, FORCE
+from ..common.args import mm
+from ..srtm.file import dir_from_constant, downloaded_tiles, write_file_cache, CACHE
+from ..srtm.spline import write_spline_cache
+
+log = getLogger(__name__)
+
+
+def srtm_cache(config):
+    '''
+## srtm-cache
+
+    > ch2 srtm-cache
+
+Convert the downloaded SRTM1 tiles (hgt or zip files in the directory given by the SRTM1.dir constant)
+to uncompressed, native-endian files in a `cache` sub-directory.  These are memory-mapped when
+elevations are needed, so the data are not decompressed again for each activity and are shared between
+worker processes.  Cached files older than their tile (eg after a new download) are ignored, and replaced
+when the command is run again.
+
+    > ch2 srtm-cache --smooth 0 --smooth 1
+
+Also save the spline coefficients used for smoothed elevations.
+    '''
+    args = config.args
+    dir = args[DIR]
+    if not dir:
+        with config.db.session_context() as s:
+            dir = dir_from_constant(s)
+    if not dir:
+        raise Exception(f'No SRTM1 directory (give {mm(DIR)} or define the constant)')
+    tiles = downloaded_tiles(dir)
+    log.info(f'Found {len(tiles)} tiles in {dir}')
+    n_files, n_splines = 0, 0
+    for flat, flon in tiles:
+        n_files += write_file_cache(dir, flat, flon, force=args[FORCE])
+        for smooth in args[SMOOTH]:
+            n_splines += write_spline_cache(dir, flat, flon, smooth, force=args[FORCE])
+    log.info(f'Wrote {n_files} tiles and {n_splines} splines to {CACHE} in {dir}')
@@ -1,6 +1,19 @@
 from math import floor
 
+import numpy as np
+from pygeotile.meta import ORIGIN_SHIFT
+
 
 # https://trac.osgeo.org/postgis/wiki/UsersWikiplpgsqlfunctionsDistance
 def utm_srid(lat, lon):
     return (32600 if lat > 0 else 32700) + floor((lon + 180) / 6) + 1
+
+
+def mercator_meters(lat, lon):
+    '''
+    Web Mercator (EPSG:3857) x, y coordinates for arrays of latitude and longitude (degrees).
+    Same as pygeotile's Point.meters, but for numpy arrays.
+    '''
+    x = lon * ORIGIN_SHIFT / 180.0
+    y = np.log(np.tan((90.0 + lat) * np.pi / 360.0)) / (np.pi / 180.0)
+    return x, y * ORIGIN_SHIFT / 180.0
@@ -1,10 +1,11 @@
 import datetime as dt
+from collections import defaultdict
 from logging import getLogger
 
 import numpy as np
 import pandas as pd
 import pytz
-from sqlalchemy import asc, desc, distinct
+from sqlalchemy import asc, desc
 from sqlalchemy.orm import aliased
 
 from ..common.date import YMD
@@ -15,12 +16,16 @@ from ..data import session, present
 from ..lib import time_to_local_time
 from ..lib.utils import timing
 from ..names import Names as N, like, MED_WINDOW, SPACE
-from ..sql import StatisticName, ActivityGroup, StatisticJournal, ActivityTimespan, ActivityJournal, Source
-from ..sql.tables.statistic import STATISTIC_JOURNAL_CLASSES
+from ..sql import StatisticName, ActivityGroup, StatisticJournal, ActivityTimespan, ActivityJournal, Source, \
+    StatisticSeries
+from ..sql.tables.statistic import STATISTIC_JOURNAL_CLASSES, StatisticJournalFloat, StatisticJournalInteger
 from ..sql.types import short_cls
 
 log = getLogger(__name__)
 
+# column labels for the long format used when reading several statistics in one query
+NAME_ID, GROUP_ID, VALUE, SOURCE_ID = '_name_id', '_group_id', '_value', '_source_id'
+
 
 class Statistics:
 
@@ -84,44 +89,101 @@ class Statistics:
         return columns
 
     def by_name(self, owner, *names, like=False):
+        # series are read first; any remaining names are read together, with one query per journal type
+        dfs, remaining, labels = {}, defaultdict(dict), []
         for name in names:
             for statistic_name, type_class in self.__name_and_type(name, owner, like):
                 label = statistic_name.name
+                if label in labels: continue
                 log.info(f'Retrieving {label}')
-                q = self.__s.query(*self.__columns(type_class, label)). \
-                    filter(type_class.statistic_name_id == statistic_name.id)
-                q = self.__constrain_journal(q).order_by(N.INDEX)
-                with timing(f'Slow query for {label}?\n{q}', self.__warn_over):
-                    df = read_query(q, index=N.INDEX)
-                self.__merge(df)
+                labels.append(label)
+                df = self.__read_series(statistic_name, type_class, label)
+                if df is None:
+                    remaining[type_class][(statistic_name.id,)] = label
+                else:
+                    dfs[label] = df
+        for type_class, type_labels in remaining.items():
+            dfs.update((type_labels[key], df) for key, df in self.__read_journals(type_class, type_labels).items())
+        self.__merge(*(dfs[label] for label in labels))
         return self
 
+    def __read_series(self, statistic_name, type_class, label):
+        # if every source has the values saved as a series (see Loader) then use those
+        if not self.__sources or type_class not in (StatisticJournalFloat, StatisticJournalInteger):
+            return None
+        series = self.__s.query(StatisticSeries). \
+            filter(StatisticSeries.statistic_name_id == statistic_name.id,
+                   StatisticSeries.source_id.in_([source.id for source in self.__sources])).all()
+        if len(series) != len(self.__sources):
+            return None
+        with timing(f'Slow series for {label}?', self.__warn_over):
+            df = pd.concat([one.as_df(label, with_source=N._src(label) if self.__with_source else None)
+                            for one in series]).sort_index()
+            df.index.name = N.INDEX
+            if self.__start: df = df.loc[df.index >= self.__start]
+            if self.__finish: df = df.loc[df.index < self.__finish]
+        return df
+
+    def __read_journals(self, type_class, labels, by_group=False):
+        '''
+        Read all the given statistic names (of a single journal type) in one query, then split the
+        (long) result into a frame per key.
+
+        labels maps keys to column labels; keys are (statistic_name_id,) or, if by_group is set,
+        (statistic_name_id, activity_group_id) where missing groups are 0.  If by_group is set then
+        labels is extended with any groups found in the data (and only those are returned).
+        '''
+        keys = [NAME_ID, GROUP_ID] if by_group else [NAME_ID]
+        columns = [type_class.time.label(N.INDEX), type_class.statistic_name_id.label(NAME_ID),
+                   type_class.value.label(VALUE)]
+        if self.__with_source:
+            columns += [type_class.source_id.label(SOURCE_ID)]
+        if by_group:
+            columns += [Source.activity_group_id.label(GROUP_ID)]
+        q = self.__s.query(*columns). \
+            filter(type_class.statistic_name_id.in_(set(key[0] for key in labels)))
+        if by_group:
+            q = q.join(Source, type_class.source_id == Source.id)
+        q = self.__constrain_journal(q).order_by(N.INDEX)
+        with timing(f'Slow query for {", ".join(labels.values())}?\n{q}', self.__warn_over):
+            df = read_query(q)
+        if by_group:
+            df[GROUP_ID] = df[GROUP_ID].fillna(0).astype(np.int64)
+            self.__add_group_labels(labels, df[[NAME_ID, GROUP_ID]].drop_duplicates().itertuples(index=False))
+        indices = df.groupby(keys if by_group else NAME_ID).indices
+        dfs = {}
+        for key, label in labels.items():
+            if len(key) != len(keys): continue
+            # empty frames for missing keys, so that the column is still present
+            rows = df.iloc[indices.get(key if by_group else key[0], [])]
+            renamed = {VALUE: label, SOURCE_ID: N._src(label)}
+            dfs[key] = rows.set_index(N.INDEX).drop(columns=keys).rename(columns=renamed)
+        return dfs
+
+    def __add_group_labels(self, labels, keys):
+        group_names = None
+        for name_id, group_id in keys:
+            key = (name_id, group_id)
+            if key not in labels:
+                label = labels[(name_id,)]
+                if group_id:
+                    if group_names is None:
+                        group_names = dict(self.__s.query(ActivityGroup.id, ActivityGroup.name).all())
+                    label = label + ':' + group_names[group_id]
+                labels[key] = label
+
     def by_group(self, owner, *names, like=False):
+        dfs, by_type, ids = {}, defaultdict(dict), []
         for name in names:
             for statistic_name, type_class in self.__name_and_type(name, owner, like):
-                q_group_ids = self.__s.query(distinct(Source.activity_group_id)). \
-                    join(StatisticJournal, StatisticJournal.source_id == Source.id). \
-                    filter(StatisticJournal.statistic_name_id == statistic_name.id)
-                q_group_ids = self.__constrain_journal(q_group_ids)
-                with timing(f'Slow query for group ids\n{q_group_ids}?', self.__warn_over):
-                    activity_group_ids = q_group_ids.all()
-                for row in activity_group_ids:
-                    activity_group_id = row[0]
-                    if activity_group_id:
-                        activity_group = self.__s.query(ActivityGroup). \
-                            filter(ActivityGroup.id == activity_group_id).one()
-                        label = statistic_name.name + ':' + activity_group.name
-                    else:
-                        label = statistic_name.name
-                    log.info(f'Retrieving {label}')
-                    q = self.__s.query(*self.__columns(type_class, label)). \
-                        filter(type_class.statistic_name_id == statistic_name.id). \
-                        join(Source, type_class.source_id == Source.id). \
-                        filter(Source.activity_group_id == activity_group_id)
-                    q = self.__constrain_journal(q).order_by(N.INDEX)
-                    with timing(f'Slow query for {label}?\n{q}', self.__warn_over):
-                        df = read_query(q, index=N.INDEX)
-                    self.__merge(df)
+                if statistic_name.id in ids: continue
+                by_type[type_class][(statistic_name.id,)] = statistic_name.name
+                ids.append(statistic_name.id)
+        for type_class, labels in by_type.items():
+            log.info(f'Retrieving {", ".join(labels.values())} by group')
+            dfs.update(self.__read_journals(type_class, labels, by_group=True))
+        # names in the order requested, then groups (no group first)
+        self.__merge(*(dfs[key] for key in sorted(dfs, key=lambda key: (ids.index(key[0]), key[1]))))
         return self
 
     def __constrain_journal(self, q):
@@ -136,12 +198,22 @@ class Statistics:
                 filter(source.activity_group_id == self.__activity_group.id)
         return q
 
-    def __merge(self, df):
-        if self.__df is None:
-            self.__df = df
-        else:
-            with timing(f'Slow merge of {df.columns}?', self.__warn_over):
-                self.__df = self.__df.join(df, how='outer')
+    def __merge(self, *dfs):
+        if self.__df is not None:
+            dfs = (self.__df,) + dfs
+        if not dfs:
+            return
+        with timing(f'Slow merge of {[list(df.columns) for df in dfs]}?', self.__warn_over):
+            if all(df.index.is_unique for df in dfs):
+                # a single alignment of all frames
+                self.__df = pd.concat(dfs, axis=1, sort=True)
+                self.__df.index.name = N.INDEX
+            else:
+                # duplicate times need the cross product from join
+                df = dfs[0]
+                for other in dfs[1:]:
+                    df = df.join(other, how='outer')
+                self.__df = df
 
     def __add_timespan(self):
         self.__df[N.TIMESPAN_ID] = np.nan
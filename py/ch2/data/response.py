@@ -5,7 +5,7 @@ from logging import getLogger
 
 import numpy as np
 from math import exp
-from pandas import DataFrame, Series
+from pandas import DataFrame, Series, date_range
 from scipy import optimize
 
 from .lib import decay_params, inplace_decay
@@ -25,11 +25,16 @@ DIGITS = re.compile(r'(\d+)')
 # Currently model params are log10_period (hours) and log10_start (initial FF value)
 
 
-def sum_to_hour(source, column):
+def sum_to_hour(source, column, start=None):
+    # if start is given (on the hour) the sums are from there (with zeroes where there is no data)
     data = source.resample('1h', label='right').sum()
     data = data.loc[:, [column]]
     data.rename(columns={column: IMPULSE_3600}, inplace=True)
-    initial = DataFrame({IMPULSE_3600: 0}, index=[data.index[0] - dt.timedelta(hours=1)])
+    if start is None:
+        start = data.index[0] - dt.timedelta(hours=1)
+    else:
+        data = data.reindex(date_range(start + dt.timedelta(hours=1), data.index[-1], freq='1h'), fill_value=0)
+    initial = DataFrame({IMPULSE_3600: 0}, index=[start])
     data = initial.append(data, sort=True)
     return data
 
@@ -48,6 +53,17 @@ def calc_response(data, params):
     return response[RESPONSE]
 
 
+def continue_response(data, params, response):
+    # as calc_response, but continuing from a known (unscaled) response at the first time in data
+    # (so only the period is used from params).
+    continued = data.rename(columns={IMPULSE_3600: RESPONSE})  # copy
+    period = 10 ** params[LOG10_PERIOD]
+    decay, alpha = decay_params(period)
+    continued.at[continued.index[0], RESPONSE] = response * alpha
+    inplace_decay(continued, RESPONSE, period)
+    return continued[RESPONSE]
+
+
 def restrict_response(response, performances):
     # we're only interested in the FF model at the times that correspond to performance measurements
     return [response.reindex(index=performance.index, method='nearest')
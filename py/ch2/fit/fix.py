@@ -1,5 +1,6 @@
 
 import datetime as dt
+from collections import deque
 from logging import getLogger
 
 import pytz
@@ -251,23 +252,24 @@ def validate_data(data, state, warn=False, force=True):
 
     first_t = True
     try:
-        file_header = FileHeader(data)
-        file_header.validate(data, log)
-        offset = len(file_header)
-        while len(data) - offset > 2:
-            token = token_factory(data[offset:], state)
-            if first_t and state.timestamp:
-                log.info('First timestamp: %s' % state.timestamp)
-                first_t = False
-            record = token.parse_token(warn=warn)
-            if force:
-                record.force()
-            offset += len(token)
-        log.info('Last timestamp:  %s' % state.timestamp)
-        if state.timestamp > dt.datetime.now(tz=pytz.UTC):
-            log.warning('Timestamp in future')
-        checksum = Checksum(data[offset:])
-        checksum.validate(data, log)
+        with memoryview(data) as view:
+            file_header = FileHeader(view)
+            file_header.validate(view, log)
+            offset = len(file_header)
+            while len(view) - offset > 2:
+                token = token_factory(view[offset:], state)
+                if first_t and state.timestamp:
+                    log.info('First timestamp: %s' % state.timestamp)
+                    first_t = False
+                record = token.parse_token(warn=warn)
+                if force:
+                    record.force()
+                offset += len(token)
+            log.info('Last timestamp:  %s' % state.timestamp)
+            if state.timestamp > dt.datetime.now(tz=pytz.UTC):
+                log.warning('Timestamp in future')
+            checksum = Checksum(view[offset:])
+            checksum.validate(view, log)
         log.info('OK')
     except Exception as e:
         log.error(e)
@@ -317,27 +319,43 @@ def offset_tokens(state, data, offset=0, warn=False, force=True):
         raise Exception('Error (%s) at offset %d' % (e, offset))
 
 
-def slurp(state, data, initial_offset, warn=False, force=True, max_record_len=None):
+def slurp(state, data, initial_offset, warn=False, force=True, max_record_len=None, max_back_cnt=3):
     '''
     read as much as possible starting at the given offset.
 
-    return offsets of valid tokens and a flag indicating if all data were read.
+    return the number of valid tokens, the offsets and states after the last few (at most max_back_cnt,
+    which is all that backtracking can use, so memory does not grow with the file) and a flag
+    indicating if all data were read.
     '''
-    offsets_and_states = []
+    count, recent = 0, deque(maxlen=max(max_back_cnt, 1))
     offset = initial_offset
     try:
         for offset, token in offset_tokens(state, data, initial_offset, warn=warn, force=force):
             if max_record_len and len(token) > max_record_len:
                 log.info('Record too large (%d > %d) at offset %d' % (len(token), max_record_len, offset))
-                return offsets_and_states, False
-            offsets_and_states.append((offset, state.copy()))
+                return count, recent, False
+            count += 1
+            recent.append((offset, state.copy()))
         log.info('Read complete from %d' % initial_offset)
-        return offsets_and_states, True
+        return count, recent, True
     except Exception as e:
         log.debug(e)
-        log.debug('Reading from offset %s found %d tokens before %d' %
-                  (initial_offset, len(offsets_and_states), offset))
-        return offsets_and_states, False
+        log.debug('Reading from offset %s found %d tokens before %d' % (initial_offset, count, offset))
+        return count, recent, False
+
+
+def plausible_header(state, data, offset):
+    '''
+    a cheap check of the record header byte so that the search skips offsets where a token
+    cannot start (data for an undefined local message type) without trying to read from there.
+    '''
+    header = data[offset]
+    if header & 0x80:
+        return (header & 0x60) >> 5 in state.definitions
+    elif header & 0x40:
+        return True
+    else:
+        return header & 0x0f in state.definitions
 
 
 class Backtrack(Exception): pass
@@ -353,42 +371,43 @@ def advance(initial_state, data, drop_count=0, initial_offset=0, warn=False, for
 
     "synchronize" means progressively discard data until some number of records smaller than
     some length can be read.
+
+    only the states for the last max_back_cnt records are kept, and offsets that cannot start a
+    record are skipped, so memory is bounded and the search is linear in max_fwd_len.
     '''
-    initial_offsets_and_states = [(initial_offset, initial_state.copy())]
-    offsets_and_states, complete = slurp(initial_state, data, initial_offset,
-                                         warn=warn, force=force, max_record_len=max_record_len)
-    if offsets_and_states:
-        log.debug('%d: Read %d records; offset %d to %d' %
-                  (drop_count, len(offsets_and_states), initial_offset, offsets_and_states[-1][0]))
+    count, recent, complete = slurp(initial_state, data, initial_offset, warn=warn, force=force,
+                                    max_record_len=max_record_len, max_back_cnt=max_back_cnt)
+    last_offset = recent[-1][0] if recent else initial_offset
+    if count:
+        log.debug('%d: Read %d records; offset %d to %d' % (drop_count, count, initial_offset, last_offset))
     else:
         log.debug('%d: Did not read any records' % drop_count)
-    offsets_and_states = initial_offsets_and_states + offsets_and_states
     if complete:
         # use explicit offset rather than open interval because need to drop final checksum
-        if len(offsets_and_states) > 1:
-            return [slice( offsets_and_states[0][0], offsets_and_states[-1][0])]
+        if count:
+            return [slice(initial_offset, last_offset)]
         else:
             return []
-    if drop_count and len(offsets_and_states) < min_sync_cnt:  # failing to sync on first read is OK
+    if drop_count and count + 1 < min_sync_cnt:  # failing to sync on first read is OK
         raise Backtrack('Failed to sync at offset %d' % initial_offset)
     if drop_count >= max_drop_cnt:
         raise Backtrack('No more drops')
     for delta in range(1, max_fwd_len):
-        for back_cnt in range(1, min(max_back_cnt + 1, len(offsets_and_states))):
-            offset, state = offsets_and_states[-back_cnt]
+        for back_cnt in range(1, min(max_back_cnt, count) + 1):
+            offset, state = recent[-back_cnt]
             log.debug('Searching forwards from offset %d after dropping %d records' % (offset, back_cnt-1))
             if offset + delta >= len(data):  # > for when a delta of 0 would have done
                 log.info('Exhausted data')
                 return [slice(initial_offset, offset)]
-            else:
+            elif plausible_header(state, data, offset + delta):
                 try:
                     log.debug('%d: Retrying (drop %d, skip %d) at offset %d' %
                               (drop_count, back_cnt-1, delta, offset+delta))
-                    slices = advance(state.copy(), data, drop_count+1, offset+delta,
+                    slices = advance(state.copy(), data, drop_count+1, offset+delta, warn=warn, force=force,
                                      min_sync_cnt=min_sync_cnt, max_record_len=max_record_len,
-                                     max_drop_cnt=max_drop_cnt, max_fwd_len=max_fwd_len)
+                                     max_drop_cnt=max_drop_cnt, max_back_cnt=max_back_cnt,
+                                     max_fwd_len=max_fwd_len)
                     return [slice(initial_offset, offset)] + slices
                 except Backtrack as e:
                     log.debug('%d: Backtrack at (drop %d, skip %d): "%s"' % (drop_count, back_cnt, delta, e))
     raise Backtrack('Search exhausted at %d' % initial_offset)
-
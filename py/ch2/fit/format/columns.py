@@ -0,0 +1,141 @@
+from collections import defaultdict
+from logging import getLogger
+
+import numpy as np
+
+from .records import no_unknown_fields, merge_duplicates, no_bad_values
+from ..profile.fields import CompositeField
+from ...names import U
+
+log = getLogger(__name__)
+TIMESTAMP = 'timestamp'
+SEMICIRCLES = 'semicircles'
+
+
+class Columns(dict):
+    '''
+    The data for a single message type as numpy arrays (one entry per message, in file order),
+    keyed by field name.  The units for each field are in units.
+
+    Only the first value of each field is kept (as in record.value).  Numeric values are floats,
+    with NaN for bad or missing values; other values (mapped enums, strings, dates) are objects,
+    with None for bad or missing values.  Positions are converted from semicircles to degrees and
+    timestamps (datetimes) are in the timestamp column.
+    '''
+
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+        self.units = {}
+
+
+class ColumnBuilder:
+    '''
+    Accumulate the messages of a single type.
+
+    Where all the fields in a definition can be read as columns (simple fields compiled by the
+    Definition, and composites of these) the data are stored and then unpacked for all messages at
+    once, with numpy.  Otherwise (eg dynamic or accumulated fields) the message is parsed as a record.
+    '''
+
+    def __init__(self, name, warn=False):
+        self.name = name
+        self.__warn = warn
+        self.__timestamps = []
+        self.__blocks = defaultdict(lambda: ([], []))  # definition -> (indices, data)
+        self.__rows = []  # (index, record)
+        self.__plans = {}  # definition -> (plan or None, names)
+
+    def add(self, token, state):
+        definition = token.definition
+        plan, names = self.__plan(definition)
+        if plan is not None and not (state.accumulators and any(name in state.accumulators for name in names)):
+            indices, data = self.__blocks[definition]
+            indices.append(len(self.__timestamps))
+            data.append(token.data)
+        else:
+            record = token.parse_token(warn=self.__warn).into(dict, no_unknown_fields, merge_duplicates, no_bad_values)
+            self.__rows.append((len(self.__timestamps), record))
+        self.__timestamps.append(token.timestamp)
+
+    def __plan(self, definition):
+        # a list of (field, format, bad) that can be read as columns (or None), and the names produced
+        if definition not in self.__plans:
+            plan, names = [], set()
+            for field in definition.fields:
+                if field.values is not None:
+                    plan.append((field, field.format, field.bad))
+                    names.add(field.name)
+                elif isinstance(field.field, CompositeField):
+                    compiled = field.field.compile_column(field.count, definition.endian, definition.message)
+                    if not compiled:
+                        plan = None
+                        break
+                    plan.append((field, *compiled))
+                    names.update(field.field.references)
+                elif field.field and field is not definition.timestamp_field:
+                    plan = None
+                    break
+            self.__plans[definition] = (plan, names)
+        return self.__plans[definition]
+
+    def columns(self):
+        columns = Columns(self.name)
+        n = len(self.__timestamps)
+        columns[TIMESTAMP] = np.array(self.__timestamps, dtype=object)
+        columns.units[TIMESTAMP] = U.S
+        for definition, (indices, data) in self.__blocks.items():
+            indices = np.array(indices)
+            for name, (values, units) in self.__unpack(definition, data):
+                self.__column(columns, n, name, units, values.dtype != object)[indices] = values
+            field = definition.timestamp_field
+            if field and field.name != TIMESTAMP:  # timestamp_16 (already used to set the timestamp)
+                self.__column(columns, n, field.name, U.S, False)[indices] = columns[TIMESTAMP][indices]
+        for index, record in self.__rows:
+            for name, (values, units) in record.data.items():
+                if name != TIMESTAMP:
+                    value = values[0]
+                    numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+                    self.__column(columns, n, name, units, numeric)[index] = value
+        for name, units in columns.units.items():
+            if units == SEMICIRCLES and columns[name].dtype != object:
+                columns[name] = columns[name] * 180 / 2**31
+                columns.units[name] = '°'
+        return columns
+
+    @staticmethod
+    def __column(columns, n, name, units, numeric):
+        if name not in columns:
+            columns[name] = np.full(n, np.nan) if numeric else np.full(n, None, dtype=object)
+            columns.units[name] = units
+        elif not numeric and columns[name].dtype != object:
+            missing = np.isnan(columns[name])
+            columns[name] = columns[name].astype(object)
+            columns[name][missing] = None
+        return columns[name]
+
+    def __unpack(self, definition, data):
+        plan, _ = self.__plan(definition)
+        endian = '<>'[definition.endian]
+        data, names = b''.join(data), ['f%d' % i for i in range(len(plan))]
+        offsets = [field.start for field, _, _ in plan]
+        values = np.frombuffer(data, dtype=np.dtype({
+            'names': names, 'offsets': offsets, 'itemsize': definition.size,
+            'formats': [self.__dtype(endian + format[-1], field.count) for field, format, _ in plan]}))
+        # unsigned integers of the same size, to compare with bad values
+        raw = np.frombuffer(data, dtype=np.dtype({
+            'names': names, 'offsets': offsets, 'itemsize': definition.size,
+            'formats': [self.__dtype(endian + 'u%d' % (len(bad) // field.count), field.count)
+                        for field, _, bad in plan]}))
+        for name, (field, format, bad) in zip(names, plan):
+            bad_value = int.from_bytes(bad[:len(bad) // field.count], ['little', 'big'][definition.endian])
+            if isinstance(field.field, CompositeField):
+                yield from field.field.parse_column(values[name], raw[name] == bad_value, definition.message)
+            elif field.count > 1:
+                yield field.field.parse_column(values[name][:, 0], (raw[name] == bad_value).all(axis=1))
+            else:
+                yield field.field.parse_column(values[name], raw[name] == bad_value)
+
+    @staticmethod
+    def __dtype(format, count):
+        return np.dtype(format) if count == 1 else np.dtype((format, (count,)))
@@ -0,0 +1,137 @@
+from bisect import bisect_right, bisect_left
+from collections import namedtuple
+from logging import getLogger
+from os import replace
+from os.path import join, exists
+from pickle import load, dump, UnpicklingError
+
+from .tokens import Definition, DeveloperField, Defined
+from ...common.io import data_hash
+
+log = getLogger(__name__)
+INDEX_VERSION = 1
+DEFAULT_CHECKPOINT = 256
+
+
+class MessageSpan(namedtuple('BaseMessageSpan', 'first_offset, first_timestamp, last_offset, last_timestamp, count')):
+
+    __slots__ = ()
+
+    def extend(self, offset, timestamp):
+        return MessageSpan(self.first_offset, self.first_timestamp, offset, timestamp, self.count + 1)
+
+
+class Index:
+    '''
+    Offsets into a single FIT file that allow parsing to start part-way through.
+
+    setup - offsets of the tokens that modify the parser state (definitions and developer fields).
+            these are replayed (without being returned) before parsing starts at a later offset.
+    checkpoints - (offset, timestamp) pairs for every nth data token, where timestamp is the
+                  timestamp *before* the token at that offset (needed by compressed timestamps).
+    messages - message name to a MessageSpan (first and last offsets and timestamps, count).
+    accumulate - true if any definition uses accumulated fields.  these depend on all earlier values,
+                 so a file with accumulators is always parsed from the start.
+
+    Seeking by time assumes that timestamps increase through the file (see max_delta_t).
+    '''
+
+    def __init__(self, hash, size):
+        self.version = INDEX_VERSION
+        self.hash = hash
+        self.size = size
+        self.setup = []
+        self.checkpoints = []
+        self.messages = {}
+        self.accumulate = False
+
+    def start(self, after_time=None, record_names=None):
+        '''
+        The offset (and associated timestamp) of a checkpoint from which parsing can start and still
+        see all data after the given time and / or with the given names (or None if no seek is possible).
+        '''
+        if self.accumulate or not self.checkpoints:
+            return None
+        offset = None
+        if after_time is not None:
+            # tokens before a checkpoint are no later than its timestamp (if timestamps increase)
+            for checkpoint, timestamp in self.checkpoints:
+                if timestamp is None or timestamp < after_time:
+                    offset = checkpoint
+                else:
+                    break
+        if record_names:
+            spans = [self.messages[name] for name in record_names if name in self.messages]
+            if not spans:
+                return self.checkpoints[-1]  # nothing to see
+            first = min(span.first_offset for span in spans)
+            offset = first if offset is None else max(offset, first)
+        if offset is not None:
+            return self.__checkpoint(offset)
+
+    def __checkpoint(self, offset):
+        i = bisect_right([checkpoint for checkpoint, _ in self.checkpoints], offset) - 1
+        if i >= 0:
+            return self.checkpoints[i]
+
+    def setup_before(self, offset):
+        return self.setup[:bisect_left(self.setup, offset)]
+
+    def __str__(self):
+        return 'Index(%s: %d setup, %d checkpoints, %d messages)' % \
+               (self.hash, len(self.setup), len(self.checkpoints), len(self.messages))
+
+
+def build_index(data, tokens, state, every=DEFAULT_CHECKPOINT):
+    '''
+    Build an index from (offset, token) pairs (typically from parse_data).  Tokens are not parsed
+    into records, so this is (relatively) cheap.
+    '''
+    index = Index(data_hash(data), len(data))
+    n_data, timestamp = 0, None
+    for offset, token in tokens:
+        if isinstance(token, (Definition, DeveloperField)):
+            index.setup.append(offset)
+        elif isinstance(token, Defined):
+            if not n_data % every:
+                index.checkpoints.append((offset, timestamp))
+            n_data += 1
+            name = token.definition.message.name
+            if name in index.messages:
+                index.messages[name] = index.messages[name].extend(offset, token.timestamp)
+            else:
+                index.messages[name] = MessageSpan(offset, token.timestamp, offset, token.timestamp, 1)
+        timestamp = state.timestamp
+    index.accumulate = bool(state.accumulators)
+    log.debug('Built %s' % index)
+    return index
+
+
+def index_path(index_dir, hash):
+    return join(index_dir, hash + '.idx')
+
+
+def load_index(data, index_dir):
+    '''
+    Read a previously saved index (or None).
+    '''
+    path = index_path(index_dir, data_hash(data))
+    if exists(path):
+        try:
+            with open(path, 'rb') as input:
+                index = load(input)
+            if index.version == INDEX_VERSION and index.size == len(data):
+                log.debug('Read %s from %s' % (index, path))
+                return index
+            log.debug('Ignoring stale index at %s' % path)
+        except (UnpicklingError, EOFError, AttributeError) as e:
+            log.warning('Could not read index at %s: %s' % (path, e))
+
+
+def save_index(index, index_dir):
+    path = index_path(index_dir, index.hash)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as output:
+        dump(index, output)
+    replace(tmp_path, path)  # atomic, so concurrent readers never see a partial file
+    log.debug('Wrote %s to %s' % (index, path))
@@ -1,5 +1,7 @@
 from logging import getLogger
 
+from .columns import ColumnBuilder
+from .index import build_index, load_index, save_index
 from .records import restrict_names
 from .tokens import State, FileHeader, token_factory, Checksum
 from ..profile.profile import read_profile
@@ -8,9 +10,17 @@ from ...lib.data import tohex
 log = getLogger(__name__)
 
 
-def parse_data(data, types, messages, no_validate=False, max_delta_t=None):
+def parse_data(data, types, messages, no_validate=False, max_delta_t=None, start=None, index=None):
+    '''
+    tokens are constructed over a memoryview of the data, so slicing at each offset does not copy
+    the remaining bytes (and the data in each token is a view into the original buffer).
+
+    if start (an (offset, timestamp) checkpoint from index.start()) is given then the definitions
+    before that offset are replayed from the index and parsing continues from there.
+    '''
 
     state = State(types, messages, max_delta_t=max_delta_t)
+    data = memoryview(data)
 
     def generator():
         offset = 0
@@ -19,13 +29,16 @@ def parse_data(data, types, messages, no_validate=False, max_delta_t=None):
             yield offset, file_header
             offset = len(file_header)
             file_header.validate(data, log, quiet=no_validate)
+            if start:
+                offset = seek(data, state, start, index)
             while len(data) - offset > 2:
                 token = token_factory(data[offset:], state)
                 yield offset, token
                 offset += len(token)
             checksum = Checksum(data[offset:])
             yield offset, checksum
-            checksum.validate(data, log, quiet=no_validate)
+            if not start:
+                checksum.validate(data, log, quiet=no_validate)
         except Exception as e:
             log.warning('"%s" at offset %d' % (e, offset))
             dump(data, offset)
@@ -34,6 +47,37 @@ def parse_data(data, types, messages, no_validate=False, max_delta_t=None):
     return state, generator()
 
 
+def seek(data, state, start, index):
+    offset, timestamp = start
+    for setup in index.setup_before(offset):
+        token_factory(data[setup:], state)
+    state._timestamp = timestamp  # restore (not validate) the timestamp before the checkpoint
+    log.debug('Seek to offset %d (%s)' % (offset, timestamp))
+    return offset
+
+
+def read_index(data, types, messages, index_dir=None, no_validate=False, max_delta_t=None):
+    '''
+    An Index for the data, read from index_dir if previously saved there (otherwise built and,
+    if index_dir is given, saved).
+    '''
+    index = load_index(data, index_dir) if index_dir else None
+    if not index:
+        state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t)
+        index = build_index(data, tokens, state)
+        if index_dir: save_index(index, index_dir)
+    return index
+
+
+def seek_start(data, types, messages, index_dir, after_time=None, record_names=None,
+               no_validate=False, max_delta_t=None):
+    if index_dir and (after_time is not None or record_names):
+        index = read_index(data, types, messages, index_dir=index_dir,
+                           no_validate=no_validate, max_delta_t=max_delta_t)
+        return index.start(after_time=after_time, record_names=record_names), index
+    return None, None
+
+
 def dump(data, offset, rows=3, blocks=6, block=4):
     for row in range(rows):
         line = '%06d' % offset
@@ -47,10 +91,14 @@ def dump(data, offset, rows=3, blocks=6, block=4):
 
 def filtered_tokens(data,
                     after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
-                    warn=False, no_validate=False, max_delta_t=None, profile_path=None):
+                    warn=False, no_validate=False, max_delta_t=None, profile_path=None,
+                    after_time=None, index_dir=None):
 
     types, messages = read_profile(warn=warn, profile_path=profile_path)
-    state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t)
+    start, index = seek_start(data, types, messages, index_dir, after_time=after_time,
+                              no_validate=no_validate, max_delta_t=max_delta_t)
+    state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t,
+                               start=start, index=index)
 
     def generator():
         first_record = 0 if (after_records is None) else None
@@ -61,22 +109,35 @@ def filtered_tokens(data,
                 first_record = i
                 first_bytes = offset
             if (first_record is not None and (limit_records < 0 or i - first_record < limit_records)) and \
-                    (first_bytes is not None and (limit_bytes < 0 or offset - first_bytes < limit_bytes)):
+                    (first_bytes is not None and (limit_bytes < 0 or offset - first_bytes < limit_bytes)) and \
+                    not before(token, after_time):
                 yield i, offset, token
 
     return types, messages, generator()
 
 
+def before(token, after_time):
+    # data before the first timestamp (eg file_id) count as early
+    return after_time is not None and token.is_user and (token.timestamp is None or token.timestamp < after_time)
+
+
 def filtered_records(data,
                      after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
                      record_names=None, field_names=None,
                      warn=False, no_validate=False, internal=False, max_delta_t=None,
-                     profile_path=None, pipeline=None):
+                     profile_path=None, pipeline=None, after_time=None, index_dir=None):
+    '''
+    With index_dir, after_time and / or record_names are used to seek into the data (see Index),
+    using an index saved in that directory.  Record indices are then counted from the seek.
+    '''
 
     if pipeline is None: pipeline = []
     if field_names: pipeline.append(restrict_names(field_names))
     types, messages = read_profile(warn=warn, profile_path=profile_path)
-    state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t)
+    start, index = seek_start(data, types, messages, index_dir, after_time=after_time, record_names=record_names,
+                              no_validate=no_validate, max_delta_t=max_delta_t)
+    state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t,
+                               start=start, index=index)
 
     def generator():
         first_record = 0 if (after_records is None) else None
@@ -90,8 +151,47 @@ def filtered_records(data,
             if state.accumulators: record = record.force(*pipeline)
             if (internal or token.is_user) and (not record_names or record.name in record_names) and \
                     (first_record is not None and (limit_records < 0 or i - first_record < limit_records)) and \
-                    (first_bytes is not None and (limit_bytes < 0 or offset - first_bytes < limit_bytes)):
+                    (first_bytes is not None and (limit_bytes < 0 or offset - first_bytes < limit_bytes)) and \
+                    not before(token, after_time):
                 if not state.accumulators: record = record.force(*pipeline)
                 yield i, offset, record
 
     return types, messages, generator()
+
+
+def filtered_columns(data, record_names=None, warn=False, no_validate=False, max_delta_t=None, profile_path=None):
+    '''
+    An alternative to filtered_records that returns a dict from message name to Columns (a dict of
+    numpy arrays, one entry per message).  See Columns for details.
+    '''
+
+    types, messages, columns, _ = split_columns(data, record_names, others=False, warn=warn,
+                                                no_validate=no_validate, max_delta_t=max_delta_t,
+                                                profile_path=profile_path)
+    return types, messages, columns
+
+
+def split_columns(data, record_names, others=True, warn=False, no_validate=False, max_delta_t=None,
+                  profile_path=None):
+    '''
+    As filtered_columns, but (with others) the remaining user messages are also returned, as a
+    list of records (as filtered_records), so that the data need only be parsed once.
+    '''
+
+    types, messages = read_profile(warn=warn, profile_path=profile_path)
+    state, tokens = parse_data(data, types, messages, no_validate=no_validate, max_delta_t=max_delta_t)
+
+    builders, records = {}, []
+    for offset, token in tokens:
+        if token.is_user:
+            name = token.definition.message.name
+            if not record_names or name in record_names:
+                if name not in builders:
+                    builders[name] = ColumnBuilder(name, warn=warn)
+                builders[name].add(token, state)
+            elif others:
+                records.append(token.parse_token(warn=warn).force())
+            elif state.accumulators:
+                token.parse_token(warn=warn).force()  # keep accumulators consistent with filtered_records
+
+    return types, messages, dict((name, builder.columns()) for name, builder in builders.items()), records
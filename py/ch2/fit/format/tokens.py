@@ -1,9 +1,11 @@
 
 from abc import abstractmethod
 from collections import defaultdict, Counter
+from functools import lru_cache
 from logging import getLogger
 from re import sub
-from struct import unpack, pack
+from struct import unpack, pack, iter_unpack, calcsize, Struct
+from sys import byteorder
 
 from .records import LazyRecord, merge_duplicates
 from ..profile.fields import TypedField, TIMESTAMP_GLOBAL_TYPE, DynamicField, CompositeField
@@ -41,7 +43,8 @@ class Token:
 
     tag - a simple string describing the type of token (HDR etc)
     is_user - does this contain user data? (alternatively, it;s internal data for parsing)
-    data - the bytes from the input file.
+    data - the bytes from the input file.  when parsing this is usually a memoryview into the
+           original data (no copy), so convert with bytes() before returning as a value.
     '''
 
     __slots__ = ('tag', 'is_user', 'data')
@@ -344,6 +347,9 @@ class Field:
         # set by definition later
         self.start = 0
         self.finish = 0
+        self.values = None  # slice of the values unpacked by the definition's struct
+        self.format = None
+        self.bad = None
 
 
 class Definition(Token):
@@ -354,6 +360,9 @@ class Definition(Token):
 
     This definition is stored in the state so that when that message type is found it can be used to
     parse the data.
+
+    Simple fields are compiled into a single struct so that the data for each message are unpacked
+    with one call (see Message.parse_message).
     '''
 
     def __init__(self, data, state, overhead=6, tag='DFN'):
@@ -400,8 +409,25 @@ class Definition(Token):
                 if isinstance(field.field, DynamicField):
                     self.references.update(field.field.references)
         self.size = offset
+        self.struct = self.__compile_fields(fields)
         return tuple(self.__sorted(fields))
 
+    def __compile_fields(self, fields):
+        format, n_values, compiled = '<>'[self.endian] + 'x', 0, False  # skip header
+        for field in fields:
+            fmt_bad = field.field.compile_field(field.count, self.endian) if field.field and field.count else None
+            if fmt_bad:
+                field.format, field.bad = fmt_bad
+                padding = field.size - calcsize('<' + field.format)
+                format += field.format + ('%dx' % padding if padding else '')
+                field.values = slice(n_values, n_values + field.count)
+                n_values += field.count
+                compiled = True
+            else:
+                format += '%dx' % field.size
+        if compiled:
+            return Struct(format)
+
     def __provided_by(self, field):
         yield field.name
         if isinstance(field.field, CompositeField):
@@ -458,8 +484,8 @@ class Definition(Token):
     def parse_token(self, raw_data=False, **options):
         data = {'local_message_type': ((self.data[0:1],
                                         str(self.local_message_type)), '') if raw_data else self.local_message_type,
-                'reserved': self.data[1:2],
-                'architecture': self.data[2:3],
+                'reserved': bytes(self.data[1:2]),
+                'architecture': bytes(self.data[2:3]),
                 'message_number': ((self.data[3:5], self.message.name), '') if raw_data else self.global_message_no,
                 'no_of_fields': self.data[5:6] if raw_data else self.data[5]}
         if not raw_data:
@@ -502,22 +528,41 @@ class DeveloperDefinition(Definition):
             yield '  %s - dev fld %d/%d' % (tohex(field_data), fdn, ddi)
 
 
+@lru_cache(1)
+def crc_tables():
+    '''
+    The usual byte-at-a-time table for CRC16 (poly 0xa001, reflected) and a second table that
+    combines two steps, so that a little-endian 16 bit word can be processed with a single lookup.
+    '''
+    byte_table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+        byte_table.append(crc)
+    once = [byte_table[crc & 0xff] ^ (crc >> 8) for crc in range(0x10000)]
+    word_table = [byte_table[crc & 0xff] ^ (crc >> 8) for crc in once]
+    return byte_table, word_table
+
+
 class Checksum(ValidateToken):
 
     @staticmethod
     def crc(data):
-
-        CRC = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
-               0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
-
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)  # header repair uses a list
+        byte_table, word_table = crc_tables()
+        view = memoryview(data).cast('B')
+        even = len(view) & ~1
         checksum = 0
-        for byte in data:
-            tmp = CRC[checksum & 0xf]
-            checksum = (checksum >> 4) & 0xfff
-            checksum = checksum ^ tmp ^ CRC[byte & 0xf]
-            tmp = CRC[checksum & 0xf]
-            checksum = (checksum >> 4) & 0xfff
-            checksum = checksum ^ tmp ^ CRC[(byte >> 4) & 0xf]
+        if byteorder == 'little':
+            words = view[:even].cast('H')  # no copy
+        else:
+            words = (word for (word,) in iter_unpack('<H', view[:even]))
+        for word in words:
+            checksum = word_table[checksum ^ word]
+        if even < len(view):
+            checksum = byte_table[(checksum ^ view[even]) & 0xff] ^ (checksum >> 8)
         return checksum
 
     def __init__(self, data):
@@ -6,6 +6,7 @@ from .support import Named
 from ...lib.data import WarnDict
 
 TIMESTAMP_GLOBAL_TYPE = 253
+UNSIGNED = 'BHIQ'  # struct formats
 
 
 class ScaledField(Named):
@@ -49,6 +50,34 @@ class TypedField(ScaledField):
     def parse_field(self, data, count, endian, timestamp, references, message, **options):
         yield from self._parse_and_scale(self.type, data, count, endian, timestamp, **options)
 
+    def compile_field(self, count, endian):
+        '''
+        The struct format and bad value for this field within a compiled Definition (or None).
+        '''
+        if count > 1 and (self._scale != 1 or self._offset != 0):
+            return None  # bad values are handled individually when scaling multiple values
+        return self.type.compile_type(count, endian)
+
+    def parse_unpacked(self, data, values, count, bad, check_bad=True, **options):
+        '''
+        The equivalent of parse_field for values already unpacked by a compiled Definition.
+        '''
+        if check_bad and data[:len(bad)] == bad:
+            yield self.name, (None, self._units)
+        else:
+            yield self.name, (self.type.unpacked_type(values, count, scale=self._scale, offset=self._offset,
+                                                      **options), self._units)
+
+    def parse_column(self, values, bad, scale=None, offset=None, **options):
+        '''
+        The equivalent of parse_unpacked for a numpy array of (first) values, one per message, where bad
+        is a boolean array that marks bad values.
+        '''
+        scale = self._scale if scale is None else scale
+        offset = self._offset if offset is None else offset
+        return self.name, (self.type.unpacked_column(values, bad, scale=scale, offset=offset, **options),
+                           self._units)
+
 
 class RowField(TypedField):
 
@@ -73,6 +102,18 @@ class DelegateField(ScaledField):
         delegate = message.profile_to_field(self.name)
         return delegate.type.n_bytes
 
+    def compile_column(self, n_bits, endian, message):
+        delegate = message.profile_to_field(self.name)
+        if isinstance(delegate, (CompositeField, DynamicField)):
+            return False
+        compiled = delegate.type.compile_type(1, endian)
+        # signed values and truncation would need the bytes
+        return bool(compiled) and compiled[0][-1] in UNSIGNED and len(compiled[1]) * 8 >= n_bits
+
+    def parse_column(self, values, bad, message, **options):
+        delegate = message.profile_to_field(self.name)
+        return delegate.parse_column(values, bad, scale=self._scale, offset=self._offset, **options)
+
 
 class Zip:
 
@@ -110,6 +151,28 @@ class CompositeField(Zip, TypedField):
         for _, field in self._components:
             field.register_accumulator(accumulators)
 
+    def compile_field(self, count, endian):
+        return None
+
+    def compile_column(self, count, endian, message):
+        '''
+        Support for ColumnBuilder, when all components delegate to simple unsigned fields.
+        Returns the struct format and bad value for the composite, or None.
+        '''
+        compiled = self.type.compile_type(count, endian)
+        if count == 1 and compiled and compiled[0][-1] in UNSIGNED and \
+                all(field.compile_column(n_bits, endian, message) for n_bits, field in self._components):
+            return compiled
+
+    def parse_column(self, values, bad, message, **options):
+        '''
+        The equivalent of parse_field for a numpy array of (unsigned) values, one per message.
+        As in parse_field, components are not checked for bad values.
+        '''
+        for n_bits, field in self._components:
+            yield field.parse_column(values & ((1 << n_bits) - 1), bad, message, **options)
+            values = values >> n_bits
+
     def parse_field(self, data, count, endian, timestamp, references, message,
                     rtn_composite=False, check_bad=True, n_bits=None, **options):
         if check_bad and self.type.is_bad(data, count, endian):
@@ -146,6 +209,9 @@ class DynamicField(Zip, RowField):
             else:
                 break
 
+    def compile_field(self, count, endian):
+        return None
+
     def post(self, message, types):
         # fill in values for when mapping is not used
         for (name, value), field in list(self.__dynamic_lookup.items()):
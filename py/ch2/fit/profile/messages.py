@@ -1,7 +1,10 @@
+from io import BytesIO
+from pickle import Pickler, Unpickler, HIGHEST_PROTOCOL
 
 from .fields import Row, MessageField, TypedField
 from .support import Named
 from .support import Rows
+from .types import AbstractType
 from ..format.records import LazyRecord
 from ...lib.data import WarnDict
 
@@ -50,11 +53,19 @@ class Message(Named):
             if name in defn.references and value[0] is not None:
                 references[name] = value
             yield name, value
+        # simple fields are unpacked together (accumulated fields still need the bytes)
+        unpacked = defn.struct.unpack_from(data) if defn.struct else None
+        accumulators = options.get('accumulators')
         for field in defn.fields:
             bytes = data[field.start:field.finish]
             if field.field:
-                for name, value in self._parse_field(
-                        field.field, bytes, field.count, defn.endian, timestamp, references, self, **options):
+                if field.values is not None and not (accumulators and field.name in accumulators):
+                    parsed = field.field.parse_unpacked(bytes, unpacked[field.values], field.count, field.bad,
+                                                        **options)
+                else:
+                    parsed = self._parse_field(
+                        field.field, bytes, field.count, defn.endian, timestamp, references, self, **options)
+                for name, value in parsed:
                     if name in defn.references and value[0] is not None:
                         references[name] = value
                     yield name, value
@@ -118,4 +129,78 @@ class Messages:
             self.__number_to_message[number] = message
             return message
 
+    def all_messages(self):
+        return self.__profile_to_message.values()
+
+
+class PickledMessages:
+    '''
+    A replacement for Messages in the packaged profile.  Each message is pickled separately and only
+    unpickled when first used (typically by a Definition in the file being read).
+
+    The log and types are shared with the rest of the profile, so are referenced by name within the
+    pickled messages.
+    '''
+
+    def __init__(self, log, messages, types):
+        self.__log = log
+        self.__types = types
+        self.__pickled = {}
+        self.__number_to_name = {}
+        for message in messages.all_messages():
+            self.__pickled[message.name] = self.__dumps(message)
+            self.__number_to_name[message.number] = message.name
+        self.__messages = {}
+
+    def __dumps(self, message):
+        log, types = self.__log, self.__types
+
+        class MessagePickler(Pickler):
+
+            def persistent_id(self, obj):
+                if obj is log:
+                    return 'log'
+                elif isinstance(obj, AbstractType) and types.is_type(obj.name) and \
+                        types.profile_to_type(obj.name) is obj:
+                    return 'type', obj.name
+
+        output = BytesIO()
+        MessagePickler(output, protocol=HIGHEST_PROTOCOL).dump(message)
+        return output.getvalue()
+
+    def __loads(self, data):
+        log, types = self.__log, self.__types
+
+        class MessageUnpickler(Unpickler):
+
+            def persistent_load(self, pid):
+                if pid == 'log':
+                    return log
+                else:
+                    return types.profile_to_type(pid[1])
+
+        return MessageUnpickler(BytesIO(data)).load()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_PickledMessages__messages'] = {}
+        return state
+
+    def profile_to_message(self, name):
+        if name not in self.__messages:
+            self.__messages[name] = self.__loads(self.__pickled[name])
+        return self.__messages[name]
+
+    def number_to_message(self, number):
+        try:
+            return self.profile_to_message(self.__number_to_name[number])
+        except KeyError:
+            message = Missing(self.__log, number)
+            self.__number_to_name[number] = message.name
+            self.__messages[message.name] = message
+            return message
+
+    def all_messages(self):
+        return [self.profile_to_message(name) for name in self.__pickled]
+
 
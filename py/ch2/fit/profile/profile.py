@@ -6,7 +6,7 @@ from pickle import load, dump
 import openpyxl as xls
 from pkg_resources import resource_stream
 
-from .messages import Messages
+from .messages import Messages, PickledMessages
 from .support import NullableLog
 from .types import Types
 from ...commands.args import PACKAGE_FIT_PROFILE
@@ -64,7 +64,7 @@ def pickle_profile(in_path, warn=False):
     nlog.set_log(None)
     log.info('Writing to %s' % out_path)
     with open(out_path, 'wb') as output:
-        dump((nlog, types, messages), output)
+        dump((nlog, types, PickledMessages(nlog, messages, types)), output)
     # test loading
     log.info('Test loading from %r' % PROFILE_NAME)
     log.info('Loaded %s, %s' % read_internal_profile())
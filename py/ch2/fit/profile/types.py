@@ -5,6 +5,7 @@ from collections import namedtuple
 from re import compile
 from struct import unpack, pack
 
+import numpy as np
 import pytz
 
 from .support import Named, Rows
@@ -34,6 +35,13 @@ class AbstractType(Named):
     def parse_type(self, bytes, count, endian, timestamp, **options):
         raise NotImplementedError('%s: %s' % (self.__class__.__name__, self.name))
 
+    def compile_type(self, count, endian):
+        '''
+        Types that can be read with a struct return the format (without byte order) and the bytes for a
+        bad value, so that a Definition can unpack a whole message at once.  Otherwise, None.
+        '''
+        return None
+
 
 class SimpleType(AbstractType):
     '''
@@ -66,6 +74,25 @@ class StructSupport(SimpleType):
     def _all_bad(self, data, bad, count):
         return all(bad == data[self.n_bytes*i:self.n_bytes*(i+1)] for i in range(count))
 
+    def _compile(self, formats, bad, count, endian):
+        return formats[endian][1:] % count, bytes(bad[endian]) * count
+
+    # the equivalent of _unpack below for values that were unpacked with the struct from compile_type
+    # (bad values have already been checked and multiple values are never scaled).
+    def unpacked_type(self, values, count, scale=1, offset=0, **options):
+        if (scale == 1 and offset == 0) or self.name == 'enum':   # enums are not scaled
+            return values
+        else:
+            return (values[0] / scale - offset,)
+
+    # the equivalent of unpacked_type for a numpy array of (first) values, one per message.
+    def unpacked_column(self, values, bad, scale=1, offset=0, **options):
+        values = values.astype(float)
+        if not ((scale == 1 and offset == 0) or self.name == 'enum'):
+            values = values / scale - offset
+        values[bad] = np.nan
+        return values
+
     # currently this ignores scale and offset!!!
     def _pack(self, values, formats, count, endian):
         return pack(formats[endian] % count, *values)
@@ -221,6 +248,9 @@ class AutoInteger(StructSupport):
     def is_bad(self, bytes, count, endian):
         return self._all_bad(bytes, self.__bad[endian], count)
 
+    def compile_type(self, count, endian):
+        return self._compile(self.__formats, self.__bad, count, endian)
+
     def parse_type(self, data, count, endian, timestamp, check_bad=True, **options):
         return self._unpack(data, self.__formats, self.__bad, count, endian, check_bad=check_bad, **options)
 
@@ -259,6 +289,9 @@ class Date(AliasInteger):
         if time is not None:
             return timestamp_to_time(time, tzinfo=tzinfo)
 
+    def compile_type(self, count, endian):
+        return None  # values are converted
+
     def parse_type(self, data, count, endian, timestamp, raw_time=False, **options):
         times = super().parse_type(data, count, endian, timestamp, raw_time=raw_time, **options)
         if times and not raw_time:
@@ -300,6 +333,9 @@ class Date16(AliasInteger):
         super().__init__(log, name, 'uint16')
         self.__tzinfo = pytz.UTC if utc else None
 
+    def compile_type(self, count, endian):
+        return None  # values depend on the current timestamp
+
     def convert(self, time, timestamp, tzinfo=pytz.UTC):
         current = time_to_timestamp(timestamp, tzinfo=tzinfo)
         delta = time - (current & 0xffff)
@@ -316,6 +352,9 @@ class Date16(AliasInteger):
             times = tuple(self.convert(time, timestamp, tzinfo=self.__tzinfo) for time in times)
         return times
 
+    def pack_type(self, values, count, endian):
+        return super().pack_type([time_to_timestamp(value) & 0xffff for value in values], count, endian)
+
 
 class AutoFloat(StructSupport):
 
@@ -338,6 +377,9 @@ class AutoFloat(StructSupport):
     def is_bad(self, bytes, count, endian):
         return self._all_bad(bytes, self.__bad[endian], count)
 
+    def compile_type(self, count, endian):
+        return self._compile(self.__formats, self.__bad, count, endian)
+
     def parse_type(self, data, count, endian, timestamp, check_bad=True, **options):
         return self._unpack(data, self.__formats, self.__bad, count, endian, check_bad=check_bad, **options)
 
@@ -377,6 +419,25 @@ class Mapping(AbstractType):
             values = tuple(self.safe_internal_to_profile(value) for value in values)
         return values
 
+    def compile_type(self, count, endian):
+        return self.base_type.compile_type(count, endian)
+
+    def unpacked_type(self, values, count, map_values=True, **options):
+        values = self.base_type.unpacked_type(values, count, **options)
+        if map_values:
+            values = tuple(self.safe_internal_to_profile(value) for value in values)
+        return values
+
+    def unpacked_column(self, values, bad, map_values=True, **options):
+        values = self.base_type.unpacked_column(values, bad, **options)
+        if map_values:
+            mapped = np.full(len(values), None, dtype=object)
+            for value in np.unique(values[~bad]):
+                internal = int(value) if value.is_integer() else value.item()  # scaled values are not mapped
+                mapped[values == value] = self.safe_internal_to_profile(internal)
+            values = mapped
+        return values
+
     def __add_mapping(self, row):
         profile = row.value_name
         internal = self.base_type.profile_to_internal(row.value)
@@ -78,26 +78,30 @@ def summarize(format, data, all_fields=False, all_messages=False, internal=False
 
 
 def summarize_tokens(data, after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
-                     warn=False, no_validate=False, max_delta_t=None, profile_path=None, output=stdout):
+                     warn=False, no_validate=False, max_delta_t=None, profile_path=None,
+                     after_time=None, index_dir=None, output=stdout):
 
     types, messages, tokens = \
         filtered_tokens(data,
                         after_bytes=after_bytes, limit_bytes=limit_bytes,
                         after_records=after_records, limit_records=limit_records,
-                        warn=warn, no_validate=no_validate, max_delta_t=max_delta_t, profile_path=profile_path)
+                        warn=warn, no_validate=no_validate, max_delta_t=max_delta_t, profile_path=profile_path,
+                        after_time=after_time, index_dir=index_dir)
 
     for index, offset, token in tokens:
         print('%03d %05d %s' % (index, offset, token), file=output)
 
 
 def summarize_fields(data, after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
-                     warn=False, no_validate=False, max_delta_t=None, profile_path=None, output=stdout):
+                     warn=False, no_validate=False, max_delta_t=None, profile_path=None,
+                     after_time=None, index_dir=None, output=stdout):
 
     types, messages, tokens = \
         filtered_tokens(data,
                         after_bytes=after_bytes, limit_bytes=limit_bytes,
                         after_records=after_records, limit_records=limit_records,
-                        warn=warn, no_validate=no_validate, max_delta_t=max_delta_t, profile_path=profile_path)
+                        warn=warn, no_validate=no_validate, max_delta_t=max_delta_t, profile_path=profile_path,
+                        after_time=after_time, index_dir=index_dir)
 
     for index, offset, token in tokens:
         print('%03d %05d %s' % (index, offset, token), file=output)
@@ -109,7 +113,7 @@ def summarize_records(data, all_fields=False, all_messages=False, internal=False
                       after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
                       record_names=None, field_names=None,
                       warn=False, no_validate=False, max_delta_t=None, profile_path=None,
-                      width=None, output=stdout):
+                      after_time=None, index_dir=None, width=None, output=stdout):
 
     types, messages, records = \
         filtered_records(data,
@@ -117,7 +121,8 @@ def summarize_records(data, all_fields=False, all_messages=False, internal=False
                          after_records=after_records, limit_records=limit_records,
                          record_names=record_names, field_names=field_names,
                          warn=warn, no_validate=no_validate, internal=internal,
-                         profile_path=profile_path, max_delta_t=max_delta_t, pipeline=[merge_duplicates])
+                         profile_path=profile_path, max_delta_t=max_delta_t, pipeline=[merge_duplicates],
+                         after_time=after_time, index_dir=index_dir)
 
     records = list(records)
     print(file=output)
@@ -128,7 +133,7 @@ def summarize_tables(data, all_fields=False, all_messages=False, internal=False,
                      after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
                      record_names=None, field_names=None,
                      warn=False, no_validate=False, max_delta_t=None, profile_path=None,
-                     width=None, output=stdout):
+                     after_time=None, index_dir=None, width=None, output=stdout):
 
     types, messages, records = \
         filtered_records(data,
@@ -136,7 +141,8 @@ def summarize_tables(data, all_fields=False, all_messages=False, internal=False,
                          after_records=after_records, limit_records=limit_records,
                          record_names=record_names, field_names=field_names,
                          warn=warn, no_validate=no_validate, internal=internal,
-                         profile_path=profile_path, max_delta_t=max_delta_t, pipeline=[merge_duplicates])
+                         profile_path=profile_path, max_delta_t=max_delta_t, pipeline=[merge_duplicates],
+                         after_time=after_time, index_dir=index_dir)
 
     records = list(record[2] for record in records)
     counts = Counter(record.identity for record in records)
@@ -207,11 +213,13 @@ class Matcher:
 
 def summarize_grep(data, grep, name_file=None, match=1, compact=False, context=False, invert=False,
                    after_bytes=None, limit_bytes=-1, after_records=None, limit_records=-1,
-                   warn=False, no_validate=False, max_delta_t=None, profile_path=None, width=80, output=stdout):
+                   warn=False, no_validate=False, max_delta_t=None, profile_path=None,
+                   after_time=None, index_dir=None, width=80, output=stdout):
 
     types, messages, records = \
         filtered_records(data, warn=warn, no_validate=no_validate, profile_path=profile_path,
-                         max_delta_t=max_delta_t, pipeline=[merge_duplicates])
+                         max_delta_t=max_delta_t, pipeline=[merge_duplicates],
+                         after_time=after_time, index_dir=index_dir)
     matchers = [Matcher(pattern) for pattern in grep]
     first, total_matches = True, 0
     first_record = 0 if (after_records is None) else None
@@ -261,12 +269,13 @@ def summarize_grep(data, grep, name_file=None, match=1, compact=False, context=F
 
 def summarize_csv(data, after_bytes=0, limit_bytes=-1, after_records=0, limit_records=-1, internal=False,
                   record_names=None, field_names=None, warn=False, no_header=False, max_delta_t=None,
-                  profile_path=None, output=stdout):
+                  profile_path=None, after_time=None, index_dir=None, output=stdout):
     types, messages, tokens = \
         filtered_tokens(data,
                         after_bytes=after_bytes, limit_bytes=limit_bytes,
                         after_records=after_records, limit_records=limit_records,
-                        warn=warn, no_validate=no_header, max_delta_t=max_delta_t, profile_path=profile_path)
+                        warn=warn, no_validate=no_header, max_delta_t=max_delta_t, profile_path=profile_path,
+                        after_time=after_time, index_dir=index_dir)
     for index, offset, token in tokens:
         if hasattr(token, 'describe_csv'):
             values = ','.join(str(component)
@@ -1,21 +1,49 @@
 import datetime as dt
+from bisect import bisect_left
+from collections import defaultdict
+from heapq import nsmallest, nlargest
 from logging import getLogger
 from re import compile
 
-from sqlalchemy import desc, asc
-
 from .utils import ProcessCalculator, ActivityJournalProcessCalculator
 from ..pipeline import OwnerInMixin
 from ...lib import local_time_to_time
 from ...common.log import log_current_exception
 from ...names import N
-from ...sql import ActivityJournal, Timestamp, StatisticName, StatisticJournal, Achievement, ActivityGroup, Source
+from ...sql import ActivityJournal, Timestamp, StatisticName, StatisticJournal, Achievement, Source
 from ...sql.tables.statistic import STATISTIC_JOURNAL_CLASSES, StatisticJournalFloat
 from ...sql.utils import add
 
 log = getLogger(__name__)
 
 
+class Leaderboard:
+    '''
+    The values for a single statistic and activity group, in time order, with the best values
+    up to each point.  So the best values over all previous time are a lookup, and the best
+    values over a shorter period only need the values in that period.
+    '''
+
+    def __init__(self, rows, less_is_better, k):
+        self.__times = [time for time, _ in rows]
+        self.__values = [value for _, value in rows]
+        self.__best = nsmallest if less_is_better else nlargest
+        self.__k = k
+        self.__prefix = [[]]
+        for value in self.__values:
+            self.__prefix.append(self.__best(k, self.__prefix[-1] + [value]))
+
+    def best(self, start, finish):
+        '''
+        The (up to k) best values, best first, for start <= time < finish.
+        '''
+        lo, hi = bisect_left(self.__times, start), bisect_left(self.__times, finish)
+        if lo == 0:
+            return self.__prefix[hi]
+        else:
+            return self.__best(self.__k, self.__values[lo:hi])
+
+
 class AchievementCalculator(OwnerInMixin, ActivityJournalProcessCalculator):
 
     def _startup(self, s):
@@ -32,6 +60,7 @@ class AchievementCalculator(OwnerInMixin, ActivityJournalProcessCalculator):
         self._append_like(table, s, 'highest', 5, N.CLIMB_DISTANCE, self.owner_in)
         self._append_like(table, s, 'highest', 3, N.MAX_MED_HR_M_ANY, self.owner_in)
         self._table = table
+        self._leaderboards = {}
 
     def _append_like(self, table, s, superlative, score, pattern, owner):
         found = 0
@@ -73,36 +102,39 @@ class AchievementCalculator(OwnerInMixin, ActivityJournalProcessCalculator):
                     add(s, Achievement(text=achievement, sort=score, activity_journal=activity_journal))
                     break  # if month, also week
 
-    def _query_values(self, s, activity_journal, activity_group, statistic_name, days=0):
-        less_is_better = 'min' in statistic_name.summaries
-        order = asc if less_is_better else desc
-        journal_class = STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]
-        q = s.query(journal_class.value).join(Source). \
-            filter(StatisticJournal.statistic_name == statistic_name,
-                   Source.activity_group == activity_group,
-                   StatisticJournal.time >= activity_journal.start - dt.timedelta(days=days),
-                   StatisticJournal.time < activity_journal.finish)
-        if journal_class == StatisticJournalFloat:
-            q = q.filter(journal_class.value != 0.0)
-        q = q.order_by(order(journal_class.value))
-        return q
-
-    def _query_group(self, s, activity_journal, statistic_name):
-        return s.query(ActivityGroup). \
-            join(ActivityJournal). \
-            join(StatisticJournal, StatisticJournal.source_id == ActivityJournal.id). \
-            join(StatisticName). \
-            filter(ActivityJournal.id == activity_journal.id,
-                   StatisticName.id == statistic_name.id).one_or_none()
+    def _get_leaderboards(self, s, statistic_name):
+        '''
+        Leaderboards by activity group id, and the ids of sources with values, for a statistic.
+        These are read once per run (all later calls are lookups).
+        '''
+        if statistic_name.id not in self._leaderboards:
+            less_is_better = 'min' in statistic_name.summaries
+            journal_class = STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]
+            q = s.query(StatisticJournal.time, Source.activity_group_id, journal_class.value, Source.id). \
+                join(Source, StatisticJournal.source_id == Source.id). \
+                filter(StatisticJournal.statistic_name_id == statistic_name.id). \
+                order_by(StatisticJournal.time)
+            rows, source_ids = defaultdict(list), set()
+            for time, activity_group_id, value, source_id in q:
+                source_ids.add(source_id)
+                if value is not None and not (journal_class == StatisticJournalFloat and value == 0.0):
+                    rows[activity_group_id].append((time, value))
+            # 4 so we know something worse
+            self._leaderboards[statistic_name.id] = \
+                ({activity_group_id: Leaderboard(values, less_is_better, 4)
+                  for activity_group_id, values in rows.items()}, source_ids)
+        return self._leaderboards[statistic_name.id]
 
     def _check(self, s, activity_journal, superlative, statistic_name, days, period):
         try:
-            activity_group = self._query_group(s, activity_journal, statistic_name)
-            # 4 so we know something worse
-            best_values = self._query_values(s, activity_journal, activity_group, statistic_name, days). \
-                limit(4).all()
-            best_values = [x[0] for x in best_values]
-            current_value = self._query_values(s, activity_journal, activity_group, statistic_name).limit(1).scalar()
+            leaderboards, source_ids = self._get_leaderboards(s, statistic_name)
+            activity_group = activity_journal.activity_group if activity_journal.id in source_ids else None
+            leaderboard = leaderboards.get(activity_group.id if activity_group else None)
+            if not leaderboard:
+                return 0, None, False
+            best_values = leaderboard.best(activity_journal.start - dt.timedelta(days=days), activity_journal.finish)
+            current_values = leaderboard.best(activity_journal.start, activity_journal.finish)
+            current_value = current_values[0] if current_values else None
             for rank, adjective in enumerate(('%s', '2nd %s', '3rd %s')):
                 description = adjective % superlative
                 # +1 below so we don't give prizes for last
@@ -7,7 +7,6 @@ from sqlalchemy import text, select
 from .utils import ActivityJournalProcessCalculator, DataFrameCalculatorMixin
 from ..pipeline import LoaderMixin
 from ...common.geo import utm_srid
-from ...common.math import is_nan
 from ...data import Statistics
 from ...data.activity import add_delta_azimuth
 from ...data.elevation import smooth_elevation
@@ -55,11 +54,7 @@ class ElevationCalculator(LoaderMixin, DataFrameCalculatorMixin, ActivityJournal
             return None
 
     def _copy_results(self, s, ajournal, loader, df):
-        for time, row in df.iterrows():
-            if N.ELEVATION in row and not is_nan(row[N.ELEVATION]):
-                loader.add_data(N.ELEVATION, ajournal, row[N.ELEVATION], time)
-            if N.GRADE in row and not is_nan(row[N.GRADE]):
-                loader.add_data(N.GRADE, ajournal, row[N.GRADE], time)
+        loader.add_frame(ajournal, df, {N.ELEVATION: N.ELEVATION, N.GRADE: N.GRADE})
         self.__create_postgis(s, ajournal, df)
 
     def __create_postgis(self, s, ajournal, df):
@@ -85,8 +80,7 @@ class ElevationCalculator(LoaderMixin, DataFrameCalculatorMixin, ActivityJournal
 
     def __xyzm(self, df, m):
         if N.ELEVATION in df:
-            for _, row in df.dropna().iterrows():
-                yield row[N.LONGITUDE], row[N.LATITUDE], row[N.ELEVATION], row[m]
+            yield from df.dropna()[[N.LONGITUDE, N.LATITUDE, N.ELEVATION, m]].itertuples(index=False, name=None)
 
     def __create_route(self, s, ajournal, df, name, m):
         log.debug(f'Setting {name}')
@@ -99,8 +93,7 @@ class ElevationCalculator(LoaderMixin, DataFrameCalculatorMixin, ActivityJournal
         return bool(xym)
 
     def __xym(self, df, m):
-        for _, row in df.dropna().iterrows():
-            yield row[N.LONGITUDE], row[N.LATITUDE], row[m]
+        yield from df.dropna()[[N.LONGITUDE, N.LATITUDE, m]].itertuples(index=False, name=None)
 
     def __create_utm_srid(self, s, ajournal):
         table = ActivityJournal.__table__
@@ -5,7 +5,6 @@ from logging import getLogger
 
 from .utils import ProcessCalculator, ActivityGroupProcessCalculator, DataFrameCalculatorMixin
 from ..pipeline import OwnerInMixin, LoaderMixin
-from ...common.math import is_nan
 from ...data import Statistics
 from ...data.impulse import hr_zone, impulse_10
 from ...names import N, T, SPACE
@@ -52,17 +51,13 @@ class ImpulseCalculator(LoaderMixin, OwnerInMixin, DataFrameCalculatorMixin,
         heart_rate_df, fthr_df = data
         hr_zone(heart_rate_df, fthr_df)
         impulse_df = impulse_10(heart_rate_df, self.impulse)
-        # join so that we can iterate over values in time order
+        # join so that values share a single, ordered index
         stats = impulse_df.join(heart_rate_df, how='outer')
         return stats
 
     def _copy_results(self, s, ajournal, loader, stats):
         name_group = self.prefix + SPACE + self.impulse_constant.short_name  # drop activity group as present elsewhere
-        for time, row in stats.iterrows():
-            if N.HR_ZONE in row and not is_nan(row[N.HR_ZONE]):
-                loader.add_data(N.HR_ZONE, ajournal, row[N.HR_ZONE], time)
-            if N.HR_IMPULSE_10 in row and not is_nan(row[N.HR_IMPULSE_10]):
-                loader.add_data(name_group, ajournal, row[N.HR_IMPULSE_10], time)
+        loader.add_frame(ajournal, stats, {N.HR_ZONE: N.HR_ZONE, N.HR_IMPULSE_10: name_group})
         # if there are no values, add a single 1 so we don't re-process
         if not loader:
             loader.add_data(N.HR_ZONE, ajournal, 1, ajournal.start)
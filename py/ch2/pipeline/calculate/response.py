@@ -3,9 +3,11 @@ from collections import namedtuple
 from json import loads
 from logging import getLogger
 
+import numpy as np
+import pandas as pd
 import pytz
 from math import log10
-from sqlalchemy import distinct
+from sqlalchemy import distinct, func
 from sqlalchemy.sql.functions import count
 
 from .utils import ProcessCalculator
@@ -15,10 +17,10 @@ from ...common.date import round_hour, to_time, now, format_timeq
 from ...common.math import is_nan
 from ...common.names import TIME_ZERO
 from ...data import Statistics, present
-from ...data.response import sum_to_hour, calc_response
+from ...data.response import sum_to_hour, calc_response, continue_response
 from ...names import Names as N, SPACE
 from ...sql import StatisticJournal, Composite, StatisticName, Source, Constant, CompositeComponent, \
-    StatisticJournalType
+    StatisticJournalType, StatisticJournalFloat
 from ...sql.tables.source import SourceType
 from ...sql.utils import add
 
@@ -29,22 +31,47 @@ Response = namedtuple('Response', 'src_owner, title, tau_days, start, scale')
 SCALED = 'scaled'
 
 
-class ResponseCalculator(LoaderMixin, OwnerInMixin, ProcessCalculator):
+def scale_impulses(data, finish, coverage=100):
+    '''
+    Add a zero impulse at finish (so that the response extends to then) and scale the impulses by
+    coverage.  Missing columns are added (there may be no new impulses) and missing coverage is
+    filled forwards from the given value.
     '''
-    this is hard to do correctly, incrementally.
+    if data.empty:
+        data = pd.DataFrame(index=pd.DatetimeIndex([], tz=pytz.UTC, name=N.INDEX))
+    else:
+        data = data.copy()
+    for column in (N.HR_IMPULSE_10, N._src(N.HR_IMPULSE_10), N.COVERAGE):
+        if column not in data.columns:
+            data[column] = np.nan
+    data[N.COVERAGE] = data[N.COVERAGE].fillna(method='ffill').fillna(coverage)
+    # coverage is calculated by the loader and seems to reflect records that have location data but not
+    # HR data.  so i guess it makes sense to scale.
+    # i don't remember why / when i added this - it might have been when using an optical monitor?
+    # it seems like a relatively small effect in most cases.
+    data.loc[finish] = {N.HR_IMPULSE_10: 0.0, N._src(N.HR_IMPULSE_10): None, N.COVERAGE: 100}
+    data[SCALED] = data[N.HR_IMPULSE_10] * 100 / data[N.COVERAGE]
+    return data
 
-    for now, we do all or nothing.
 
+class ResponseCalculator(LoaderMixin, OwnerInMixin, ProcessCalculator):
+    '''
     first, we check if the current solution is complete:
     * all sources used (no need to check for gaps - composite chaining should do that)
     * within 3 hours of the current time (if not, we regenerate, padding with zeroes)
 
-    if not complete, we regenerate the whole damn thing.
+    if not complete, and incremental is set, we continue from the last hourly response that does
+    not depend on any new impulse.  the response is a simple decay, so the stored (scaled) value is
+    all the state we need.  composite sources after that point are deleted (which, via the chaining,
+    deletes later responses) and the chain is extended from the last composite that remains.
+
+    otherwise (or if there is no suitable response) we regenerate the whole damn thing.
     '''
 
-    def __init__(self, *args, response_constants=None, prefix=None, **kargs):
+    def __init__(self, *args, response_constants=None, prefix=None, incremental=True, **kargs):
         self.response_constant_names = self._assert('response_constants', response_constants)
         self.prefix = self._assert('prefix', prefix)
+        self.incremental = incremental
         super().__init__(*args, **kargs)
 
     def _startup(self, s):
@@ -84,12 +111,75 @@ class ResponseCalculator(LoaderMixin, OwnerInMixin, ProcessCalculator):
         if missing_recent or missing_sources:
             if missing_recent: log.info('Incomplete coverage (so will re-calculate)')
             if missing_sources: log.info('Additional sources (so will re-calculate)')
+            if self.incremental:
+                restart = self.__restart(s)
+                if restart:
+                    log.info(f'Continuing from {restart}')
+                    return [format_timeq(restart)]
             self._delete(s)
             start = round_hour(self.__start(s), up=False)
             return [format_timeq(start)]
         else:
             return []
 
+    def __restart(self, s):
+        changed = self.__first_new_impulse(s)
+        if changed is not None:
+            self.__delete_after(s, changed)
+        finishes = [self.__last_response(s, constant.short_name) for constant in self.response_constants]
+        if all(finishes) and self.__state(s, min(finishes)):
+            return min(finishes)
+
+    def __used_sources(self, s):
+        return s.query(distinct(CompositeComponent.input_source_id)). \
+            join(Composite, Composite.id == CompositeComponent.output_source_id). \
+            join(StatisticJournal, StatisticJournal.source_id == Composite.id). \
+            join(StatisticName). \
+            filter(StatisticName.owner == self.owner_out)
+
+    def __first_new_impulse(self, s):
+        return s.query(func.min(StatisticJournal.time)). \
+            join(StatisticName). \
+            filter(StatisticName.name == self.prefix + SPACE + N.HR_IMPULSE_10,
+                   StatisticJournal.source_id.notin_(self.__used_sources(s))). \
+            scalar()
+
+    def __delete_after(self, s, time):
+        # responses on the hour include impulses from the hour before, so anything after time is affected.
+        # deleting the composites also deletes any earlier responses that use them (so that the chain
+        # can be extended from the last remaining composite).
+        composite_ids = s.query(distinct(StatisticJournal.source_id)). \
+            join(StatisticName). \
+            filter(StatisticName.owner == self.owner_out,
+                   StatisticJournal.time > time)
+        log.info(f'Deleting responses after {time}')
+        s.query(Source). \
+            filter(Source.id.in_(composite_ids)). \
+            delete(synchronize_session=False)
+        s.commit()
+        Composite.clean(s)
+        s.commit()
+
+    def __last_response(self, s, constant):
+        return s.query(func.max(StatisticJournal.time)). \
+            join(StatisticName). \
+            filter(StatisticName.name == self.prefix + SPACE + constant,
+                   StatisticName.owner == self.owner_out). \
+            scalar()
+
+    def __state(self, s, time):
+        # the responses (unscaled) for each constant at the given time, and the composite they use.
+        rows = s.query(StatisticName.name, StatisticJournalFloat.value, StatisticJournalFloat.source_id). \
+            join(StatisticName, StatisticJournalFloat.statistic_name_id == StatisticName.id). \
+            filter(StatisticName.owner == self.owner_out,
+                   StatisticJournalFloat.time == time).all()
+        values = {name: value for name, value, _ in rows}
+        source_ids = set(source_id for _, _, source_id in rows)
+        names = [self.prefix + SPACE + constant.short_name for constant in self.response_constants]
+        if all(name in values for name in names) and len(source_ids) == 1:
+            return ({name: values[name] / response.scale for name, response in zip(names, self.responses)},
+                    s.query(Composite).filter(Composite.id == source_ids.pop()).one())
+
     def __missing_recent(self, s, constant, now):
         log.debug('Searching for missing recent')
         finish = s.query(StatisticJournal.time). \
@@ -132,58 +222,88 @@ class ResponseCalculator(LoaderMixin, OwnerInMixin, ProcessCalculator):
 
     def _run_one(self, missed):
         with self._config.db.session_context() as s:
-            data = self.__read_data(s)
-            if N.HR_IMPULSE_10 in data.columns and N.COVERAGE in data.columns:
-                # coverage is calculated by the loader and seems to reflect records that have location data but not
-                # HR data.  so i guess it makes sense to scale.
-                # i don't remember why / when i added this - it might have been when using an optical monitor?
-                # it seems like a relatively small effect in most cases.
-                data.loc[now()] = {N.HR_IMPULSE_10: 0.0, N._src(N.HR_IMPULSE_10): None, N.COVERAGE: 100}
-                data[SCALED] = data[N.HR_IMPULSE_10] * 100 / data[N.COVERAGE]
-                all_sources = list(self.__make_sources(s, data))
-                for constant, response in zip(self.response_constants, self.responses):
-                    name = self.prefix + SPACE + constant.short_name
-                    log.info(f'Creating values for {response.title} ({name})')
-                    imp3600 = sum_to_hour(data, SCALED)
-                    params = (log10(response.tau_days * 24),
-                              log10(response.start) if response.start > 0 else 1)
-                    result = calc_response(imp3600, params) * response.scale
-                    loader = self._get_loader(s, add_serial=False)
-                    source, sources = None, list(all_sources)
-                    for time, value in result.iteritems():
-                        # the sources are much more spread out than the response, which is calculated every hour so
-                        # that it is smooth.  so we only increment the source when necessary.
-                        skipped = 0
-                        while sources and time >= sources[0][0]:
-                            source = sources.pop(0)[1]
-                            skipped += 1
-                            if skipped > 1:
-                                log.warning(f'Skipping multiple sources at {time}')
-                        loader.add_data(name, source, value, time)
-                    loader.load()
-
-    def __read_data(self, s):
+            start = to_time(missed)
+            state = self.__state(s, start) if self.incremental else None
+            if state:
+                self.__continue(s, start, *state)
+            else:
+                self.__calculate(s)
+
+    def __calculate(self, s):
+        data = self.__read_data(s)
+        if N.HR_IMPULSE_10 in data.columns and N.COVERAGE in data.columns:
+            data = scale_impulses(data, now())
+            all_sources = list(self.__make_sources(s, data))
+            for constant, response in zip(self.response_constants, self.responses):
+                name = self.prefix + SPACE + constant.short_name
+                log.info(f'Creating values for {response.title} ({name})')
+                imp3600 = sum_to_hour(data, SCALED)
+                params = (log10(response.tau_days * 24),
+                          log10(response.start) if response.start > 0 else 1)
+                result = calc_response(imp3600, params) * response.scale
+                self.__load(s, name, result, all_sources)
+
+    def __continue(self, s, start, responses, prev):
+        # always continue to now (even with no new impulses, the response decays).  the first impulses may
+        # be from an activity that started before start, so coverage starts from the last value before.
+        coverage = self.__coverage_before(s, start)
+        data = scale_impulses(self.__read_data(s, start=start), now(), coverage=100 if coverage is None else coverage)
+        used = [row[0] for row in self.__used_sources(s)]
+        all_sources = list(self.__make_sources(s, data, start=start, prev=prev, used=used))
+        for constant, response in zip(self.response_constants, self.responses):
+            name = self.prefix + SPACE + constant.short_name
+            log.info(f'Extending values for {response.title} ({name}) from {start}')
+            imp3600 = sum_to_hour(data, SCALED, start=start)
+            params = (log10(response.tau_days * 24),)
+            result = continue_response(imp3600, params, responses[name]) * response.scale
+            # the first value is the existing response
+            self.__load(s, name, result.iloc[1:], all_sources)
+
+    def __coverage_before(self, s, time):
+        return s.query(StatisticJournalFloat.value). \
+            join(StatisticName, StatisticJournalFloat.statistic_name_id == StatisticName.id). \
+            filter(StatisticName.name == N._cov(N.HEART_RATE),
+                   StatisticName.owner == ActivityReader,
+                   StatisticJournalFloat.time < time). \
+            order_by(StatisticJournalFloat.time.desc()).limit(1).scalar()
+
+    def __load(self, s, name, result, all_sources):
+        loader = self._get_loader(s, add_serial=False)
+        source, sources = None, list(all_sources)
+        for time, value in result.iteritems():
+            # the sources are much more spread out than the response, which is calculated every hour so
+            # that it is smooth.  so we only increment the source when necessary.
+            skipped = 0
+            while sources and time >= sources[0][0]:
+                source = sources.pop(0)[1]
+                skipped += 1
+                if skipped > 1:
+                    log.warning(f'Skipping multiple sources at {time}')
+            loader.add_data(name, source, value, time)
+        loader.load()
+
+    def __read_data(self, s, start=None):
         from ..owners import ImpulseCalculator
         name = self.prefix + SPACE + N.HR_IMPULSE_10
-        df = Statistics(s, with_source=True).by_name(ImpulseCalculator, name).with_. \
+        df = Statistics(s, start=start, with_source=True).by_name(ImpulseCalculator, name).with_. \
             rename({name: N.HR_IMPULSE_10, N._src(name): N._src(N.HR_IMPULSE_10)}).df
         name = N._cov(N.HEART_RATE)
-        df = Statistics(s).by_name(ActivityReader, name).with_. \
+        df = Statistics(s, start=start).by_name(ActivityReader, name).with_. \
             rename({name: N.COVERAGE}).into(df, tolerance='10s')
         if present(df, N.COVERAGE):
             df[N.COVERAGE].fillna(axis='index', method='ffill', inplace=True)
             df[N.COVERAGE].fillna(100, axis='index', inplace=True)
         return df
 
-    def __make_sources(self, s, data):
-        # this chains forwards from zero, adding a new composite for each new impulse source.
-        # in theory we could reconstruct only missing entries.
+    def __make_sources(self, s, data, start=None, prev=None, used=()):
+        # this chains forwards from prev (or zero), adding a new composite for each new impulse source.
         log.info('Creating sources')
         name = N._src(N.HR_IMPULSE_10)
-        prev = add(s, Composite(n_components=0))
-        yield to_time(0.0), prev
-        # find times where the source changes
-        changes = data.loc[data[name].ne(data[name].shift())]
+        if prev is None:
+            prev, start = add(s, Composite(n_components=0)), to_time(0.0)
+        yield start, prev
+        # find times where the source changes (ignoring sources already in the chain)
+        changes = data.loc[data[name].ne(data[name].shift()) & ~data[name].isin(used)]
         for time, row in changes.iterrows():
             id = row[name]
             if not is_nan(id):
@@ -5,7 +5,7 @@ from sqlalchemy import func, text
 
 from .power import PowerModel
 from .utils import ActivityGroupProcessCalculator, ProcessCalculator
-from ..pipeline import LoaderMixin
+from ..pipeline import LoaderMixin, DB
 from ...common.date import local_time_to_time
 from ...data.sector import find_and_add_sector_journals, add_sector_statistics
 from ...names import simple_name
@@ -21,6 +21,8 @@ class SectorCalculator(LoaderMixin, ActivityGroupProcessCalculator):
     and add associated statistics.
     '''
 
+    resource = DB  # sector matching is done in PostGIS
+
     def __init__(self, *args, power_model=None, **kargs):
         super().__init__(*args, **kargs)
         self.__power_model_ref = power_model
@@ -66,6 +68,8 @@ class SectorCalculator(LoaderMixin, ActivityGroupProcessCalculator):
 
 class NewSectorCalculator(LoaderMixin, ProcessCalculator):
 
+    resource = DB
+
     def __init__(self, *args, activity_group=None, new_sector_id=None, **kargs):
         super().__init__(*args, **kargs)
         self.activity_group = self._assert('activity_group', activity_group)
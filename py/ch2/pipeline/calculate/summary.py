@@ -1,4 +1,5 @@
 
+from collections import defaultdict
 from logging import getLogger
 from random import choice
 
@@ -9,12 +10,14 @@ from ..pipeline import LoaderMixin
 from ...common.date import local_date_to_time
 from ...data.frame import _tables
 from ...names import Summaries as S, simple_name
-from ...sql.tables.source import Interval, Source
+from ...sql.tables.source import Interval
 from ...sql.tables.statistic import StatisticJournal, StatisticName, StatisticMeasure, StatisticJournalInteger, \
     StatisticJournalFloat, TYPE_TO_JOURNAL_CLASS, STATISTIC_JOURNAL_CLASSES, STATISTIC_JOURNAL_TYPES
 
 log = getLogger(__name__)
 
+AGGREGATES = {S.MAX: func.max, S.MIN: func.min, S.SUM: func.sum, S.CNT: func.count, S.AVG: func.avg}
+
 
 def fuzz(n, q):
     # n is number of points, q is quartile (0-4).
@@ -53,64 +56,72 @@ class SummaryCalculator(LoaderMixin, IntervalCalculatorMixin, ProcessCalculator)
         log.debug('Calculating summaries')
         start, finish = local_date_to_time(interval.start), local_date_to_time(interval.finish)
         measures = []
-        for statistic_name in data:
-            summaries = statistic_name.summaries
-            for summary in summaries:
-                value, units = self._calculate_value(s, statistic_name, summary, S.MIN in summaries,
-                                                     start, finish, interval, measures)
-                if value is not None:
-                    title = self.fmt_title(statistic_name.title, summary, self.schedule)
-                    # we need to infer the type
-                    if summary in (S.MAX, S.MIN, S.SUM):
-                        new_type = TYPE_TO_JOURNAL_CLASS[type(value)]
-                    elif summary in (S.AVG,):
-                        new_type = StatisticJournalFloat
-                    else:
-                        new_type = StatisticJournalInteger
-                    new_type = STATISTIC_JOURNAL_TYPES[new_type]
-                    StatisticName.add_if_missing(s, title, new_type, units, None, self.owner_out,
-                                                 self._describe(statistic_name, summary, interval))
-                    loader.add_data(simple_name(title), interval, value, start)
+        for journal_class, statistic_names in self._by_journal_class(data).items():
+            values = self._calculate_values(s, journal_class, statistic_names, start, finish, interval)
+            for statistic_name in statistic_names:
+                summaries = statistic_name.summaries
+                for summary in summaries:
+                    if summary == S.MSR:
+                        continue
+                    # count is zero (rather than null) when there is no data
+                    value = values.get(statistic_name.id, {}).get(summary, 0 if summary == S.CNT else None)
+                    units = None if summary == S.CNT else statistic_name.units
+                    if value is not None:
+                        title = self.fmt_title(statistic_name.title, summary, self.schedule)
+                        # we need to infer the type
+                        if summary in (S.MAX, S.MIN, S.SUM):
+                            new_type = TYPE_TO_JOURNAL_CLASS[type(value)]
+                        elif summary in (S.AVG,):
+                            new_type = StatisticJournalFloat
+                        else:
+                            new_type = StatisticJournalInteger
+                        new_type = STATISTIC_JOURNAL_TYPES[new_type]
+                        StatisticName.add_if_missing(s, title, new_type, units, None, self.owner_out,
+                                                     self._describe(statistic_name, summary, interval))
+                        loader.add_data(simple_name(title), interval, value, start)
+            measured = [statistic_name for statistic_name in statistic_names if S.MSR in statistic_name.summaries]
+            if measured:
+                measures += self._calculate_measures(s, journal_class, measured, start, finish, interval)
         # add and commit these here - what else can we do?
         log.debug(f'Adding {len(measures)} measures')
-        for measure in measures:
-            s.add(measure)
+        if measures:
+            s.execute(inspect(StatisticMeasure).local_table.insert(), measures)
         s.commit()
 
-    def _calculate_value(self, s, statistic_name, summary, order_asc, start_time, finish_time, interval, measures):
+    @staticmethod
+    def _by_journal_class(statistic_names):
+        by_class = defaultdict(list)
+        for statistic_name in statistic_names:
+            by_class[STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]].append(statistic_name)
+        return by_class
 
+    @staticmethod
+    def _constrain(stmt, sjx, statistic_names, start_time, finish_time, interval):
         t = _tables()
-        sjx = inspect(STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]).local_table
-        units = statistic_name.units
         activity_group_id = interval.activity_group.id if interval.activity_group else None
-
-        if summary == S.MAX:
-            result = func.max(sjx.c.value)
-        elif summary == S.MIN:
-            result = func.min(sjx.c.value)
-        elif summary == S.SUM:
-            result = func.sum(sjx.c.value)
-        elif summary == S.CNT:
-            result = func.count(sjx.c.value)
-            units = None
-        elif summary == S.AVG:
-            result = func.avg(sjx.c.value)
-        elif summary == S.MSR:
-            self._calculate_measures(s, statistic_name, order_asc, start_time, finish_time, interval, measures)
-            return None, None
-        else:
-            raise Exception('Bad summary: %s' % summary)
-
-        stmt = select([result]). \
-            select_from(sjx).select_from(t.sj).select_from(t.src). \
+        return stmt.select_from(sjx).select_from(t.sj).select_from(t.src). \
             where(and_(t.sj.c.id == sjx.c.id,
-                       t.sj.c.statistic_name_id == statistic_name.id,
+                       t.sj.c.statistic_name_id.in_([statistic_name.id for statistic_name in statistic_names]),
                        t.sj.c.time >= start_time,
                        t.sj.c.time < finish_time,
                        t.sj.c.source_id == t.src.c.id,
                        t.src.c.activity_group_id == activity_group_id))
 
-        return next(s.connection().execute(stmt))[0], units
+    def _calculate_values(self, s, journal_class, statistic_names, start_time, finish_time, interval):
+        # all summaries for all statistics (of a single type) in a single grouped query
+        t = _tables()
+        sjx = inspect(journal_class).local_table
+        summaries = sorted(set(summary for statistic_name in statistic_names
+                               for summary in statistic_name.summaries if summary != S.MSR))
+        for summary in summaries:
+            if summary not in AGGREGATES:
+                raise Exception('Bad summary: %s' % summary)
+        if not summaries:
+            return {}
+        stmt = select([t.sj.c.statistic_name_id] + [AGGREGATES[summary](sjx.c.value) for summary in summaries])
+        stmt = self._constrain(stmt, sjx, statistic_names, start_time, finish_time, interval). \
+            group_by(t.sj.c.statistic_name_id)
+        return {row[0]: dict(zip(summaries, row[1:])) for row in s.connection().execute(stmt)}
 
     def _describe(self, statistic_name, summary, interval):
         adjective = {S.MAX: 'highest', S.MIN: 'lowest', S.SUM: 'total', S.CNT: 'number of', S.AVG: 'average'}[summary]
@@ -121,29 +132,32 @@ class SummaryCalculator(LoaderMixin, IntervalCalculatorMixin, ProcessCalculator)
             period = 'one ' + period
         return f'The {adjective} {statistic_name.title} over {period}.'
 
-    def _calculate_measures(self, s, statistic_name, order_asc, start_time, finish_time, interval, measures):
-        data = sorted([x for x in
-                       s.query(StatisticJournal).
-                      join(Source).
-                      filter(StatisticJournal.statistic_name == statistic_name,
-                             StatisticJournal.time >= start_time,
-                             StatisticJournal.time < finish_time,
-                             Source.activity_group == interval.activity_group).all()
-                       if x is not None and x.value is not None],
-                      key=lambda x: x.value, reverse=not order_asc)
-        n, local_measures = len(data), []
-        for rank, journal in enumerate(data, start=1):
-            if n > 1:
-                percentile = (n - rank) / (n - 1) * 100
-            else:
-                percentile = 100
-            measure = StatisticMeasure(statistic_journal=journal, source=interval, rank=rank, percentile=percentile)
-            local_measures.append(measure)
-            measures.append(measure)
-        if n > 8:  # avoid overlap in fuzzing (and also, plot individual points in this case)
-            for q in range(5):
-                local_measures[fuzz(n, q)].quartile = q
-        log.debug('Ranked %s' % statistic_name)
+    def _calculate_measures(self, s, journal_class, statistic_names, start_time, finish_time, interval):
+        # ranks (1 is best) from a window function, with one query for each direction of ordering
+        t = _tables()
+        sjx = inspect(journal_class).local_table
+        measures, quartiles = [], {}
+        for order_asc in (True, False):
+            ordered = [statistic_name for statistic_name in statistic_names
+                       if (S.MIN in statistic_name.summaries) == order_asc]
+            if not ordered:
+                continue
+            value = sjx.c.value if order_asc else sjx.c.value.desc()
+            partition = t.sj.c.statistic_name_id
+            stmt = select([t.sj.c.id, t.sj.c.statistic_name_id,
+                           func.row_number().over(partition_by=partition, order_by=[value, t.sj.c.id]),
+                           func.count().over(partition_by=partition)])
+            stmt = self._constrain(stmt, sjx, ordered, start_time, finish_time, interval). \
+                where(sjx.c.value != None)
+            for id, statistic_name_id, rank, n in s.connection().execute(stmt):
+                if statistic_name_id not in quartiles:
+                    # avoid overlap in fuzzing (and also, plot individual points in this case)
+                    quartiles[statistic_name_id] = {fuzz(n, q) + 1: q for q in range(5)} if n > 8 else {}
+                percentile = (n - rank) / (n - 1) * 100 if n > 1 else 100
+                measures.append({'statistic_journal_id': id, 'source_id': interval.id, 'rank': rank,
+                                 'percentile': percentile, 'quartile': quartiles[statistic_name_id].get(rank)})
+        log.debug('Ranked %s' % ', '.join(statistic_name.name for statistic_name in statistic_names))
+        return measures
 
     @classmethod
     def parse_title(cls, name):
@@ -2,22 +2,28 @@ from abc import ABC
 from collections import defaultdict, namedtuple
 from logging import getLogger
 
+import numpy as np
+
 from ..common.date import min_time, max_time
 from ..common.math import is_nan
-from ..sql import StatisticName, Interval, Source
-from ..sql.tables.statistic import STATISTIC_JOURNAL_CLASSES
+from ..sql import StatisticName, Interval, Source, StatisticSeries
+from ..sql.batch import copy_instances
+from ..sql.tables.statistic import STATISTIC_JOURNAL_CLASSES, StatisticJournalFloat, StatisticJournalInteger
 
 log = getLogger(__name__)
 
 
 class Loader(ABC):
 
-    def __init__(self, s, owner, add_serial=True, clear_timestamp=True, batch=True):
+    def __init__(self, s, owner, add_serial=True, clear_timestamp=True, batch=True, copy=True, series=False):
         self._s = s
         self._owner = owner
         self.__serial = 0 if add_serial else None
         self.__clear_timestamp = clear_timestamp
         self.__batch = batch
+        # COPY is postgres only (sqlite is legacy)
+        self.__copy = copy and s.bind.dialect.name == 'postgresql'
+        self.__series = series
 
         self.__statistic_name_cache = dict()
         self.__source_cache = dict()
@@ -31,15 +37,54 @@ class Loader(ABC):
 
     def load(self):
         if self:
-            for type in self._staging:
-                log.debug(f'Adding {len(self._staging[type])} instances of {type}')
-                for instance in self._staging[type]:
-                    self._s.add(instance)
-                self._s.commit()
+            if self.__copy:
+                self.__copy_load()
+            else:
+                self.__orm_load()
+            if self.__series:
+                self.__series_load()
             self._postload()
         else:
             log.warning('No data to load')
 
+    def __orm_load(self):
+        for type in self._staging:
+            log.debug(f'Adding {len(self._staging[type])} instances of {type}')
+            for instance in self._staging[type]:
+                self._s.add(instance)
+            self._s.commit()
+
+    def __copy_load(self):
+        # the ORM is bypassed, so do here what the flush would have done: set foreign keys for
+        # new sources, drop null values and record dirty times (see Source.before_flush)
+        self._s.flush()
+        start, finish = None, None
+        for type in self._staging:
+            instances = [instance for instance in self._staging[type] if instance.value is not None]
+            log.debug(f'Copying {len(instances)} instances of {type}')
+            for instance in instances:
+                instance.source_id = instance.source.id
+                if not isinstance(instance.source, Interval):
+                    start, finish = min_time(start, instance.time), max_time(finish, instance.time)
+            copy_instances(self._s, instances)
+        if start is not None:
+            Interval.record_dirty_times(self._s, start, finish)
+        self._s.commit()
+
+    def __series_load(self):
+        # numeric values are also saved as arrays, one row per name and source (see Statistics)
+        instances = defaultdict(list)
+        for type in (StatisticJournalFloat, StatisticJournalInteger):
+            if type in self._staging:
+                for instance in self._staging[type]:
+                    if instance.value is not None:
+                        instances[(instance.statistic_name, instance.source)].append(instance)
+        log.debug(f'Adding {len(instances)} series')
+        for (statistic_name, source), values in instances.items():
+            StatisticSeries.add(self._s, statistic_name, source,
+                                [instance.time for instance in values], [instance.value for instance in values])
+        self._s.commit()
+
     def __bool__(self):
         return bool(self._staging)
 
@@ -50,17 +95,68 @@ class Loader(ABC):
             self._s.commit()
 
     def add_data(self, name, source, value, time):
-        if name in self.__statistic_name_cache:
-            statistic_name = self.__statistic_name_cache[name]
-        else:
-            statistic_name = StatisticName.from_name(self._s, name, self._owner)
-            self.__statistic_name_cache[name] = statistic_name
-
+        statistic_name = self.__statistic_name(name)
         if is_nan(value):
             raise Exception(f'Bad value for {statistic_name.name}: {value}')
-
-        journal_class = STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]
-
+        serial = self.__next_serial(time)
+        source = self.__source(source)
+        self._start = min_time(self._start, time)
+        self._finish = max_time(self._finish, time)
+        self.__add_instance(statistic_name, STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type],
+                            source, value, time, serial)
+
+    def add_columns(self, source, times, columns):
+        '''
+        Add values for several statistics that share the same (increasing) times.  Columns is a map
+        from statistic name to a numpy array of values (NaN or None for missing values).
+
+        This is equivalent to calling add_data for each value, in time order, but avoids the
+        per-value overhead of looking up names, sources and serials.
+        '''
+        if not len(times):
+            return
+        serials = [self.__next_serial(time) for time in times]
+        source = self.__source(source)
+        self._start = min_time(self._start, times[0])
+        self._finish = max_time(self._finish, times[-1])
+        for name, values in columns.items():
+            statistic_name = self.__statistic_name(name)
+            journal_class = STATISTIC_JOURNAL_CLASSES[statistic_name.statistic_journal_type]
+            if values.dtype == object:
+                present = np.array([not is_nan(value) for value in values], dtype=bool)
+            else:
+                present = ~np.isnan(values)
+            integer, values = journal_class is StatisticJournalInteger, values.tolist()
+            for i in np.flatnonzero(present):
+                value = int(values[i]) if integer else values[i]
+                self.__add_instance(statistic_name, journal_class, source, value, times[i], serials[i])
+
+    def add_frame(self, source, df, names=None):
+        '''
+        Add values from the columns of a dataframe indexed by (increasing) time.  Names is a map from
+        column to statistic name (by default, all columns with their own names); columns that are not
+        present are ignored, as are missing values.
+        '''
+        if names is None:
+            names = {column: column for column in df.columns}
+        names = {column: name for column, name in names.items() if column in df.columns}
+        if names:
+            df = df[list(names)].dropna(how='all')
+            self.add_columns(source, df.index.to_pydatetime(),
+                             {name: df[column].to_numpy() for column, name in names.items()})
+
+    def add_series(self, name, source, series):
+        '''
+        Add values from a series indexed by (increasing) time.
+        '''
+        self.add_frame(source, series.to_frame(name=name))
+
+    def __statistic_name(self, name):
+        if name not in self.__statistic_name_cache:
+            self.__statistic_name_cache[name] = StatisticName.from_name(self._s, name, self._owner)
+        return self.__statistic_name_cache[name]
+
+    def __next_serial(self, time):
         if self.__add_serial:
             if self.__last_time is None:
                 self.__last_time = time
@@ -69,22 +165,24 @@ class Loader(ABC):
                 self.__serial += 1
             elif time < self.__last_time:
                 raise Exception('Time travel - timestamp for statistic decreased')
+        return self.__serial
 
+    def __source(self, source):
         if isinstance(source, Source):
             if source.id not in self.__source_cache:
                 self.__source_cache[source.id] = source
+            return source
         else:
             if source not in self.__source_cache:
                 self.__source_cache[source] = Source.from_id(self._s, source)
-            source = self.__source_cache[source]
+            return self.__source_cache[source]
 
-        self._start = min_time(self._start, time)
-        self._finish = max_time(self._finish, time)
+    def __add_instance(self, statistic_name, journal_class, source, value, time, serial):
 
         # set statistic_name and source (as well as ids) so that we can correctly test in
         # Source for dirty intervals
         instance = journal_class(statistic_name=statistic_name, statistic_name_id=statistic_name.id,
-                                 source=source, source_id=source.id, value=value, time=time, serial=self.__serial)
+                                 source=source, source_id=source.id, value=value, time=time, serial=serial)
 
         if instance.time in self.__by_name_then_time[statistic_name.name]:
             previous = self.__by_name_then_time[statistic_name.name][instance.time]
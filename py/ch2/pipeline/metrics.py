@@ -0,0 +1,103 @@
+from collections import defaultdict
+from logging import getLogger
+from os import getpid
+from resource import getrusage, RUSAGE_SELF
+from time import time
+
+from sqlalchemy.event import listen, remove
+
+from ..common.date import now
+from ..sql import PipelineMetric
+from ..sql.types import short_cls
+
+log = getLogger(__name__)
+
+
+class Metrics:
+    '''
+    Measure wall and CPU time, peak memory, and SQL statements (count, time and rows inserted)
+    while running a pipeline.  SQL is measured for the given engine only (including the COPY
+    used by the Loader, which triggers the same events - see copy_instances).
+    '''
+
+    def __init__(self, engine):
+        self.__engine = engine
+        self.start = None
+        self.wall = self.cpu = self.rss = self.sql = 0
+        self.n_sql = self.n_rows = 0
+
+    @staticmethod
+    def __cpu():
+        usage = getrusage(RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def __before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_start', []).append(time())
+
+    def __after(self, conn, cursor, statement, parameters, context, executemany):
+        self.sql += time() - conn.info['metrics_start'].pop()
+        self.n_sql += 1
+        verb = statement.lstrip()[:6].lower()
+        if verb == 'insert':
+            self.n_rows += max(0, cursor.rowcount)
+        elif verb.startswith('copy'):
+            self.n_rows += len(parameters)  # one row per instance
+
+    def __enter__(self):
+        listen(self.__engine, 'before_cursor_execute', self.__before)
+        listen(self.__engine, 'after_cursor_execute', self.__after)
+        self.start, self.__time, self.__cpu_start = now(), time(), self.__cpu()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wall = time() - self.__time
+        self.cpu = self.__cpu() - self.__cpu_start
+        self.rss = getrusage(RUSAGE_SELF).ru_maxrss / 1024  # KB on linux
+        remove(self.__engine, 'before_cursor_execute', self.__before)
+        remove(self.__engine, 'after_cursor_execute', self.__after)
+
+    def save(self, s, pipeline, n_missing):
+        s.add(PipelineMetric(pipeline_id=pipeline.id, owner=pipeline, pid=getpid(), worker=bool(pipeline.worker),
+                             start=self.start, n_missing=n_missing, wall=self.wall, cpu=self.cpu, rss=self.rss,
+                             n_rows=self.n_rows, n_sql=self.n_sql, sql=self.sql))
+        log.info(f'{pipeline}: {n_missing} missing in {self.wall:.1f}s (CPU {self.cpu:.1f}s, '
+                 f'SQL {self.n_sql} / {self.sql:.1f}s, {self.n_rows} rows, {self.rss:.0f}MB)')
+
+
+def recent_metrics(s, start):
+    return s.query(PipelineMetric).filter(PipelineMetric.start >= start).order_by(PipelineMetric.start).all()
+
+
+def metrics_as_json(metrics):
+    return [{'pipeline': short_cls(metric.owner), 'pipeline_id': metric.pipeline_id, 'pid': metric.pid,
+             'worker': metric.worker, 'start': metric.start.isoformat(), 'n_missing': metric.n_missing,
+             'wall': metric.wall, 'cpu': metric.cpu, 'rss': metric.rss, 'n_rows': metric.n_rows,
+             'n_sql': metric.n_sql, 'sql': metric.sql}
+            for metric in metrics]
+
+
+def metrics_as_trace(metrics):
+    '''
+    Chrome trace event format (load in chrome://tracing or Perfetto).
+    '''
+    return {'traceEvents': [{'name': short_cls(metric.owner), 'cat': 'pipeline', 'ph': 'X',
+                             'ts': int(metric.start.timestamp() * 1e6), 'dur': int(metric.wall * 1e6),
+                             'pid': metric.pid, 'tid': 0,
+                             'args': {'n_missing': metric.n_missing, 'cpu': metric.cpu, 'rss': metric.rss,
+                                      'n_rows': metric.n_rows, 'n_sql': metric.n_sql, 'sql': metric.sql}}
+                            for metric in metrics],
+            'displayTimeUnit': 'ms'}
+
+
+def summarize_metrics(metrics):
+    '''
+    Totals by pipeline class, slowest (by total wall time) first.
+    '''
+    totals = defaultdict(lambda: defaultdict(float))
+    for metric in metrics:
+        total = totals[short_cls(metric.owner)]
+        total['batches'] += 1
+        for name in ('n_missing', 'wall', 'cpu', 'n_rows', 'n_sql', 'sql'):
+            total[name] += getattr(metric, name)
+        total['rss'] = max(total['rss'], metric.rss)
+    return sorted(totals.items(), key=lambda item: item[1]['wall'], reverse=True)
@@ -5,6 +5,7 @@ from logging import getLogger
 from sqlalchemy.sql.functions import count
 
 from .loader import Loader
+from .metrics import Metrics
 from ..commands.args import LOG, WORKER, DEV, PROCESS, CPROFILE
 from ..common.args import mm
 from ..common.global_ import global_dev
@@ -20,6 +21,10 @@ log = getLogger(__name__)
 CPU_FRACTION = 0.9
 MAX_REPEAT = 3
 
+# resource classes, used to limit concurrent workers (see DependencyQueue)
+CPU = 'cpu'
+DB = 'db'
+
 
 def count_statistics(s):
     return s.query(count(StatisticJournal.id)).scalar()
@@ -69,16 +74,27 @@ class ProcessPipeline(BasePipeline):
     * startup(), missing(), command_for_missing() (multiple times, invoking worker threads)
       and shutdown() are called in sequence.  The instance is more like a factory in this case.
     In this way startup and shutdown bracket the entire process and are done just once.
+
+    When scheduling workers, resource is the main limitation on throughput (CPU or DB), memory
+    is an estimate (MB) for a single worker and max_workers (if given) limits the number of
+    workers for this pipeline.  Subclasses can change the defaults and max_workers and memory can
+    also be given in the configuration.
     '''
 
+    resource = CPU
+    memory = 250
+
     def __init__(self, config, *args, owner_out=None, worker=None, id=None, cprofile=None,
-                 **kargs):
+                 max_workers=None, memory=None, **kargs):
         self.__args = args
         self._config = config
         self.owner_out = owner_out or self  # the future owner of any calculated statistics
         self.worker = worker
         self.id = id
         self.cprofile = cprofile
+        self.max_workers = max_workers
+        if memory is not None:
+            self.memory = memory
         dev = mm(DEV) if global_dev() else ''
         self.__ch2 = f'{command_root()} {mm(BASE)} {config.args[BASE]} {dev} {mm(VERBOSITY)} 0'
         super().__init__(**kargs)
@@ -115,14 +131,17 @@ class ProcessPipeline(BasePipeline):
         raise NotImplementedError('_missing(s)')
 
     def run(self):
-        self.startup()
-        if self.worker:
-            missing = self.__args
-        else:
-            missing = [missed.strip('"') for missed in self.missing()]
-        for missed in missing:
-            self._run_one(missed)
-        self.shutdown()
+        with Metrics(self._config.db.engine) as metrics:
+            self.startup()
+            if self.worker:
+                missing = self.__args
+            else:
+                missing = [missed.strip('"') for missed in self.missing()]
+            for missed in missing:
+                self._run_one(missed)
+            self.shutdown()
+        with self._config.db.session_context() as s:
+            metrics.save(s, self, len(missing))
 
     def _run_one(self, missed):
         # this should accept strings
@@ -1,15 +1,25 @@
+import datetime as dt
 from collections import defaultdict
-from logging import getLogger
-from multiprocessing import cpu_count
+from math import ceil
+from logging import getLogger, Logger, FileHandler, Formatter
+from multiprocessing import cpu_count, get_context
+from multiprocessing.connection import wait
+from contextlib import contextmanager
+from os import close, pipe, read, set_blocking
 from os.path import join, exists
+from signal import signal, set_wakeup_fd, SIGCHLD
+from threading import current_thread, main_thread
 from time import sleep
 
-from psutil import NoSuchProcess
+from psutil import NoSuchProcess, Process as PsProcess, virtual_memory
 
 from ..commands.args import LOG, LOG_DIR
 from ..common.date import now, format_seconds, time_to_local_time
-from ..sql import PipelineType, Interval, Pipeline
+from ..common.log import log_current_exception
+from ..sql import PipelineType, Interval, Pipeline, SystemConstant, PipelineCheckpoint
 from ..sql.tables.pipeline import sort_pipelines
+from ..sql.types import short_cls
+from .pipeline import DB
 
 log = getLogger(__name__)
 
@@ -40,7 +50,8 @@ def instantiate_pipeline(pipeline, config, *args, **kargs):
 
 class ProcessRunner:
 
-    def __init__(self, config, pipelines, *args, worker=None, n_cpu=cpu_count(), load=1, **kargs):
+    def __init__(self, config, pipelines, *args, worker=None, n_cpu=cpu_count(), load=1, pool=False, target=60,
+                 max_db=None, max_memory=None, **kargs):
         if worker and len(pipelines) > 1: raise Exception('Worker with multiple pipelines')
         if not pipelines: raise Exception('No pipelines')
         self.__config = config
@@ -48,6 +59,10 @@ class ProcessRunner:
         self.__worker = worker
         self.__n_cpu = n_cpu
         self.__load = load
+        self.__pool = pool
+        self.__target = target
+        self.__max_db = max_db
+        self.__max_memory = max_memory
         self.__args = args
         self.__kargs = kargs
         self.__max_wait = 0
@@ -59,16 +74,37 @@ class ProcessRunner:
             for pipeline in self.__pipelines:
                 self.__run_local(pipeline)
         else:
-            self.__run_commands(DependencyQueue(self.__config, self.__pipelines, self.__kargs))
+            capacity = self.__capacity()
+            # by default, DB-heavy pipelines use at most half the workers and all use at most 80% free memory
+            max_db = self.__max_db or max(1, capacity // 2)
+            max_memory = self.__max_memory or int(0.8 * virtual_memory().available / 2**20)
+            queue = DependencyQueue(self.__config, self.__pipelines, self.__kargs,
+                                    target=self.__target, capacity=capacity,
+                                    limits={DB: max_db}, max_memory=max_memory)
+            if self.__pool:
+                self.__run_pool(queue)
+            else:
+                self.__run_commands(queue)
+
+    def __capacity(self):
+        return max(1, int(self.__n_cpu * self.__load))
 
     def __run_local(self, pipeline):
         log.info(f'Running pipeline {pipeline} locally with {self.__kargs}')
         instantiate_pipeline(pipeline, self.__config, *self.__args,
-                             id=self.__worker, worker=bool(self.__worker), **self.__kargs).run()
+                             id=pipeline.id, worker=bool(self.__worker), **self.__kargs).run()
+        if not self.__worker:
+            # all done, so anything saved by an earlier, interrupted run is out of date
+            with self.__config.db.session_context() as s:
+                PipelineCheckpoint.clear(s, pipeline)
 
     def __run_commands(self, queue):
+        with child_exits() as wakeup:
+            self.__run_commands_until_done(queue, wakeup)
+
+    def __run_commands_until_done(self, queue, wakeup):
         log.info('Scheduling worker pipelines')
-        capacity = max(1, int(self.__n_cpu * self.__load))
+        capacity = self.__capacity()
         pipelines, popens = {}, []
         while True:
             try:
@@ -78,11 +114,11 @@ class ProcessRunner:
                 pipelines[popen] = (pipeline, log_index)
                 popens.append(popen)
                 if len(popens) == capacity:
-                    popens = self._run_til_next(pipelines, popens, queue)
+                    popens = self._run_til_next(pipelines, popens, queue, wakeup)
             except EmptyException:
                 if popens:
                     log.debug('Nothing new to add')
-                    popens = self._run_til_next(pipelines, popens, queue)
+                    popens = self._run_til_next(pipelines, popens, queue, wakeup)
                 else:
                     log.debug('Done')
                     queue.shutdown()
@@ -90,15 +126,59 @@ class ProcessRunner:
                              f'with {self.__max_wait_procs} processes')
                     return
 
-    def _run_til_next(self, pipelines, popens, queue):
+    def __run_pool(self, queue):
+        log.info('Scheduling pipelines on worker pool')
+        capacity = self.__capacity()
+        pool = WorkerPool(self.__config, self.__pipelines, capacity)
+        try:
+            while True:
+                if pool.idle:
+                    try:
+                        pipeline, missing, log_index = queue.pop(command=False)
+                        pool.submit(pipeline, missing, log_index)
+                        continue
+                    except EmptyException:
+                        if not pool.busy:
+                            log.debug('Done')
+                            queue.shutdown()
+                            log.info(f'Maximum wait {format_seconds(self.__max_wait)} for {self.__max_wait_proc} '
+                                     f'with {self.__max_wait_procs} processes')
+                            return
+                        log.debug('Nothing new to add')
+                self._pool_til_next(pool, queue)
+        finally:
+            pool.shutdown()
+
+    def _pool_til_next(self, pool, queue):
+        queue.log()
+        start = now()
+        log.debug('Waiting for a worker to complete')
+        pipeline, log_index, n_busy, error = pool.wait()
+        duration = (now() - start).total_seconds()
+        log.debug(f'Waited {format_seconds(duration)}')
+        if duration > self.__max_wait:
+            self.__max_wait = duration
+            self.__max_wait_procs = n_busy
+            self.__max_wait_proc = str(pipeline)
+        queue.complete(pipeline, log_index, ok=not error)
+        if error:
+            msg = f'Worker for {pipeline} failed with "{error}" see {log_name(pipeline, log_index)} for more info'
+            log.warning(msg)
+            self._copy_log(log_name(pipeline, log_index))
+            raise Exception(msg)
+        else:
+            log.debug(f'Worker for {pipeline} finished successfully')
+
+    def _run_til_next(self, pipelines, popens, queue, wakeup=None):
         queue.log()
         start = now()
         log.debug('Waiting for a subprocess to complete')
         while True:
+            wait_for_child(wakeup)
             for i, popen in enumerate(popens):
                 popen.poll()
-                process = self.__config.get_process(pipelines[popen][0].cls, popen.pid)
                 if popen.returncode is not None:
+                    process = self.__config.get_process(pipelines[popen][0].cls, popen.pid)
                     del popens[i]
                     duration = (now() - start).total_seconds()
                     log.debug(f'Waited {format_seconds(duration)}')
@@ -108,7 +188,7 @@ class ProcessRunner:
                         self.__max_wait_procs = len(pipelines) + 1
                         self.__max_wait_proc = str(pipeline)
                     self.__config.delete_process(pipeline.cls, popen.pid)
-                    queue.complete(pipeline, log_index)
+                    queue.complete(pipeline, log_index, ok=not popen.returncode)
                     if popen.returncode:
                         msg = f'Command "{popen.args}" exited with return code {popen.returncode} ' + \
                               f'see {process.log} for more info'
@@ -119,7 +199,6 @@ class ProcessRunner:
                     else:
                         log.debug(f'Command "{fmt_cmd(popen.args)}" finished successfully')
                         return popens
-            sleep(0.1)
 
     def _abort(self, pipelines, popens):
         for popen in popens:
@@ -146,12 +225,180 @@ class ProcessRunner:
             log.warning(f'Cannot find {path}')
 
 
+@contextmanager
+def child_exits():
+    '''
+    A file descriptor that becomes readable when a child process exits (SIGCHLD, written to a
+    self-pipe), or None outside the main thread (where signals cannot be handled).
+    '''
+    if current_thread() is not main_thread():
+        yield None
+        return
+    wakeup, write = pipe()
+    for fd in (wakeup, write):
+        set_blocking(fd, False)
+    previous_fd = set_wakeup_fd(write)
+    previous_handler = signal(SIGCHLD, lambda signum, frame: None)  # a handler is needed for the wakeup
+    try:
+        yield wakeup
+    finally:
+        signal(SIGCHLD, previous_handler)
+        set_wakeup_fd(previous_fd)
+        close(wakeup)
+        close(write)
+
+
+def wait_for_child(wakeup, timeout=0.1):
+    '''
+    Block until a child process may have exited (see child_exits), or poll every timeout seconds
+    without a wakeup descriptor.  Children are not reaped, so Popen.poll() still sees the return
+    code, and other children are unaffected.  Spurious returns are possible, so the caller must
+    still check.
+    '''
+    if wakeup is None:
+        sleep(timeout)
+    else:
+        wait([wakeup])
+        try:
+            while read(wakeup, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+
+class WorkerPool:
+    '''
+    Long-lived worker processes that run batches of missing values in-process (as
+    ProcessPipeline.run() with worker=True), avoiding the cost of starting a new ch2 command
+    (imports, profile, database engine) for each batch.
+
+    Workers are forked, so inherit the loaded modules, and receive (pipeline id, missing values,
+    log name) over a pipe, replying with None or an error message.  While busy, a worker has an
+    entry in the Process table, as a command would.
+    '''
+
+    def __init__(self, config, pipelines, n):
+        self.__config = config
+        self.__idle = []
+        self.__busy = {}  # connection: (worker, pipeline, log_index)
+        config.db.engine.dispose()  # don't share connections with children
+        context = get_context('fork')
+        for _ in range(n):
+            parent, child = context.Pipe()
+            worker = context.Process(target=pool_worker,
+                                     args=(config, {pipeline.id: pipeline for pipeline in pipelines}, child),
+                                     daemon=True)
+            worker.start()
+            child.close()
+            self.__idle.append((worker, parent))
+        log.debug(f'Started {n} workers')
+
+    @property
+    def idle(self):
+        return bool(self.__idle)
+
+    @property
+    def busy(self):
+        return bool(self.__busy)
+
+    def submit(self, pipeline, missing, log_index):
+        worker, connection = self.__idle.pop()
+        name = log_name(pipeline, log_index)
+        # creation time so that Process can check it is the same process
+        start = dt.datetime.fromtimestamp(PsProcess(worker.pid).create_time(), dt.timezone.utc)
+        self.__config.record_process(pipeline.cls, worker.pid, f'{pipeline.id} {" ".join(missing)}', name,
+                                     constraint=pipeline.id, start=start)
+        log.debug(f'{pipeline}: sending {len(missing)} missing values to PID {worker.pid}')
+        connection.send((pipeline.id, missing, name))
+        self.__busy[connection] = (worker, pipeline, log_index)
+
+    def wait(self):
+        '''
+        Block until a worker completes, returning the pipeline, log index, number of busy workers
+        (before completion) and any error.
+        '''
+        connection = wait(list(self.__busy.keys()))[0]
+        n_busy = len(self.__busy)
+        worker, pipeline, log_index = self.__busy.pop(connection)
+        try:
+            error = connection.recv()
+            self.__idle.append((worker, connection))
+        except EOFError:
+            error = f'PID {worker.pid} exited with code {worker.exitcode}'
+        self.__config.delete_process(pipeline.cls, worker.pid, kill=False)
+        return pipeline, log_index, n_busy, error
+
+    def shutdown(self):
+        for worker, connection in self.__idle:
+            try:
+                connection.send(None)
+            except (OSError, ValueError):
+                worker.terminate()
+        for connection, (worker, pipeline, log_index) in self.__busy.items():
+            log.warning(f'Killing PID {worker.pid} ({pipeline})')
+            worker.terminate()
+            self.__config.delete_process(pipeline.cls, worker.pid, kill=False)
+        for worker, _ in self.__idle:
+            worker.join()
+        for worker, _, _ in self.__busy.values():
+            worker.join()
+        self.__idle, self.__busy = [], {}
+
+
+def pool_worker(config, pipelines, connection):
+    # log each batch to its own file, as a command would
+    loggers = [logger for logger in Logger.manager.loggerDict.values()
+               if isinstance(logger, Logger) and logger.handlers]
+    for logger in loggers:
+        logger.handlers = []
+    while True:
+        task = connection.recv()
+        if task is None:
+            return
+        id, missing, name = task
+        handler = FileHandler(join(config.args._format_path(LOG_DIR), name))
+        handler.setFormatter(Formatter('%(levelname)-8s %(asctime)s: %(message)s'))
+        for logger in loggers:
+            logger.addHandler(handler)
+        try:
+            missing = [missed.strip('"') for missed in missing]
+            instantiate_pipeline(pipelines[id], config, *missing, id=id, worker=True).run()
+            connection.send(None)
+        except Exception as e:
+            log_current_exception()
+            connection.send(str(e))
+        finally:
+            for logger in loggers:
+                logger.removeHandler(handler)
+            handler.close()
+
+
 class EmptyException(Exception): pass
 
 
 class DependencyQueue:
 
-    def __init__(self, config, pipelines, kargs, min_missing=1, max_missing=20, gamma=0.4):
+    '''
+    Batches of missing values are sized to take about target seconds, using the time per value
+    measured in this and earlier runs (saved as a SystemConstant per pipeline class), but
+    are no larger than an equal share across capacity workers, so that work is spread out at the
+    end of a run, or than max_missing, so that command lines stay a reasonable length.  Without a
+    measurement (or target) the batch size depends only on the total number missing (via gamma).
+
+    The missing values for each pipeline are saved (PipelineCheckpoint) and removed as batches
+    succeed, so that if a run is interrupted the next run continues with those that remain,
+    without searching again.  Values saved with different kargs are ignored, and if the earlier
+    search did not complete the pipeline searches again once the resumed values are done.
+    Values from failed batches are removed too, so they cannot block the checkpoint; they are
+    found again by the next search (once the saved values are exhausted), as is new work.
+
+    Batches are only started if the pipeline's max_workers, the limit for its resource class
+    (limits maps class to number of workers) and the total memory (MB) allow.  These are ignored
+    if nothing is running, so that work always progresses.
+    '''
+
+    def __init__(self, config, pipelines, kargs, min_missing=1, max_missing=20, gamma=0.4, target=None, capacity=1,
+                 limits=None, max_memory=None):
         self.__clean_pipelines(pipelines)
         self.__config = config
         self.__blocked = [pipeline for pipeline in pipelines if pipeline.blocked_by]
@@ -159,11 +406,18 @@ class DependencyQueue:
         self.__complete = []
         self.__active = {}  # pipeline: (instance, missing)
         self.__stats = {}  # pipeline: Stats
+        self.__resumed = set()  # pipelines working on values from an earlier, incomplete search
         self.__order = []
         self.__kargs = kargs
         self.__max_missing = max_missing
         self.__min_missing = min_missing
         self.__gamma = gamma
+        self.__target = target
+        self.__capacity = capacity
+        self.__item_seconds = {}  # pipeline: seconds per missing value
+        self.__limits = limits or {}
+        self.__max_memory = max_memory
+        self.__batches = {}  # (pipeline, log_index): missing
         self.__active_log_indices = defaultdict(lambda: set())
         self.__start = now()
         # clear out any junk from previous errors?
@@ -180,14 +434,29 @@ class DependencyQueue:
                     del pipeline.blocked_by[i]
         log.debug('Cleaned pipelines')
 
-    def complete(self, pipeline, log_index=None):
+    def complete(self, pipeline, log_index=None, ok=True):
         # check if completed instance means that a pipeline is complete and, if so,
         # see if that unblocks others
         if log_index is not None:
-            self.__stats[pipeline].finish(log_index)
+            self.__update_item_seconds(pipeline, self.__stats[pipeline].finish(log_index))
             self.__active_log_indices[pipeline].remove(log_index)
+            missing = self.__batches.pop((pipeline, log_index))
+            if not ok:
+                log.warning(f'{pipeline}: {len(missing)} missing values failed (will be found by the next search)')
+            with self.__config.db.session_context() as s:
+                PipelineCheckpoint.done(s, pipeline, missing)
+        if self.__stats[pipeline] and pipeline in self.__resumed:
+            self.__resumed.remove(pipeline)
+            instance, _ = self.__active[pipeline]
+            missing = self.__discover(pipeline, instance)
+            if missing:
+                log.info(f'{pipeline}: {len(missing)} further missing values after resuming')
+                self.__stats[pipeline].extend(len(missing))
+                self.__active[pipeline] = instance, missing
+                return
         if self.__stats[pipeline]:
             log.info(f'{pipeline} complete ({self.__stats[pipeline].done})')
+            self.__save_item_seconds(pipeline)
             self.__complete.append(pipeline)
             instance, missing = self.__active.pop(pipeline)
             if missing: raise Exception(f'Complete pipeline {pipeline} still has missing values {missing}')
@@ -201,16 +470,18 @@ class DependencyQueue:
                     self.__unblocked.append(unblocked)
                     # self.__config.delete_all_processes(unblocked.cls)
 
-    def pop(self):
+    def pop(self, command=True):
         # unblocking takes some time, so do it step by step as we need more
+        # if command is false, the missing values are returned instead of a command line
         # add the new pipeline to the head of active
         while self.__unblocked:
             pipeline = self.__unblocked.pop()
             log.debug(f'Making {pipeline} active')
             instance = instantiate_pipeline(pipeline, self.__config, **self.__kargs)
             instance.startup()
-            missing = instance.missing()
+            missing = self.__missing(pipeline, instance)
             self.__stats[pipeline] = Stats(pipeline, missing)
+            self.__item_seconds[pipeline] = self.__read_item_seconds(pipeline)
             if missing:
                 log.debug(f'{pipeline}: {len(missing)} missing values')
                 self.__active[pipeline] = instance, missing
@@ -224,14 +495,20 @@ class DependencyQueue:
         for _ in range(len(self.__order)):  # at most, try each once
             pipeline = self.__order.pop(0)
             instance, missing = self.__active[pipeline]
-            if missing:
+            if missing and not self.__allowed(pipeline, instance):
+                self.__order.append(pipeline)
+            elif missing:
                 log_index = self.__unused_log_index(pipeline)
                 missing_args, missing = self.__split_missing(pipeline, missing)
-                cmd = instance.command_for_missing(pipeline, missing_args, log_name(pipeline, log_index))
+                if command:
+                    cmd = instance.command_for_missing(pipeline, missing_args, log_name(pipeline, log_index))
+                else:
+                    cmd = missing_args
                 self.__active[pipeline] = instance, missing
                 self.__order.append(pipeline)
                 log.debug(f'{pipeline}: starting batch of {len(missing_args)} missing values')
                 self.__stats[pipeline].start(log_index, len(missing_args))
+                self.__batches[(pipeline, log_index)] = missing_args
                 return pipeline, cmd, log_index
             else:
                 log.debug(f'{pipeline} exhausted')
@@ -239,6 +516,39 @@ class DependencyQueue:
                 self.__order.append(pipeline)
         raise EmptyException()
 
+    def __missing(self, pipeline, instance):
+        with self.__config.db.session_context() as s:
+            missing, discovered = PipelineCheckpoint.outstanding(s, pipeline, self.__kargs)
+        if missing:
+            log.info(f'{pipeline}: resuming with {len(missing)} missing values from previous run')
+            if not discovered:
+                self.__resumed.add(pipeline)
+            return missing
+        else:
+            return self.__discover(pipeline, instance)
+
+    def __discover(self, pipeline, instance):
+        missing = instance.missing()
+        with self.__config.db.session_context() as s:
+            PipelineCheckpoint.save(s, pipeline, missing, self.__kargs)
+        return missing
+
+    def __allowed(self, pipeline, instance):
+        workers = [(self.__active[p][0], self.__stats[p].active) for p in self.__active if self.__stats[p].active]
+        if not workers:
+            return True
+        if instance.max_workers and self.__stats[pipeline].active >= instance.max_workers:
+            log.debug(f'{pipeline}: at limit of {instance.max_workers} workers')
+            return False
+        limit = self.__limits.get(instance.resource)
+        if limit and sum(n for i, n in workers if i.resource == instance.resource) >= limit:
+            log.debug(f'{pipeline}: at limit of {limit} {instance.resource} workers')
+            return False
+        if self.__max_memory and sum(i.memory * n for i, n in workers) + instance.memory > self.__max_memory:
+            log.debug(f'{pipeline}: at limit of {self.__max_memory}MB memory')
+            return False
+        return True
+
     def __unused_log_index(self, pipeline):
         index = 0
         while index in self.__active_log_indices[pipeline]: index += 1
@@ -260,15 +570,42 @@ class DependencyQueue:
         speedup = process_time / clock_time
         log.info(f'Clock time: {format_seconds(clock_time)}; Process time: {format_seconds(process_time)}; '
                  f'Speedup: x{speedup:.1f}')
-        log.info(f'Missing args: min {self.__min_missing}; max {self.__max_missing}; gamma {self.__gamma}')
+        log.info(f'Missing args: min {self.__min_missing}; max {self.__max_missing}; gamma {self.__gamma}; '
+                 f'target {self.__target}; capacity {self.__capacity}')
+        log.info(f'Limits: {self.__limits}; memory {self.__max_memory}MB')
 
     def __split_missing(self, pipeline, missing):
-        # this (min, min) is a bit weird but makes sense, i think
-        n = min(len(missing),
-                max(self.__min_missing,
-                    min(self.__max_missing, int(pow(self.__stats[pipeline].total, self.__gamma)))))
+        item_seconds = self.__item_seconds.get(pipeline)
+        if self.__target and item_seconds:
+            n = min(int(self.__target / item_seconds), ceil(len(missing) / self.__capacity), self.__max_missing)
+            n = min(len(missing), max(self.__min_missing, n))
+        else:
+            # this (min, min) is a bit weird but makes sense, i think
+            n = min(len(missing),
+                    max(self.__min_missing,
+                        min(self.__max_missing, int(pow(self.__stats[pipeline].total, self.__gamma)))))
         return missing[:n], missing[n:]
 
+    @staticmethod
+    def __item_seconds_name(pipeline):
+        return f'{SystemConstant.ITEM_SECONDS}-{short_cls(pipeline.cls)}'
+
+    def __read_item_seconds(self, pipeline):
+        value = self.__config.get_constant(self.__item_seconds_name(pipeline), none=True)
+        return float(value) if value else None
+
+    def __update_item_seconds(self, pipeline, item_seconds, alpha=0.5):
+        previous = self.__item_seconds.get(pipeline)
+        if previous:
+            item_seconds = alpha * item_seconds + (1 - alpha) * previous
+        self.__item_seconds[pipeline] = item_seconds
+        log.debug(f'{pipeline}: {item_seconds:.2f}s per missing value')
+
+    def __save_item_seconds(self, pipeline):
+        if self.__item_seconds.get(pipeline):
+            self.__config.set_constant(self.__item_seconds_name(pipeline), str(self.__item_seconds[pipeline]),
+                                       force=True)
+
     def shutdown(self):
         self.log()
         self.__log_efficiency()
@@ -299,13 +636,21 @@ class Stats:
         self.__size[index] = n
         self.active += 1
 
+    def extend(self, n):
+        self.total += n
+
     def finish(self, index):
+        '''
+        Returns the time per value in the batch.
+        '''
         log.info(f'{self.__pipeline}: {self.__size[index]} completed')
         self.active -= 1
         self.done += self.__size[index]
-        self.duration_individual += (now() - self.__start_individual[index]).total_seconds()
+        duration = (now() - self.__start_individual[index]).total_seconds()
+        self.duration_individual += duration
         if self:
             self.duration_overall = (now() - self.__start_overall).total_seconds()
+        return duration / self.__size[index]
 
     def __bar(self, width):
         solid = int(width * self.done / self.total) if self.total else width
@@ -1,14 +1,16 @@
 from logging import getLogger
 from os.path import splitext, basename
 
-from pygeotile.point import Point
+import numpy as np
 
 from .utils import AbortImportButMarkScanned, ProcessFitReader
 from ..pipeline import LoaderMixin
 from ...commands.args import DEFAULT
 from ...commands.upload import ACTIVITY
-from ...common.date import to_time
+from ...common.geo import mercator_meters
 from ...diary.model import TYPE, EDIT
+from ...fit.format.columns import TIMESTAMP
+from ...fit.format.read import split_columns
 from ...fit.format.records import fix_degrees, merge_duplicates, no_bad_values
 from ...fit.profile.profile import read_fit
 from ...lib.io import split_fit_path
@@ -23,6 +25,7 @@ from ...srtm.bilinear import bilinear_elevation_from_constant
 
 log = getLogger(__name__)
 
+RECORD = 'record'
 
 # duplicate data in
 # /home/andrew/archive/fit/batch/DI_CONNECT/DI-Connect-Fitness/UploadedFiles_0-_Part1/andrew@acooke.org_24715592701_tap-sync-18690-cc1dd93225119215a1ea87c584a974ce.fit
@@ -41,6 +44,9 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
         self.__ajournal = None  # save for coverage
         super().__init__(*args, sub_dir=ACTIVITY, **kargs)
 
+    def _get_loader(self, s, **kargs):
+        return super()._get_loader(s, series=True, **kargs)
+
     def _startup(self, s):
         self.__oracle = bilinear_elevation_from_constant(s)
         super()._startup(s)
@@ -69,10 +75,10 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
 
     def _read_data(self, s, file_scan):
         log.info('Reading activity data from %s' % file_scan)
-        records = self.parse_records(read_fit(file_scan.path))
+        records, columns = self.parse_data(read_fit(file_scan.path))
         kit = self._read_kit(file_scan.path)
-        ajournal, activity_group, first_timestamp = self._create_activity(s, file_scan, kit, records)
-        return ajournal, (ajournal, activity_group, first_timestamp, file_scan, kit, records)
+        ajournal, activity_group, first_timestamp = self._create_activity(s, file_scan, kit, records, columns)
+        return ajournal, (ajournal, activity_group, first_timestamp, file_scan, kit, records, columns)
 
     @staticmethod
     def parse_records(data):
@@ -81,6 +87,17 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
         log.debug('Parsed')
         return records
 
+    @staticmethod
+    def parse_data(data):
+        # a single pass: the per-point data as arrays (see Columns) and other messages as records
+        log.debug('Parsing data')
+        types, messages, columns, records = split_columns(data, [RECORD])
+        if RECORD not in columns:
+            raise AbortImportButMarkScanned(f'No {RECORD} entries')
+        records = ActivityReader.sorted_dicts(records, merge_duplicates, fix_degrees, no_bad_values)
+        log.debug('Parsed')
+        return records, columns[RECORD]
+
     @staticmethod
     def read_sport(path, records):
         try:
@@ -90,16 +107,26 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
             return ActivityReader._first(path, records, 'session').value.sport.lower()
 
     @staticmethod
-    def read_first_timestamp(path, records):
-        return ActivityReader._first(path, records, 'event', 'record').value.timestamp
+    def read_first_timestamp(path, records, columns=None):
+        return ActivityReader._timestamp(path, records, columns, 0, min)
 
     @staticmethod
-    def read_last_timestamp(path, records):
-        return ActivityReader._last(path, records, 'event', 'record').value.timestamp
+    def read_last_timestamp(path, records, columns=None):
+        return ActivityReader._timestamp(path, records, columns, -1, max)
+
+    @staticmethod
+    def _timestamp(path, records, columns, index, extreme):
+        # with columns, records contain no RECORD messages, so include their timestamps separately
+        timestamps = [timestamp for timestamp in columns[TIMESTAMP] if timestamp] if columns else []
+        try:
+            timestamps.append(ActivityReader.assert_contained(path, records, ('event', RECORD), index).value.timestamp)
+        except AbortImportButMarkScanned:
+            if not timestamps: raise
+        return extreme(timestamps)
 
-    def _create_activity(self, s, file_scan, kit, records):
-        first_timestamp = self.read_first_timestamp(file_scan.path, records)
-        last_timestamp = self.read_last_timestamp(file_scan.path, records)
+    def _create_activity(self, s, file_scan, kit, records, columns):
+        first_timestamp = self.read_first_timestamp(file_scan.path, records, columns)
+        last_timestamp = self.read_last_timestamp(file_scan.path, records, columns)
         log.debug(f'Time range: {first_timestamp.timestamp()} - {last_timestamp.timestamp()}')
         sport = self.read_sport(file_scan.path, records)
         activity_group = self._activity_group(s, file_scan.path, sport, self.sport_to_activity, kit)
@@ -177,8 +204,8 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
 
     def _load_data(self, s, loader, data):
 
-        ajournal, activity_group, first_timestamp, file_scan, kit, records = data
-        timespan, warned, logged, last_timestamp = None, 0, 0, to_time(0.0)
+        ajournal, activity_group, first_timestamp, file_scan, kit, records, columns = data
+        timespan = None
 
         log.debug(f'Loading {self.record_to_db}')
 
@@ -190,8 +217,8 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
             return event
 
         have_timespan = any(is_event(record, 'start') for record in records)
-        only_records = list(filter(lambda x: x.name == 'record', records))
-        final_timestamp = only_records[-1].timestamp
+        times, seconds, indices = self._record_times(file_scan, columns)
+        final_timestamp = times[-1]
 
         if kit: loader.add_data(N.KIT, ajournal, kit, ajournal.start)
 
@@ -199,9 +226,10 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
         self.__ajournal = ajournal
 
         if not have_timespan:
-            first_timestamp = only_records[0].timestamp
+            first_timestamp = times[0]
             log.warning('Experimental handling of data without timespans')
             timespan = add(s, ActivityTimespan(activity_journal=ajournal, start=first_timestamp, finish=final_timestamp))
+            ajournal.finish = final_timestamp
 
         for record in records:
 
@@ -213,43 +241,6 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
                                                        start=record.value.timestamp,
                                                        finish=record.value.timestamp))
 
-            elif record.name == 'record':
-                if record.value.timestamp > last_timestamp:
-                    lat, lon, timestamp = None, None, record.value.timestamp
-                    # elapsed time is not customizable because it needs extra processing
-                    loader.add_data(T.ELAPSED_TIME, ajournal,
-                                    (record.value.timestamp - first_timestamp).total_seconds(), timestamp)
-                    # customizable loader
-                    for field, title, units, type in self.record_to_db:
-                        value = record.data.get(field, None)
-                        if logged < 3:
-                            log.debug(f'{title} = {value}')
-                        if value is not None:
-                            value = value[0][0]
-                            if units == U.KM:  # internally everything uses M
-                                value /= 1000
-                            loader.add_data(title, ajournal, value, timestamp)
-                            if title == T.LATITUDE:
-                                lat = value
-                            elif title == T.LONGITUDE:
-                                lon = value
-                    logged += 1
-                    # values derived from lat/lon
-                    if lat is not None and lon is not None:
-                        x, y = Point.from_latitude_longitude(lat, lon).meters
-                        loader.add_data(N.SPHERICAL_MERCATOR_X, ajournal, x, timestamp)
-                        loader.add_data(N.SPHERICAL_MERCATOR_Y, ajournal, y, timestamp)
-                        if self.add_elevation:
-                            elevation = self.__oracle.elevation(lat, lon)
-                            if elevation:
-                                loader.add_data(N.RAW_ELEVATION, ajournal, elevation, timestamp)
-                else:
-                    log.warning('Ignoring duplicate record data for %s at %s - some data may be missing' %
-                                (file_scan.path, record.value.timestamp))
-                last_timestamp = record.value.timestamp
-                if not have_timespan:
-                    ajournal.finish = record.value.timestamp
-
             elif have_timespan and is_event(record, 'stop_all', 'stop'):
                 if timespan:
                     timespan.finish = record.value.timestamp
@@ -262,6 +253,49 @@ class ActivityReader(LoaderMixin, ProcessFitReader):
             log.warning('Cleaning up dangling timespan')
             timespan.finish = final_timestamp
 
+        loader.add_columns(ajournal, times, self._record_values(columns, indices, seconds, first_timestamp))
+
+    @staticmethod
+    def _record_times(file_scan, columns):
+        # sorted, with only the first record at any time
+        seconds = np.array([np.nan if timestamp is None else timestamp.timestamp()
+                            for timestamp in columns[TIMESTAMP]])
+        indices = np.argsort(seconds, kind='stable')
+        indices = indices[~np.isnan(seconds[indices])]
+        unique = np.ones(len(indices), dtype=bool)
+        unique[1:] = np.diff(seconds[indices]) > 0
+        if not unique.all():
+            log.warning(f'Ignoring {np.count_nonzero(~unique)} duplicate records for {file_scan.path} '
+                        f'- some data may be missing')
+        indices = indices[unique]
+        if not len(indices):
+            raise AbortImportButMarkScanned(f'No timestamped {RECORD} entries in {file_scan.path}')
+        return list(columns[TIMESTAMP][indices]), seconds[indices], indices
+
+    def _record_values(self, columns, indices, seconds, first_timestamp):
+        # elapsed time is not customizable because it needs extra processing
+        values = {T.ELAPSED_TIME: seconds - first_timestamp.timestamp()}
+        # customizable loader
+        for field, title, units, type in self.record_to_db:
+            if field in columns:
+                value = columns[field][indices]
+                if units == U.KM:  # internally everything uses M
+                    value = value / 1000
+                values[title] = value
+        # values derived from lat/lon
+        if T.LATITUDE in values and T.LONGITUDE in values:
+            lat, lon = values[T.LATITUDE], values[T.LONGITUDE]
+            if lat.dtype != object and lon.dtype != object:
+                located = ~np.isnan(lat) & ~np.isnan(lon)
+                x, y = np.full(len(lat), np.nan), np.full(len(lat), np.nan)
+                x[located], y[located] = mercator_meters(lat[located], lon[located])
+                values[N.SPHERICAL_MERCATOR_X], values[N.SPHERICAL_MERCATOR_Y] = x, y
+                if self.add_elevation:
+                    elevation = self.__oracle.elevations(lat, lon)
+                    elevation[elevation == 0] = np.nan  # as before, zero is treated as missing
+                    values[N.RAW_ELEVATION] = elevation
+        return values
+
     def _read(self, s, path):
         loader = super()._read(s, path)
         for title, percent in loader.coverage_percentages():
@@ -13,6 +13,8 @@ from ..loader import Loader
 from ..pipeline import LoaderMixin
 from ...common.date import time_to_local_date, format_time, to_time, dates_from, now
 from ...data.frame import read_query
+from ...fit.format.columns import TIMESTAMP
+from ...fit.format.read import split_columns
 from ...fit.format.records import fix_degrees, unpack_single_bytes, merge_duplicates
 from ...fit.profile.profile import read_fit
 from ...names import N, T, U
@@ -91,18 +93,32 @@ class MonitorReader(LoaderMixin, ProcessFitReader):
     def parse_records(data):
         return MonitorReader.read_fit_file(data, merge_duplicates, fix_degrees, unpack_single_bytes)
 
+    @staticmethod
+    def parse_data(data):
+        # a single pass: the monitoring data as arrays (see Columns) and other messages as records
+        types, messages, columns, records = split_columns(data, [MONITORING_ATTR])
+        if MONITORING_ATTR not in columns:
+            raise AbortImportButMarkScanned(f'No {MONITORING_ATTR} entries')
+        records = MonitorReader.sorted_dicts(records, merge_duplicates, fix_degrees, unpack_single_bytes)
+        return records, columns[MONITORING_ATTR]
+
     @staticmethod
     def read_first_timestamp(path, records):
         return MonitorReader._first(path, records, MONITORING_INFO_ATTR).value.timestamp
 
     @staticmethod
-    def read_last_timestamp(path, records):
+    def read_last_timestamp(path, records, columns=None):
+        if columns is not None:
+            # records contain no MONITORING messages
+            timestamps = [timestamp for timestamp in columns[TIMESTAMP] if timestamp]
+            if timestamps:
+                return max(timestamps)
         return MonitorReader._last(path, records, MONITORING_ATTR).value.timestamp
 
     def _read_data(self, s, file_scan):
-        records = self.parse_records(read_fit(file_scan.path))
+        records, columns = self.parse_data(read_fit(file_scan.path))
         first_timestamp = self.read_first_timestamp(file_scan.path, records)
-        last_timestamp = self.read_last_timestamp(file_scan.path, records)
+        last_timestamp = self.read_last_timestamp(file_scan.path, records, columns)
         if first_timestamp == last_timestamp:
             log.warning('File %s is empty (no timespan)' % file_scan)
             raise AbortImportButMarkScanned()
@@ -115,25 +131,26 @@ class MonitorReader(LoaderMixin, ProcessFitReader):
             raise Exception(f'Duplicate for {file_scan.path}')  # should never happen
         mjournal = add(s, MonitorJournal(start=first_timestamp, finish=last_timestamp,
                                          file_hash_id=file_scan.file_hash.id))
-        return mjournal, (first_timestamp, last_timestamp, mjournal, records)
+        return mjournal, (first_timestamp, last_timestamp, mjournal, columns)
 
     def _load_data(self, s, loader, data):
-        first_timestamp, last_timestamp, mjournal, records = data
+        first_timestamp, last_timestamp, mjournal, columns = data
         steps_by_activity = defaultdict(lambda: 0)
-        for record in records:
-            if HEART_RATE_ATTR in record.data and record.data[HEART_RATE_ATTR][0][0]:
-                loader.add_data(N.HEART_RATE, mjournal, record.data[HEART_RATE_ATTR][0][0], record.timestamp)
-            if STEPS_ATTR in record.data:
+        timestamps = columns[TIMESTAMP]
+        heart_rates, steps, activities = (columns.get(name) for name in
+                                          (HEART_RATE_ATTR, STEPS_ATTR, ACTIVITY_TYPE_ATTR))
+        # time order (stable, as records were sorted)
+        for i in sorted((i for i in range(len(timestamps)) if timestamps[i]), key=lambda i: timestamps[i]):
+            if heart_rates is not None and heart_rates[i] > 0:  # false for NaN
+                loader.add_data(N.HEART_RATE, mjournal, int(heart_rates[i]), timestamps[i])
+            if steps is not None and not np.isnan(steps[i]):
                 # we ignore activity type here (used to store it when activity group and statistic name
                 # were mixed together, but never used it anywhere)
-                reset = False
-                for activity, steps in zip(record.data[ACTIVITY_TYPE_ATTR][0], record.data[STEPS_ATTR][0]):
-                    reset = reset or steps < steps_by_activity[activity]
-                if reset: steps_by_activity = defaultdict(lambda: 0)
-                for activity, steps in zip(record.data[ACTIVITY_TYPE_ATTR][0], record.data[STEPS_ATTR][0]):
-                    steps_by_activity[activity] = steps
+                activity = activities[i] if activities is not None else None
+                if steps[i] < steps_by_activity[activity]: steps_by_activity = defaultdict(lambda: 0)
+                steps_by_activity[activity] = int(steps[i])
                 total = sum(steps_by_activity.values())
-                loader.add_data(N.CUMULATIVE_STEPS, mjournal, total, record.timestamp)
+                loader.add_data(N.CUMULATIVE_STEPS, mjournal, total, timestamps[i])
 
     def _shutdown(self, s):
         super()._shutdown(s)
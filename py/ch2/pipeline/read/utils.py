@@ -70,9 +70,12 @@ class ProcessFitReader(ProcessPipeline):
     @staticmethod
     def read_fit_file(data, *options):
         types, messages, records = filtered_records(data)
+        return ProcessFitReader.sorted_dicts((record for _, _, record in records), *options)
+
+    @staticmethod
+    def sorted_dicts(records, *options):
         return [record.as_dict(*options)
-                for _, _, record in sorted(records,
-                                           key=lambda r: r[2].timestamp if r[2].timestamp else to_time(0.0))]
+                for record in sorted(records, key=lambda r: r.timestamp if r.timestamp else to_time(0.0))]
 
     @staticmethod
     def _first(path, records, *names):
@@ -1,5 +1,7 @@
 from weakref import WeakSet
+import datetime as dt
 from collections import defaultdict
+from io import StringIO
 from itertools import groupby
 from logging import getLogger
 
@@ -59,18 +61,9 @@ class BatchLoader:
             self.warning(f'Composite primary key for {mapper}')
         return False
 
-    @staticmethod
-    def __ids(session, mapper, column, n):
-        id_seq_name = f'{mapper.entity.__tablename__}_{column}_seq'
-        schema = mapper.entity.__table__.metadata.schema
-        sequence = Sequence(id_seq_name, schema=schema)
-        return [int(row[0]) for row in session.connection().execute(
-            select([sequence.next_value()]).select_from(text("generate_series(1, :num_values)")),
-            num_values=n)]
-
     def __set_ids(self, session, mapper, column, missing):
         n = len(missing)
-        for id, instance in zip(self.__ids(session, mapper, column, n), missing):
+        for id, instance in zip(next_ids(session, mapper, n), missing):
             setattr(instance, column, id)
         self.rows += 1
 
@@ -111,3 +104,69 @@ class BatchLoader:
         except Exception as e:
             self.error(e)
             raise
+
+
+def next_ids(session, mapper, n):
+    '''
+    Reserve n values from the sequence for the (single, integer) primary key of the mapper.
+    '''
+    column = mapper.primary_key[0].name
+    id_seq_name = f'{mapper.entity.__tablename__}_{column}_seq'
+    schema = mapper.entity.__table__.metadata.schema
+    sequence = Sequence(id_seq_name, schema=schema)
+    return [int(row[0]) for row in session.connection().execute(
+        select([sequence.next_value()]).select_from(text("generate_series(1, :num_values)")),
+        num_values=n)]
+
+
+def copy_escape(value):
+    if value is None:
+        return r'\N'
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, int):
+        return str(int(value))  # IntEnum.__str__ gives the name before python 3.11
+    elif isinstance(value, dt.datetime):
+        return value.isoformat()
+    else:
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_instances(session, instances):
+    '''
+    Insert new instances of a single class using postgres COPY, bypassing the ORM (so no flush
+    events and no objects in the session).  Primary keys are reserved from the sequence and set
+    on the instances.  Joined-table inheritance is supported by copying to each table in turn,
+    starting with the base.
+
+    Foreign keys must already be set as ids (not just relationships) and pending objects that
+    they reference must have been flushed.
+    '''
+    instances = list(instances)
+    if not instances:
+        return
+    mapper = inspect(type(instances[0]))
+    pk = mapper.base_mapper.primary_key[0].name
+    for id, instance in zip(next_ids(session, mapper.base_mapper, len(instances)), instances):
+        setattr(instance, pk, id)
+    dialect = session.bind.dialect
+    connection = session.connection()
+    cursor = connection.connection.cursor()
+    for table in mapper.tables:
+        columns = list(table.columns)
+        keys = [mapper.get_property_by_column(column).key for column in columns]
+        processors = [column.type.bind_processor(dialect) for column in columns]
+        buffer = StringIO()
+        for instance in instances:
+            values = (getattr(instance, key) for key in keys)
+            print('\t'.join(copy_escape(processor(value) if processor else value)
+                            for processor, value in zip(processors, values)), file=buffer)
+        buffer.seek(0)
+        names = ', '.join(f'"{column.name}"' for column in columns)
+        name = f'"{table.schema}"."{table.name}"' if table.schema else f'"{table.name}"'
+        statement = f'copy {name} ({names}) from stdin'
+        # the raw cursor bypasses engine events, so fire them here (eg for Metrics)
+        connection.dispatch.before_cursor_execute(connection, cursor, statement, instances, None, True)
+        cursor.copy_expert(statement, buffer)
+        connection.dispatch.after_cursor_execute(connection, cursor, statement, instances, None, True)
+        log.debug(f'Copied {len(instances)} rows to {table.name}')
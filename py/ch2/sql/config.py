@@ -45,9 +45,13 @@ class Config(BaseConfig):
         with self.db.session_context() as s:
             return Process.run(s, owner, cmd, log_name, constraint=constraint)  # todo change order
 
-    def delete_process(self, owner, pid, delta_seconds=3):
+    def record_process(self, owner, pid, cmd, log_name, constraint=None, start=None):
         with self.db.session_context() as s:
-            Process.delete(s, owner, pid, delta_seconds=delta_seconds)
+            Process.record(s, owner, pid, cmd, log_name, constraint=constraint, start=start)
+
+    def delete_process(self, owner, pid, delta_seconds=3, kill=True):
+        with self.db.session_context() as s:
+            Process.delete(s, owner, pid, delta_seconds=delta_seconds, kill=kill)
 
     def delete_all_processes(self, owner, delta_seconds=3, default=UNDEF, constraint=None):
         with self.default(default):
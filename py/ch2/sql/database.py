@@ -18,8 +18,8 @@ Source,  Interval, Composite, CompositeComponent
 ActivityGroup, ActivityJournal, ActivityTimespan, ActivityBookmark
 DiaryTopic, DiaryTopicJournal, DiaryTopicField,
 ActivityTopic, ActivityTopicJournal, ActivityTopicField,
-StatisticName, StatisticJournal, StatisticJournalInteger, StatisticJournalFloat, StatisticJournalText, StatisticMeasure
-Pipeline
+StatisticName, StatisticJournal, StatisticJournalInteger, StatisticJournalFloat, StatisticJournalText, StatisticMeasure, StatisticSeries
+Pipeline, PipelineCheckpoint, PipelineMetric
 MonitorJournal
 Constant, SystemConstant, Process
 ActivitySimilarity, ActivityNearby
@@ -7,8 +7,9 @@ from .file import FileScan, FileHash
 from .kit import KitGroup, KitItem, KitComponent, KitModel
 from .monitor import MonitorJournal
 from .nearby import ActivitySimilarity, ActivityNearby
-from .pipeline import Pipeline, PipelineType
+from .pipeline import Pipeline, PipelineType, PipelineCheckpoint, PipelineMetric
 from .sector import SectorGroup, Sector, SectorClimb, SectorJournal, SectorType
+from .series import StatisticSeries
 from .source import Source, Interval, NoStatistics, Composite, CompositeComponent
 from .statistic import StatisticName, StatisticJournalFloat, StatisticJournalText, StatisticJournalInteger, \
     StatisticJournalTimestamp, StatisticJournal, StatisticMeasure, StatisticJournalType
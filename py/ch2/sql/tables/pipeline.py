@@ -3,11 +3,11 @@ from enum import IntEnum
 from json import dumps
 from logging import getLogger
 
-from sqlalchemy import Column, Integer, not_, or_, Table, ForeignKey, Text
+from sqlalchemy import Column, Integer, not_, or_, Table, ForeignKey, Text, Index, Float, Boolean
 from sqlalchemy.orm import relationship, joinedload
 
 from ..support import Base
-from ..types import Cls, Json, Sort, short_cls
+from ..types import Cls, Json, Sort, short_cls, ShortCls, UTC
 
 log = getLogger(__name__)
 
@@ -88,6 +88,87 @@ class Pipeline(Base):
         return short_cls(self.cls)
 
 
+class PipelineCheckpoint(Base):
+    '''
+    Missing values for a pipeline that have not yet been processed by a worker.  These are saved
+    when missing values are found, and deleted as batches complete, so that an interrupted run
+    can resume without searching for missing values again (see DependencyQueue).
+
+    The kargs for the run are saved too, and values saved by a run with different kargs are
+    discarded, since they may not be what is missing now.  A final row with no value marks that
+    the search for missing values completed (so a resumed run does not need to search again).
+    '''
+
+    __tablename__ = 'pipeline_checkpoint'
+
+    id = Column(Integer, primary_key=True)  # preserves order
+    pipeline_id = Column(Integer, ForeignKey('pipeline.id', ondelete='cascade'), nullable=False)
+    kargs = Column(Text, nullable=False)  # json
+    missing = Column(Text)  # null for the marker
+    Index('pipeline_checkpoint_missing', pipeline_id, missing)
+
+    @staticmethod
+    def _dump_kargs(kargs):
+        return dumps(kargs or {}, sort_keys=True, default=str)
+
+    @classmethod
+    def outstanding(cls, s, pipeline, kargs):
+        '''
+        The saved missing values and whether the search that found them completed.
+        '''
+        rows = s.query(PipelineCheckpoint.missing, PipelineCheckpoint.kargs). \
+            filter(PipelineCheckpoint.pipeline_id == pipeline.id). \
+            order_by(PipelineCheckpoint.id).all()
+        if rows and any(row[1] != cls._dump_kargs(kargs) for row in rows):
+            log.info(f'Discarding missing values for {pipeline} saved with different kargs')
+            cls.clear(s, pipeline)
+            return [], False
+        return [row[0] for row in rows if row[0] is not None], any(row[0] is None for row in rows)
+
+    @classmethod
+    def save(cls, s, pipeline, missing, kargs):
+        cls.clear(s, pipeline)
+        dumped = cls._dump_kargs(kargs)
+        s.bulk_insert_mappings(PipelineCheckpoint, [{'pipeline_id': pipeline.id, 'kargs': dumped, 'missing': missed}
+                                                    for missed in missing])
+        s.add(PipelineCheckpoint(pipeline_id=pipeline.id, kargs=dumped, missing=None))
+        log.debug(f'Saved {len(missing)} missing values for {pipeline}')
+
+    @classmethod
+    def done(cls, s, pipeline, missing):
+        s.query(PipelineCheckpoint). \
+            filter(PipelineCheckpoint.pipeline_id == pipeline.id,
+                   PipelineCheckpoint.missing.in_(missing)).delete(synchronize_session=False)
+
+    @classmethod
+    def clear(cls, s, pipeline):
+        s.query(PipelineCheckpoint). \
+            filter(PipelineCheckpoint.pipeline_id == pipeline.id).delete(synchronize_session=False)
+
+
+class PipelineMetric(Base):
+    '''
+    Resources used by a single run of a pipeline (a batch of missing values for a worker, or all
+    values for a local run).  See pipeline.metrics.
+    '''
+
+    __tablename__ = 'pipeline_metric'
+
+    id = Column(Integer, primary_key=True)
+    pipeline_id = Column(Integer, ForeignKey('pipeline.id', ondelete='cascade'))
+    owner = Column(ShortCls, nullable=False, index=True)  # pipeline class
+    pid = Column(Integer, nullable=False)
+    worker = Column(Boolean, nullable=False)
+    start = Column(UTC, nullable=False, index=True)
+    n_missing = Column(Integer, nullable=False)
+    wall = Column(Float, nullable=False)  # seconds
+    cpu = Column(Float, nullable=False)  # seconds (user + system)
+    rss = Column(Float, nullable=False)  # peak MB for process (so far)
+    n_rows = Column(Integer, nullable=False)  # inserted
+    n_sql = Column(Integer, nullable=False)
+    sql = Column(Float, nullable=False)  # seconds
+
+
 def sort_pipelines(pipelines):
     '''
     not only does this order pipelines so that, if run in order, none is blocked, it also expands the
@@ -0,0 +1,68 @@
+from io import BytesIO
+from logging import getLogger
+from zlib import compress, decompress
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, Integer, ForeignKey, LargeBinary, UniqueConstraint
+from sqlalchemy.orm import relationship
+
+from ..support import Base
+from ..types import UTC
+
+log = getLogger(__name__)
+
+
+def pack(array):
+    output = BytesIO()
+    np.save(output, array, allow_pickle=False)
+    return compress(output.getvalue())
+
+
+def unpack(data):
+    return np.load(BytesIO(decompress(data)), allow_pickle=False)
+
+
+class StatisticSeries(Base):
+    '''
+    All the (numeric) values for one statistic name from one source, stored as compressed arrays.
+
+    This duplicates StatisticJournal (which remains the primary store) so that the per-sample
+    data for an activity can be read in a single row, without a row (and join) per value.
+    '''
+
+    __tablename__ = 'statistic_series'
+
+    id = Column(Integer, primary_key=True)
+    statistic_name_id = Column(Integer, ForeignKey('statistic_name.id', ondelete='cascade'), nullable=False)
+    statistic_name = relationship('StatisticName')
+    source_id = Column(Integer, ForeignKey('source.id', ondelete='cascade'), nullable=False, index=True)
+    source = relationship('Source')
+    start = Column(UTC, nullable=False)
+    finish = Column(UTC, nullable=False)
+    count = Column(Integer, nullable=False)
+    times = Column(LargeBinary, nullable=False)  # int64 ns since epoch
+    values = Column(LargeBinary, nullable=False)
+    UniqueConstraint(statistic_name_id, source_id)
+
+    @classmethod
+    def add(cls, s, statistic_name, source, times, values):
+        times = pd.to_datetime(times, utc=True)
+        order = np.argsort(times.values)
+        times, values = times[order], np.asarray(values)[order]
+        series = StatisticSeries(statistic_name=statistic_name, source=source,
+                                 start=times[0].to_pydatetime(), finish=times[-1].to_pydatetime(),
+                                 count=len(times), times=pack(times.values.astype(np.int64)), values=pack(values))
+        s.add(series)
+        return series
+
+    def as_df(self, label, with_source=None):
+        '''
+        A dataframe indexed by time with a single column of values (and the source id, if with_source
+        gives the column name), matching the result from querying StatisticJournal.
+        '''
+        index = pd.to_datetime(unpack(self.times), utc=True)
+        df = pd.DataFrame({label: unpack(self.values)}, index=index)
+        if with_source:
+            df[with_source] = self.source_id
+        return df
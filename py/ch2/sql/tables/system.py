@@ -56,6 +56,7 @@ class SystemConstant(Base):
     LAST_GARMIN = 'last-garmin'
     DB_VERSION = 'db-version'
     LOG_COLOR = 'log-color'
+    ITEM_SECONDS = 'item-seconds'  # prefix, followed by pipeline class
 
 
 class Process(Base):
@@ -75,17 +76,23 @@ class Process(Base):
         from ...pipeline.process import fmt_cmd
         popen = ps.Popen(args=cmd, shell=True)
         log.debug(f'Adding command [{fmt_cmd(cmd)}]; pid {popen.pid}')
-        s.query(Process).filter(Process.pid == popen.pid).delete(synchronize_session=False)
-        s.add(Process(command=cmd, owner=owner, pid=popen.pid, log=log_name,
+        cls.record(s, owner, popen.pid, cmd, log_name, constraint=constraint)
+        return popen
+
+    @classmethod
+    def record(cls, s, owner, pid, cmd, log_name, constraint=None, start=None):
+        # start must match the process creation time for a long-lived process (see exists())
+        s.query(Process).filter(Process.pid == pid).delete(synchronize_session=False)
+        s.add(Process(command=cmd, owner=owner, pid=pid, log=log_name, start=start or now(),
                       constraint=str_or_none(constraint)))
         s.commit()
-        return popen
 
     @classmethod
-    def delete(cls, s, owner, pid, delta_seconds=3):
+    def delete(cls, s, owner, pid, delta_seconds=3, kill=True):
         # ignore constraint here because we have pid
         process = s.query(Process).filter(Process.owner == owner, Process.pid == pid).one()
-        process.__kill(delta_seconds=delta_seconds)
+        if kill:
+            process.__kill(delta_seconds=delta_seconds)
         log.debug(f'Deleting record for process {process.pid}')
         s.delete(process)
         s.commit()
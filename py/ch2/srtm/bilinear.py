@@ -41,3 +41,14 @@ class BilinearElevation(ElevationSupport):
             return h0 * (1-k) + h1 * k
         else:
             return None
+
+    def _interpolate(self, flat, flon, h, lats, lons):
+        # as elevation(), for arrays of points in a single tile
+        x = (lons - flon) * (SAMPLES - 1)
+        y = (lats - flat) * (SAMPLES - 1)
+        i, j = x.astype(int), y.astype(int)
+        k = y - j
+        h0 = h[j, i] * (1-k) + h[j+1, i] * k
+        h1 = h[j, i+1] * (1-k) + h[j+1, i+1] * k
+        k = x - i
+        return h0 * (1-k) + h1 * k
@@ -1,10 +1,12 @@
-
-from functools import lru_cache
+from collections import OrderedDict
+from functools import wraps
 from genericpath import exists
 from logging import getLogger
 
+from glob import glob
 from math import floor
-from os.path import join
+from os import makedirs, replace
+from os.path import join, basename, dirname, getmtime
 from zipfile import ZipFile
 
 import numpy as np
@@ -21,37 +23,148 @@ SAMPLES = 3601
 # from view-source:http://dwtkns.com/srtm30m/
 BASE_URL = 'http://e4ftl01.cr.usgs.gov/MEASURES/SRTMGL1.003/2000.02.11/'
 EXTN = '.SRTMGL1.hgt.zip'
+# each tile is SAMPLES * SAMPLES * 2 bytes (26MB), so this is about 20 tiles
+MAX_TILE_BYTES = 512 * 2**20
+# pre-converted tiles (and splines) are in this sub-directory
+CACHE = 'cache'
+NPY = '.npy'
 
 
 # lots of credit to https://github.com/aatishnn/srtm-python/blob/master/srtm.py
 # (although that has bugs...)
 
 
-@lru_cache(4)  # 4 means our tests are quick (and should tile a local patch)
-def cached_file_reader(dir, flat, flon):
+def bytes_lru_cache(max_bytes, nbytes=lambda value: value.nbytes):
+    '''
+    Like lru_cache, but bounded by the total size (in bytes) of the cached values rather than by the
+    number of entries (tiles are large and an activity that crosses tile boundaries needs several).
+    The most recent value is always kept, even if it is larger than max_bytes.
+    '''
+
+    def decorator(func):
+
+        cache, total = OrderedDict(), 0
+
+        @wraps(func)
+        def wrapper(*args):
+            nonlocal total
+            if args in cache:
+                cache.move_to_end(args)
+                return cache[args][0]
+            value = func(*args)
+            size = nbytes(value)
+            cache[args] = (value, size)
+            total += size
+            while total > max_bytes and len(cache) > 1:
+                _, (_, size) = cache.popitem(last=False)
+                total -= size
+            return value
+
+        def cache_clear():
+            nonlocal total
+            cache.clear()
+            total = 0
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
+
+
+def tile_root(flat, flon):
     # https://wiki.openstreetmap.org/wiki/SRTM
     # The official 3-arc-second and 1-arc-second data for versions 2.1 and 3.0 are divided into 1°×1° data tiles.
     # The tiles are distributed as zip files containing HGT files labeled with the coordinate of the southwest cell.
     # For example, the file N20E100.hgt contains data from 20°N to 21°N and from 100°E to 101°E inclusive.
-    root = '%s%02d%s%03d' % ('S' if flat < 0 else 'N', abs(flat), 'W' if flon < 0 else 'E', abs(flon))
+    return '%s%02d%s%03d' % ('S' if flat < 0 else 'N', abs(flat), 'W' if flon < 0 else 'E', abs(flon))
+
+
+def parse_root(root):
+    # inverse of tile_root
+    flat, flon = int(root[1:3]), int(root[4:7])
+    return -flat if root[0] == 'S' else flat, -flon if root[3] == 'W' else flon
+
+
+def cache_path(dir, root, extn=NPY):
+    return join(dir, CACHE, root + extn)
+
+
+def save_array(path, array):
+    # np.save pads the header so that the data are aligned (and can be memory-mapped)
+    makedirs(dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as output:
+        np.save(output, array, allow_pickle=False)
+    replace(tmp_path, path)  # atomic, so concurrent readers never see a partial file
+
+
+def downloaded_tiles(dir):
+    # (flat, flon) for the tiles (hgt or zip) in the directory
+    roots = set(basename(path)[:7] for path in glob(join(dir, '*.hgt')) + glob(join(dir, '*' + EXTN)))
+    return sorted(parse_root(root) for root in roots)
+
+
+def tile_path(dir, flat, flon):
+    # the downloaded tile (hgt or zip), or None
+    root = tile_root(flat, flon)
+    for path in (join(dir, root + '.hgt'), join(dir, root + EXTN)):
+        if exists(path):
+            return path
+    return None
+
+
+def is_fresh(path, dir, flat, flon):
+    # cached data are used only if newer than the tile they were made from (if that still exists)
+    if not exists(path):
+        return False
+    source = tile_path(dir, flat, flon)
+    return source is None or getmtime(path) >= getmtime(source)
+
+
+def read_file(dir, flat, flon):
+    # unzipped tiles are memory-mapped (so only the pages used are read); zipped tiles are read into memory
+    root = tile_root(flat, flon)
     hgt_file = root + '.hgt'
-    hgt_path = join(dir, hgt_file)
-    zip_path = join(dir, root + EXTN)
-    if exists(hgt_path):
-        log.debug(f'Reading {hgt_path}')
-        with open(hgt_path, 'rb') as input:
-            data = input.read()
-    elif exists(zip_path):
-        log.debug(f'Reading {zip_path}')
-        with open(zip_path, 'rb') as input:
+    path = tile_path(dir, flat, flon)
+    if path and path.endswith('.hgt'):
+        log.debug(f'Mapping {path}')
+        data = np.memmap(path, np.dtype('>i2'), mode='r', shape=(SAMPLES * SAMPLES,))
+    elif path:
+        log.debug(f'Reading {path}')
+        with open(path, 'rb') as input:
             zip = ZipFile(input)
             log.debug(f'Found {zip.filelist}')
-            data = zip.open(hgt_file).read()
+            data = np.frombuffer(zip.open(hgt_file).read(), np.dtype('>i2'), SAMPLES * SAMPLES)
     else:
         # i tried automating download, but couldn't get ouath2 to work
         log.warning(f'Download {BASE_URL + root + EXTN}')
         raise Exception(f'Missing {hgt_file}')
-    return np.flip(np.frombuffer(data, np.dtype('>i2'), SAMPLES * SAMPLES).reshape((SAMPLES, SAMPLES)), 0)
+    return np.flip(data.reshape((SAMPLES, SAMPLES)), 0)
+
+
+def write_file_cache(dir, flat, flon, force=False):
+    '''
+    Save a tile in the cache (see cached_file_reader), returning true if it was written.  An existing
+    file is replaced if older than the tile.
+    '''
+    path = cache_path(dir, tile_root(flat, flon))
+    if force or not is_fresh(path, dir, flat, flon):
+        log.info(f'Writing {path}')
+        save_array(path, np.ascontiguousarray(read_file(dir, flat, flon), dtype=np.int16))
+        return True
+    return False
+
+
+@bytes_lru_cache(MAX_TILE_BYTES)
+def cached_file_reader(dir, flat, flon):
+    # tiles converted by write_file_cache (ch2 srtm-cache) are native-endian and already flipped,
+    # so can be memory-mapped directly (and the pages shared between worker processes)
+    path = cache_path(dir, tile_root(flat, flon))
+    if is_fresh(path, dir, flat, flon):
+        log.debug(f'Mapping {path}')
+        return np.load(path, mmap_mode='r')
+    else:
+        return read_file(dir, flat, flon)
 
 
 class ElevationSupport:
@@ -65,13 +178,46 @@ class ElevationSupport:
         # construct the path in the reader so it's skipped if we hit the cache
         return flat, flon, self._reader(self._dir, flat, flon)
 
-
-def elevation_from_constant(s, interp, dir_name=SRTM1_DIR_CNAME):
+    def _tiles(self, lats, lons):
+        '''
+        Group points by tile, yielding (flat, flon, tile, indices) for each tile used, so that
+        each tile is read once and the interpolation can be vectorized.
+        '''
+        flats, flons = np.floor(lats).astype(int), np.floor(lons).astype(int)
+        tiles, inverse = np.unique(np.stack([flats, flons], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        for n, (flat, flon) in enumerate(tiles):
+            flat, flon = int(flat), int(flon)
+            yield flat, flon, self._reader(self._dir, flat, flon), np.flatnonzero(inverse == n)
+
+    def elevations(self, lats, lons):
+        '''
+        Elevations for arrays of points (NaN where lat or lon are NaN, or everywhere if there is no
+        SRTM directory).
+        '''
+        lats, lons = np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)
+        elevations = np.full(lats.shape, np.nan)
+        if self._dir:
+            located = np.flatnonzero(~np.isnan(lats) & ~np.isnan(lons))
+            for flat, flon, tile, indices in self._tiles(lats[located], lons[located]):
+                indices = located[indices]
+                elevations[indices] = self._interpolate(flat, flon, tile, lats[indices], lons[indices])
+        return elevations
+
+    def _interpolate(self, flat, flon, tile, lats, lons):
+        raise NotImplementedError('_interpolate')
+
+
+def dir_from_constant(s, dir_name=SRTM1_DIR_CNAME):
     try:
         dir = clean_path(Constant.from_name(s, dir_name).at(s).value)
         if not exists(dir): raise Exception(f'SRTM1 directory {dir} missing')
+        return dir
     except:
         log_current_exception(traceback=False)
         log.warning(f'SRTM1 config - define {dir_name} in constants for elevation data')
-        dir = None
-    return interp(dir)
+        return None
+
+
+def elevation_from_constant(s, interp, dir_name=SRTM1_DIR_CNAME):
+    return interp(dir_from_constant(s, dir_name=dir_name))
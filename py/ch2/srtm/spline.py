@@ -1,10 +1,16 @@
-
-from functools import lru_cache
+from logging import getLogger
 
 import numpy as np
-from scipy.interpolate import RectBivariateSpline
+from scipy.interpolate import RectBivariateSpline, BSpline
+
+from .file import SRTM1_DIR_CNAME, SAMPLES, ElevationSupport, elevation_from_constant, cached_file_reader, \
+    bytes_lru_cache, MAX_TILE_BYTES, tile_root, cache_path, save_array, NPY, is_fresh
 
-from .file import SRTM1_DIR_CNAME, SAMPLES, ElevationSupport, elevation_from_constant, cached_file_reader
+log = getLogger(__name__)
+
+DEGREE = 3
+# points evaluated together by CachedSpline (each needs a row of coefficients)
+CHUNK = 1000
 
 
 def spline_elevation_from_constant(s, dir_name=SRTM1_DIR_CNAME, smooth=0):
@@ -19,19 +25,76 @@ class SplineElevation(ElevationSupport):
     def elevation(self, lat, lon):
         if self._dir:
             _, _, spline = self._lookup(lat, lon)
-            return spline([lat], [lon])[0][0]  # it's a grid for all x and y, hence 2d
+            return spline.ev([lat], [lon])[0]
         else:
             return None
 
+    def _interpolate(self, flat, flon, spline, lats, lons):
+        return spline.ev(lats, lons)
+
+
+class CachedSpline:
+    '''
+    The spline from RectBivariateSpline, rebuilt from the knots and coefficients saved by
+    write_spline_cache (scipy has no public constructor for that) and evaluated via
+    BSpline.design_matrix.
+    '''
+
+    def __init__(self, tx, ty, c, k=DEGREE):
+        self.tck = (tx, ty, c)
+        self.__k = k
+        self.__c = c.reshape((len(tx) - k - 1, len(ty) - k - 1))
+
+    def ev(self, xi, yi):
+        tx, ty, _ = self.tck
+        xi, yi = np.asarray(xi, dtype=float).ravel(), np.asarray(yi, dtype=float).ravel()
+        z = np.empty(len(xi))
+        for lo in range(0, len(xi), CHUNK):
+            hi = lo + CHUNK
+            bx = BSpline.design_matrix(xi[lo:hi], tx, self.__k)
+            by = BSpline.design_matrix(yi[lo:hi], ty, self.__k)
+            z[lo:hi] = np.asarray(by.multiply(bx @ self.__c).sum(axis=1)).ravel()
+        return z
+
 
 def make_cached_spline_builder(smooth):
 
-    @lru_cache(4)  # 4 means our tests are quick (and should tile a local patch)
+    @bytes_lru_cache(MAX_TILE_BYTES, nbytes=lambda spline: sum(array.nbytes for array in spline.tck))
     def cached_spline_builder(dir, flat, flon):
-        h = cached_file_reader(dir, flat, flon)
-        x, y = np.linspace(flat, flat+1, SAMPLES), np.linspace(flon, flon+1, SAMPLES)
-        # not 100% sure on the scaling of s but it seems to be related to sum of errors at all points
-        # however, a scaling of SAMPLES * SAMPLES means that smooth=1 gives a numerical error, so add 10
-        return RectBivariateSpline(x, y, h, s=smooth * SAMPLES * SAMPLES * 10)
+        # splines converted by write_spline_cache (ch2 srtm-cache) are memory-mapped
+        paths = spline_cache_paths(dir, flat, flon, smooth)
+        if all(is_fresh(path, dir, flat, flon) for path in paths):
+            log.debug(f'Mapping {paths[-1]}')
+            return CachedSpline(*(np.load(path, mmap_mode='r') for path in paths))
+        else:
+            return build_spline(dir, flat, flon, smooth)
 
     return cached_spline_builder
+
+
+def build_spline(dir, flat, flon, smooth):
+    h = cached_file_reader(dir, flat, flon)
+    x, y = np.linspace(flat, flat+1, SAMPLES), np.linspace(flon, flon+1, SAMPLES)
+    # not 100% sure on the scaling of s but it seems to be related to sum of errors at all points
+    # however, a scaling of SAMPLES * SAMPLES means that smooth=1 gives a numerical error, so add 10
+    return RectBivariateSpline(x, y, h, s=smooth * SAMPLES * SAMPLES * 10, kx=DEGREE, ky=DEGREE)
+
+
+def spline_cache_paths(dir, flat, flon, smooth):
+    # knots (x and y) and coefficients
+    root = tile_root(flat, flon)
+    return [cache_path(dir, root, f'.spline-{smooth:g}.{name}{NPY}') for name in ('tx', 'ty', 'c')]
+
+
+def write_spline_cache(dir, flat, flon, smooth, force=False):
+    '''
+    Save the spline for a tile in the cache, returning true if it was written.  Existing files are
+    replaced if older than the tile.
+    '''
+    paths = spline_cache_paths(dir, flat, flon, smooth)
+    if force or not all(is_fresh(path, dir, flat, flon) for path in paths):
+        log.info(f'Writing {paths[-1]}')
+        for path, array in zip(paths, build_spline(dir, flat, flon, smooth).tck):
+            save_array(path, array)
+        return True
+    return False
@@ -3,7 +3,7 @@ import setuptools
 
 setuptools.setup(name='choochoo',
                  packages=setuptools.find_packages(),
-                 version='0.38.2',
+                 version='0.39.0',
                  author='andrew cooke',
                  author_email='andrew@acooke.org',
                  description='Data Science for Training',
@@ -39,7 +39,7 @@ Source and screenshots on [github](https://github.com/andrewcooke/choochoo).
                      'pyproj',
                      'rasterio',
                      'requests',
-                     'scipy',
+                     'scipy>=1.8',  # BSpline.design_matrix
                      'shapely',
                      'sklearn',
                      'sqlalchemy-utils',
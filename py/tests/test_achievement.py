@@ -0,0 +1,57 @@
+import datetime as dt
+from random import Random
+
+from ch2.pipeline.calculate.achievement import Leaderboard
+from tests import LogTestCase
+
+START = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+
+
+class TestLeaderboard(LogTestCase):
+
+    @staticmethod
+    def brute_force(rows, less_is_better, k, start, finish):
+        values = [value for time, value in rows if start <= time < finish]
+        return sorted(values, reverse=not less_is_better)[:k]
+
+    def assert_best(self, rows, less_is_better, k, start, finish):
+        self.assertEqual(Leaderboard(rows, less_is_better, k).best(start, finish),
+                         self.brute_force(rows, less_is_better, k, start, finish),
+                         msg=f'less_is_better {less_is_better}; k {k}; {start} - {finish}')
+
+    def test_prefix(self):
+        rows = [(START + dt.timedelta(days=i), value) for i, value in enumerate([3, 1, 4, 1, 5, 9, 2, 6])]
+        for less_is_better in (True, False):
+            leaderboard = Leaderboard(rows, less_is_better, 3)
+            # all previous time (lo == 0), up to and excluding each row
+            self.assertEqual(leaderboard.best(START, START), [])
+            self.assertEqual(leaderboard.best(START - dt.timedelta(days=1), rows[4][0]),
+                             [1, 1, 3] if less_is_better else [4, 3, 1])
+            self.assertEqual(leaderboard.best(START, START + dt.timedelta(days=100)),
+                             [1, 1, 2] if less_is_better else [9, 6, 5])
+
+    def test_windows(self):
+        rows = [(START + dt.timedelta(days=i), value) for i, value in enumerate([3, 1, 4, 1, 5, 9, 2, 6])]
+        self.assertEqual(Leaderboard(rows, False, 2).best(rows[2][0], rows[5][0]), [5, 4])
+        self.assertEqual(Leaderboard(rows, True, 2).best(rows[2][0], rows[5][0]), [1, 4])
+        self.assertEqual(Leaderboard(rows, True, 2).best(rows[7][0] + dt.timedelta(days=1),
+                                                         rows[7][0] + dt.timedelta(days=2)), [])
+
+    def test_ties(self):
+        rows = [(START + dt.timedelta(days=i), value) for i, value in enumerate([2, 2, 1, 2, 1])]
+        self.assertEqual(Leaderboard(rows, True, 3).best(START, rows[-1][0]), [1, 2, 2])
+        self.assertEqual(Leaderboard(rows, False, 3).best(rows[1][0], rows[-1][0]), [2, 2, 1])
+
+    def test_random(self):
+        random = Random(42)
+        for _ in range(50):
+            n = random.randint(0, 30)
+            days = sorted(random.sample(range(100), n))
+            rows = [(START + dt.timedelta(days=day), random.randint(0, 10)) for day in days]
+            for less_is_better in (True, False):
+                for k in (1, 3, 10):
+                    for _ in range(10):
+                        start, finish = sorted(START + dt.timedelta(days=random.randint(-5, 105)) for _ in range(2))
+                        self.assert_best(rows, less_is_better, k, start, finish)
+                    # prefix lookups
+                    self.assert_best(rows, less_is_better, k, START, START + dt.timedelta(days=random.randint(0, 105)))
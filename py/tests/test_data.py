@@ -37,3 +37,54 @@ class TestData(LogTestCase):
         from ch2.pipeline.calculate.power import PowerModel, BikeModel
         self.assertEqual(BikeModel.__module__, 'ch2.pipeline.calculate.power')
         self.assertEqual(PowerModel.__module__, 'ch2.pipeline.calculate.power')
+
+    def test_continue_response(self):
+        import numpy as np
+        import pandas as pd
+        from math import log10
+        from ch2.data.response import sum_to_hour, calc_response, continue_response
+        rng = np.random.default_rng(42)
+        times = pd.to_datetime(np.sort(rng.uniform(1.6e9, 1.6e9 + 86400 * 30, 200)), unit='s', utc=True)
+        data = pd.DataFrame({'impulse': rng.uniform(0, 5, 200)}, index=times)
+        params = (log10(42 * 24), log10(10))
+        full = calc_response(sum_to_hour(data, 'impulse'), params)
+        start = full.index[300]
+        part = continue_response(sum_to_hour(data.loc[data.index >= start], 'impulse', start=start),
+                                 params, full.loc[start])
+        self.assertEqual(part.index[0], start)
+        self.assertEqual(part.index[-1], full.index[-1])
+        self.assertTrue(np.allclose(part, full.loc[start:], rtol=1e-12))
+
+    def test_continue_without_impulses(self):
+        import datetime as dt
+        import numpy as np
+        import pandas as pd
+        from math import log10
+        from ch2.data.lib import decay_params
+        from ch2.data.response import sum_to_hour, continue_response
+        from ch2.names import N
+        from ch2.pipeline.calculate.response import scale_impulses, SCALED
+        start = pd.Timestamp('2020-01-01 10:00', tz='UTC')
+        finish = start + dt.timedelta(hours=5, minutes=30)
+        # no impulses (or coverage) since the last response, as read from the database
+        data = scale_impulses(pd.DataFrame(), finish)
+        self.assertEqual(list(data.index), [finish])
+        params = (log10(42 * 24),)
+        response = continue_response(sum_to_hour(data, SCALED, start=start), params, 10.0)
+        self.assertEqual(response.index[0], start)
+        self.assertEqual(response.index[-1], start + dt.timedelta(hours=6))
+        decay, _ = decay_params(10 ** params[0])
+        self.assertTrue(np.allclose(response, 10.0 * decay ** np.arange(7), rtol=1e-12))
+
+    def test_scale_impulses_coverage(self):
+        import datetime as dt
+        import pandas as pd
+        from ch2.names import N
+        from ch2.pipeline.calculate.response import scale_impulses, SCALED
+        start = pd.Timestamp('2020-01-01 10:00', tz='UTC')
+        index = pd.DatetimeIndex([start + dt.timedelta(minutes=m) for m in (1, 2, 3)], name=N.INDEX)
+        data = pd.DataFrame({N.HR_IMPULSE_10: [1.0, 1.0, 1.0], N._src(N.HR_IMPULSE_10): [7, 7, 8],
+                             N.COVERAGE: [None, None, 100.0]}, index=index)
+        # the first impulses take coverage from before start
+        data = scale_impulses(data, start + dt.timedelta(hours=1), coverage=50)
+        self.assertEqual(list(data[SCALED]), [2.0, 2.0, 1.0, 0.0])
@@ -1,12 +1,19 @@
 from glob import glob
 from logging import getLogger
+from math import isnan
 from os.path import basename, join, exists
+from pickle import dumps, loads
+from tempfile import TemporaryDirectory
 
 from ch2.commands.args import FIELDS, TABLES, GREP
-from ch2.fit.format.read import filtered_records
-from ch2.fit.format.records import no_names, append_units, no_bad_values, fix_degrees, chain
+from ch2.common.io import data_hash
+from ch2.fit.format.index import index_path, build_index, save_index
+from ch2.fit.format.read import filtered_records, filtered_columns, parse_data
+from ch2.fit.format.tokens import Checksum
+from ch2.fit.format.records import no_names, append_units, no_bad_values, fix_degrees, chain, merge_duplicates
 from ch2.fit.profile.fields import DynamicField
-from ch2.fit.profile.profile import read_external_profile, read_fit
+from ch2.fit.profile.messages import PickledMessages
+from ch2.fit.profile.profile import read_external_profile, read_fit, read_profile
 from ch2.fit.summary import summarize, summarize_csv, summarize_tables
 from ch2.lib.tests import OutputMixin, HEX_ADDRESS, EXC_HDR_CHK, sub_extn, EXC_FLD, sub_dir, RNM_UNKNOWN, ROUND_DISTANCE
 from tests import LogTestCase
@@ -38,6 +45,22 @@ class TestFit(LogTestCase, OutputMixin):
         fields = ','.join(sorted(field.references))
         self.assertEqual(fields, 'duration_type,target_type')
 
+    def test_pickled_messages(self):
+        nlog, types, messages = read_external_profile(self.profile_path)
+        nlog, types, pickled = loads(dumps((nlog, types, PickledMessages(nlog, messages, types))))
+        session = pickled.profile_to_message('session')
+        self.assertIs(session, pickled.number_to_message(session.number))
+        self.assertIs(session.profile_to_field('sport').type, types.profile_to_type('sport'))
+        self.assertEqual(pickled.number_to_message(9999).name, 'MESSAGE 9999')
+
+    def test_crc(self):
+        # standard check value for CRC-16/ARC
+        self.assertEqual(Checksum.crc(b'123456789'), 0xbb3d)
+        # odd length, list (used in header repair) and memoryview all agree
+        data = read_fit(join(self.test_dir, 'source/personal/2018-07-26-rec.fit'))[:-3]
+        self.assertEqual(Checksum.crc(data), Checksum.crc(list(data)))
+        self.assertEqual(Checksum.crc(data), Checksum.crc(memoryview(data)[0:]))
+
     def test_decode(self):
         types, messages, records = \
             filtered_records(read_fit(join(self.test_dir, 'source/personal/2018-07-26-rec.fit')),
@@ -48,6 +71,49 @@ class TestFit(LogTestCase, OutputMixin):
                 print(record.into(tuple, filter=chain(no_names, append_units, no_bad_values, fix_degrees)),
                       file=output)
 
+    def test_columns(self):
+        data = read_fit(join(self.test_dir, 'source/personal/2018-07-26-rec.fit'))
+        types, messages, columns = filtered_columns(data, profile_path=self.profile_path)
+        types, messages, records = filtered_records(data, profile_path=self.profile_path,
+                                                    pipeline=[merge_duplicates, fix_degrees, no_bad_values])
+        records = [record for _, _, record in records if record.name == 'record']
+        record_columns = columns['record']
+        self.assertEqual(len(record_columns['timestamp']), len(records))
+        self.assertEqual(record_columns.units['position_lat'], '°')
+        for i, record in enumerate(records):
+            self.assertEqual(record_columns['timestamp'][i], record.timestamp)
+            for name in ('position_lat', 'position_long', 'distance', 'enhanced_altitude'):
+                if name in record.data:
+                    self.assertAlmostEqual(record_columns[name][i], record.data[name][0][0])
+                else:
+                    self.assertTrue(isnan(record_columns[name][i]))
+
+    def test_index(self):
+
+        def summary(records):
+            return [(offset, record.name, record.timestamp, record.data) for _, offset, record in records]
+
+        data = read_fit(join(self.test_dir, 'source/personal/2018-07-26-rec.fit'))
+        types, messages, records = filtered_records(data, profile_path=self.profile_path)
+        records = summary(records)
+        after_time = records[len(records) // 2][2]
+        with TemporaryDirectory() as f:
+            # small checkpoint interval so that we really do seek in this small file
+            types, messages = read_profile(profile_path=self.profile_path)
+            state, tokens = parse_data(data, types, messages)
+            save_index(build_index(data, tokens, state, every=8), f)
+            types, messages, seek = filtered_records(data, profile_path=self.profile_path,
+                                                     after_time=after_time, index_dir=f)
+            seek = summary(seek)
+            self.assertEqual(seek, [record for record in records
+                                    if record[2] is not None and record[2] >= after_time])
+            types, messages, seek = filtered_records(data, profile_path=self.profile_path,
+                                                     record_names=['session'], index_dir=f)
+            self.assertEqual(summary(seek), [record for record in records if record[1] == 'session'])
+        with TemporaryDirectory() as f:
+            filtered_records(data, profile_path=self.profile_path, after_time=after_time, index_dir=f)
+            self.assertTrue(exists(index_path(f, data_hash(data))))
+
     def test_dump(self):
         with self.assertTextMatch(join(self.test_dir, 'target/personal/TestFit.test_dump')) as output:
             summarize(FIELDS, read_fit(join(self.test_dir, 'source/personal/2018-07-30-rec.fit')),
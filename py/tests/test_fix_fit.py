@@ -2,8 +2,9 @@ from os.path import join
 
 from ch2.commands.args import RECORDS
 from ch2.fit.fix import fix
+from ch2.fit.format.read import parse_data
 from ch2.fit.format.tokens import FileHeader
-from ch2.fit.profile.profile import read_fit
+from ch2.fit.profile.profile import read_fit, read_profile
 from ch2.fit.summary import summarize
 from ch2.lib.tests import OutputMixin
 from tests import LogTestCase
@@ -40,6 +41,16 @@ class TestFixFit(LogTestCase, OutputMixin):
         with self.assertTextMatch('data/test/target/other/TestFixFit.test_drop') as output:
             summarize(RECORDS, fixed, output=output)
 
+    def test_drop_junk(self):
+        good = read_fit(join(self.test_dir, 'source/personal/2018-08-27-rec.fit'))
+        types, messages = read_profile()
+        state, tokens = parse_data(good, types, messages)
+        offsets = [offset for offset, _ in tokens]
+        offset = offsets[len(offsets) // 2]
+        bad = good[:offset] + bytearray(b'\xff' * 37) + good[offset:]
+        fixed = fix(bad, drop=True, fix_checksum=True, fix_header=True)  # validates
+        self.assertTrue(len(good) - 100 < len(fixed) < len(bad))
+
     def test_slices(self):
         bad = read_fit(join(self.test_dir, 'source/other/8CS90646.FIT'))
         with self.assertRaisesRegex(Exception, 'Error fixing checksum'):
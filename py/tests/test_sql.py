@@ -1,6 +1,10 @@
+import datetime as dt
+from enum import IntEnum
 from logging import getLogger
 
 from ch2.names import SPACE, simple_name
+from ch2.sql.batch import copy_escape
+from ch2.sql.tables.statistic import StatisticJournalType
 from tests import LogTestCase
 
 log = getLogger(__name__)
@@ -13,3 +17,24 @@ class TestName(LogTestCase):
         self.assertEqual(simple_name('****'), SPACE)
         self.assertEqual(simple_name('123'), '-123')
         self.assertEqual(simple_name('Fitness 7d'), 'fitness-7d')
+
+
+class TestCopyEscape(LogTestCase):
+
+    def test_int_enum(self):
+
+        class Colour(IntEnum):
+            RED = 1
+
+        # as str() before python 3.11, whatever version runs the test
+        Colour.__str__ = lambda self: f'Colour.{self.name}'
+        self.assertEqual(copy_escape(Colour.RED), '1')
+        self.assertEqual(copy_escape(StatisticJournalType.FLOAT), str(StatisticJournalType.FLOAT.value))
+
+    def test_values(self):
+        self.assertEqual(copy_escape(None), r'\N')
+        self.assertEqual(copy_escape(True), 't')
+        self.assertEqual(copy_escape(0), '0')
+        self.assertEqual(copy_escape(1.5), '1.5')
+        self.assertEqual(copy_escape('a\tb\\c'), 'a\\tb\\\\c')
+        self.assertEqual(copy_escape(dt.datetime(2020, 1, 1)), '2020-01-01T00:00:00')
@@ -1,14 +1,24 @@
 
 from contextlib import contextmanager
 from logging import getLogger
+from os import utime
+from os.path import join, exists, getmtime
+from tempfile import TemporaryDirectory
 
-from ch2 import constants
-from ch2.commands.args import V, DEV, FORCE, bootstrap_db
+import numpy as np
+
+from ch2 import constants, PROGNAME
+from ch2.commands.args import V, DEV, FORCE, bootstrap_db, make_parser, NamespaceWithVariables, DB_VERSION, \
+    SRTM_CACHE, DIR, SMOOTH
+from ch2.commands.srtm_cache import srtm_cache
 from ch2.common.args import mm, m
 from ch2.config.profiles.default import default
+from ch2.sql.config import Config
 from ch2.srtm.bilinear import bilinear_elevation_from_constant
-from ch2.srtm.file import SRTM1_DIR_CNAME
-from ch2.srtm.spline import spline_elevation_from_constant
+from ch2.srtm.file import SRTM1_DIR_CNAME, SAMPLES, tile_root, cache_path, read_file, write_file_cache, \
+    cached_file_reader
+from ch2.srtm.spline import spline_elevation_from_constant, write_spline_cache, make_cached_spline_builder, \
+    build_spline, spline_cache_paths, CachedSpline
 from tests import LogTestCase, random_test_user
 
 log = getLogger(__name__)
@@ -331,3 +341,80 @@ class TestSortem(LogTestCase):
                         x = lon + di * delta
                         self.assertAlmostEqual(oracle.elevation(y, x), 645, places=2,
                                                msg='dj %d; di %d' % (dj, di))
+
+    def test_batch(self):
+        # crosses the four tiles around (-34, -71)
+        lats = -34 + ARCSEC * np.arange(-50, 50, 7)
+        lons = -71 + ARCSEC * np.arange(-100, 100, 14)
+        for source in self.bilinear, self.spline:
+            with source() as oracle:
+                elevations = oracle.elevations(lats, lons)
+                for lat, lon, elevation in zip(lats, lons, elevations):
+                    self.assertAlmostEqual(elevation, oracle.elevation(lat, lon), places=6)
+
+
+class TestCache(LogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cached_file_reader.cache_clear()
+
+    @staticmethod
+    def write_tile(dir, seed=0, flat=-34, flon=-71):
+        path = join(dir, tile_root(flat, flon) + '.hgt')
+        np.random.default_rng(seed).integers(0, 1000, SAMPLES * SAMPLES).astype('>i2').tofile(path)
+        return path
+
+    @staticmethod
+    def points(n=100):
+        rng = np.random.default_rng(1)
+        return -34 + rng.random(n), -71 + rng.random(n)
+
+    def test_file_cache(self):
+        with TemporaryDirectory() as dir:
+            self.write_tile(dir)
+            self.assertTrue(write_file_cache(dir, -34, -71))
+            self.assertFalse(write_file_cache(dir, -34, -71))
+            tile = cached_file_reader(dir, -34, -71)
+            self.assertEqual(tile.filename, cache_path(dir, tile_root(-34, -71)))
+            np.testing.assert_array_equal(tile, read_file(dir, -34, -71))
+
+    def test_spline_cache(self):
+        with TemporaryDirectory() as dir:
+            self.write_tile(dir)
+            self.assertTrue(write_spline_cache(dir, -34, -71, 0))
+            self.assertFalse(write_spline_cache(dir, -34, -71, 0))
+            spline = make_cached_spline_builder(0)(dir, -34, -71)
+            self.assertIsInstance(spline, CachedSpline)
+            lats, lons = self.points()
+            np.testing.assert_allclose(spline.ev(lats, lons), build_spline(dir, -34, -71, 0).ev(lats, lons))
+
+    def test_stale(self):
+        with TemporaryDirectory() as dir:
+            path = self.write_tile(dir)
+            write_file_cache(dir, -34, -71)
+            write_spline_cache(dir, -34, -71, 0)
+            # a new download replaces the tile
+            self.write_tile(dir, seed=1)
+            mtime = getmtime(cache_path(dir, tile_root(-34, -71))) + 10
+            utime(path, (mtime, mtime))
+            cached_file_reader.cache_clear()
+            tile = cached_file_reader(dir, -34, -71)
+            self.assertFalse(hasattr(tile, 'filename') and tile.filename.endswith('.npy'))
+            np.testing.assert_array_equal(tile, read_file(dir, -34, -71))
+            self.assertNotIsInstance(make_cached_spline_builder(0)(dir, -34, -71), CachedSpline)
+            self.assertTrue(write_file_cache(dir, -34, -71))
+            self.assertTrue(write_spline_cache(dir, -34, -71, 0))
+            cached_file_reader.cache_clear()
+            np.testing.assert_array_equal(cached_file_reader(dir, -34, -71), read_file(dir, -34, -71))
+            lats, lons = self.points()
+            np.testing.assert_allclose(make_cached_spline_builder(0)(dir, -34, -71).ev(lats, lons),
+                                       build_spline(dir, -34, -71, 0).ev(lats, lons))
+
+    def test_command(self):
+        with TemporaryDirectory() as dir:
+            self.write_tile(dir)
+            ns = make_parser().parse_args(args=[SRTM_CACHE, mm(DIR), dir, mm(SMOOTH), '0'])
+            srtm_cache(Config(NamespaceWithVariables._from_ns(ns, PROGNAME, DB_VERSION)))
+            for path in [cache_path(dir, tile_root(-34, -71))] + spline_cache_paths(dir, -34, -71, 0):
+                self.assertTrue(exists(path), path)